@@ -1,78 +1,398 @@
 import os
-import pandas as pd
-from data_provider import DataProvider
-from signal_generator import SignalGenerator
-from paper_trader import PaperTrader
-from position_sizing import get_position_size_percent, calculate_kelly_fraction
-from position import get_dynamic_stop_loss_percent
-import aiohttp
+import sys
+import time
+import pickle
+import hashlib
 import asyncio
-import json
+from json_compat import dumps_pretty, loads as json_loads
 from datetime import datetime
-from typing import Tuple, List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
 from config import (
-	COMMISSION_RATE, MAX_POSITIONS, STOP_LOSS_PERCENT, TAKE_PROFIT_PERCENT,
-	PARTIAL_CLOSE_PERCENT, TRAILING_STOP_PERCENT, INITIAL_BALANCE,
-	DYNAMIC_SL_ATR_MULTIPLIER, USE_KELLY_CRITERION, ENABLE_AVERAGING,
-	MAX_AVERAGING_ATTEMPTS, AVERAGING_PRICE_DROP_PERCENT, AVERAGING_SIZE_PERCENT,
-	get_dynamic_max_positions
+	PARTIAL_CLOSE_PERCENT, INITIAL_BALANCE, USE_KELLY_CRITERION, ENABLE_AVERAGING
 )
 
-# --- Класс позиции для бэктеста (как в real_trader) ---
-class BacktestPosition:
-	"""Позиция для бэктеста"""
-	def __init__(self, entry_price: float, amount: float, invest_amount: float, atr: float):
-		self.entry_price = entry_price
-		self.amount = amount
-		self.invest_amount = invest_amount
-		self.atr = atr
-		self.averaging_count = 0
-		self.average_entry_price = entry_price
-		self.total_invested = invest_amount
-		self.averaging_entries = []
+# Тяжёлые зависимости (pandas, aiohttp, numba, индикаторы) импортируются
+# внутри функций: CLI-пути без бэктеста (например, нет tracked_symbols.json)
+# не платят за их загрузку
+if TYPE_CHECKING:
+	import numpy as np
+	import pandas as pd
+	import aiohttp
+
+# Дисковый кэш свечей для повторных бэктестов
+KLINES_CACHE_DIR = os.path.join("cache", "klines")
+
+# Кэш результатов симуляции: ключ — параметры запуска + хэш config
+RESULTS_CACHE_DIR = os.path.join("backtests", "cache")
+RESULTS_CACHE_TTL = 3600  # секунд (свечи в кэше тоже обновляются раз в час)
+RESULTS_CACHE_VERSION = 2  # увеличивать при изменении состава результата simulate_backtest
+
+# Максимум одновременных HTTP-соединений общей сессии бэктестов
+HTTP_CONNECTION_LIMIT = 32
+
+# L1: свечи в памяти процесса — повторные запуски с теми же параметрами
+# (например, base/stat в backtest_compare) не ходят ни в API, ни на диск
+_klines_memory_cache: Dict[tuple, "pd.DataFrame"] = {}
+# Замки на ключ кэша: одновременные запросы одних и тех же свечей
+# (например, prefetch и run_backtest) ждут одну загрузку, а не дублируют её
+_klines_fetch_locks: Dict[tuple, asyncio.Lock] = {}
+
+# Графики бэктестов: сколько точек серии рисовать (длинные серии прореживаются LTTB)
+PLOT_MAX_POINTS = 2000
+
+# Свечей в часе для интервалов Bybit (как в DataProvider.fetch_klines)
+INTERVAL_CANDLES_PER_HOUR = {
+	"1m": 60, "3m": 20, "5m": 12, "15m": 4, "30m": 2,
+	"1h": 1, "2h": 1 / 2, "4h": 1 / 4, "6h": 1 / 6, "12h": 1 / 12,
+	"1d": 1 / 24, "1w": 1 / 168
+}
+
+
+# --- Форматирование торговых действий ---
+def _format_trades(events: "np.ndarray", strengths: "np.ndarray") -> List[str]:
+	"""Форматирует события из simulate() в строки торговых действий"""
+	from backtest_core import (
+		EVENT_BUY, EVENT_STOP_LOSS, EVENT_PARTIAL_TP, EVENT_TRAILING_STOP, EVENT_SELL,
+		EVENT_AVERAGING, EV_CODE, EV_BAR, EV_PRICE, EV_AMOUNT, EV_COMMISSION,
+		EV_PROFIT_PCT, EV_LEVEL, EV_COUNT, EV_SIZE_PCT, EV_SL_PCT, EV_TP_PCT
+	)
+
+	trades = []
+	for ev in events:
+		code = int(ev[EV_CODE])
+		price = float(ev[EV_PRICE])
+		amount = ev[EV_AMOUNT]
+		commission = ev[EV_COMMISSION]
+		profit = ev[EV_PROFIT_PCT]
+		if code == EVENT_BUY:
+			trades.append(f"BUY {amount:.6f} @ {price} (сила: {strengths[int(ev[EV_BAR])]}, размер: {ev[EV_SIZE_PCT]*100:.0f}%, SL: {ev[EV_SL_PCT]*100:.1f}%, TP: {ev[EV_TP_PCT]*100:.1f}%, комиссия: ${commission:.4f})")
+		elif code == EVENT_STOP_LOSS:
+			trades.append(f"STOP-LOSS {amount:.6f} @ {price} (потеря: {profit:.2f}%, SL: ${ev[EV_LEVEL]:.2f}, комиссия: ${commission:.4f})")
+		elif code == EVENT_PARTIAL_TP:
+			trades.append(f"PARTIAL-TP {amount:.6f} @ {price} (прибыль: {profit:.2f}%, TP: ${ev[EV_LEVEL]:.2f}, закрыто: {PARTIAL_CLOSE_PERCENT*100:.0f}%, комиссия: ${commission:.4f})")
+		elif code == EVENT_TRAILING_STOP:
+			trades.append(f"TRAILING-STOP {amount:.6f} @ {price} (от макс: {ev[EV_LEVEL]:+.2f}%, комиссия: ${commission:.4f})")
+		elif code == EVENT_SELL:
+			trades.append(f"SELL {amount:.6f} @ {price} (прибыль: {profit:+.2f}%, комиссия: ${commission:.4f})")
+		elif code == EVENT_AVERAGING:
+			trades.append(f"  >> AVERAGING: докупание #{int(ev[EV_COUNT])}, цена: ${price:.2f}, средняя: ${ev[EV_LEVEL]:.2f}, монет: {amount:.6f}")
+		else:
+			close_type = "частичной" if ev[EV_COUNT] > 0 else "полной"
+			trades.append(f"Закрытие {close_type} позиции: SELL {amount:.6f} @ {price} (прибыль: {profit:+.2f}%, комиссия: ${commission:.4f})")
+	return trades
+
+
+# --- Бэктест стратегии ---
+def _klines_limit(interval: str, period_hours: int) -> int:
+	"""Количество свечей за период (интервал разбирается один раз на запуск)"""
+	candles_per_hour = INTERVAL_CANDLES_PER_HOUR.get(interval)
+	if candles_per_hour is None:
+		raise ValueError(f"Неизвестный интервал {interval!r}. Доступны: {', '.join(INTERVAL_CANDLES_PER_HOUR)}")
+	return max(1, int(period_hours * candles_per_hour))
+
+
+def lttb_indices(x: "np.ndarray", y: "np.ndarray", n_out: int) -> "np.ndarray":
+	"""
+	Индексы точек для прореживания серии методом Largest-Triangle-Three-Buckets:
+	первая и последняя точки сохраняются, из каждой промежуточной корзины
+	берётся точка, образующая наибольший треугольник с соседями.
+	"""
+	import numpy as np
+
+	n = len(x)
+	if n_out >= n or n_out < 3:
+		return np.arange(n)
 	
-	def can_average_down(self, current_price: float, balance: float) -> bool:
-		"""Проверяет возможность докупания"""
-		if self.averaging_count >= MAX_AVERAGING_ATTEMPTS:
-			return False
-		
-		# Проверяем падение цены от средней
-		price_drop = (self.average_entry_price - current_price) / self.average_entry_price
-		if price_drop < AVERAGING_PRICE_DROP_PERCENT:
-			return False
-		
-		# Проверяем баланс
-		averaging_invest = self.invest_amount * AVERAGING_SIZE_PERCENT
-		if averaging_invest < 1 or averaging_invest > balance:
-			return False
-		
-		return True
+	# n_out - 2 корзины между первой и последней точкой
+	edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+	indices = np.empty(n_out, dtype=np.int64)
+	indices[0] = 0
+	indices[-1] = n - 1
 	
-	def average_down(self, current_price: float, balance: float) -> Tuple[float, float]:
-		"""Выполняет докупание, возвращает (new_invest, commission)"""
-		averaging_invest = self.invest_amount * AVERAGING_SIZE_PERCENT
-		commission = averaging_invest * COMMISSION_RATE
-		averaging_amount = (averaging_invest - commission) / current_price
-		
-		# Обновляем позицию (ПРАВИЛЬНАЯ формула как в real_trader)
-		old_avg_price = self.average_entry_price
-		old_amount = self.amount
-		
-		self.total_invested += averaging_invest
-		self.amount += averaging_amount
-		self.averaging_count += 1
-		self.average_entry_price = (old_avg_price * old_amount + current_price * averaging_amount) / self.amount
-		
-		self.averaging_entries.append({
-			"price": current_price,
-			"amount": averaging_amount,
-			"invest": averaging_invest,
-			"new_avg_price": self.average_entry_price
-		})
+	a = 0
+	for b in range(n_out - 2):
+		start, end = edges[b], edges[b + 1]
+		# Третья вершина — среднее следующей корзины (для последней — последняя точка)
+		if b + 2 < len(edges):
+			next_start, next_end = edges[b + 1], edges[b + 2]
+		else:
+			next_start, next_end = n - 1, n
+		avg_x = x[next_start:next_end].mean()
+		avg_y = y[next_start:next_end].mean()
 		
-		return averaging_invest, commission
+		areas = np.abs(
+			(x[a] - avg_x) * (y[start:end] - y[a]) -
+			(x[a] - x[start:end]) * (avg_y - y[a])
+		)
+		a = start + int(np.argmax(areas))
+		indices[b + 1] = a
+	
+	return indices
+
+
+def config_hash() -> str:
+	"""SHA-256 настроек из config (все параметры в ВЕРХНЕМ регистре)"""
+	import config
+
+	settings = sorted((name, repr(value)) for name, value in vars(config).items() if name.isupper())
+	return hashlib.sha256(repr(settings).encode("utf-8")).hexdigest()
+
+
+def _results_cache_path(
+	symbol: str, interval: str, period_hours: int, start_balance: float,
+	use_statistical_models: bool, enable_kelly: bool, enable_averaging: bool
+) -> str:
+	"""
+	Путь к кэшу результата симуляции для набора параметров запуска.
+	В ключе — час свечей (как в fetch_backtest_data): с новым часом свечи
+	обновляются, и результат по прошлому часу не используется.
+	"""
+	hour = int(time.time() // 3600)
+	key = repr((
+		RESULTS_CACHE_VERSION, symbol, interval, period_hours, float(start_balance),
+		use_statistical_models, enable_kelly, enable_averaging, config_hash(), hour
+	))
+	return os.path.join(RESULTS_CACHE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pkl")
+
+
+def _load_cached_sim(path: str) -> Optional[Dict[str, Any]]:
+	"""Результат симуляции из кэша (None, если его нет или он устарел)"""
+	try:
+		if time.time() - os.path.getmtime(path) > RESULTS_CACHE_TTL:
+			return None
+		with open(path, "rb") as f:
+			return pickle.load(f)
+	except FileNotFoundError:
+		return None
+	except Exception as e:
+		print(f"Не удалось прочитать кэш результата {path}: {e}")
+		return None
+
+
+def _save_cached_sim(path: str, sim: Dict[str, Any]) -> None:
+	"""Сохраняет результат симуляции в кэш (ошибки записи не прерывают бэктест)"""
+	try:
+		os.makedirs(RESULTS_CACHE_DIR, exist_ok=True)
+		with open(path, "wb") as f:
+			pickle.dump(sim, f, protocol=pickle.HIGHEST_PROTOCOL)
+	except Exception as e:
+		print(f"Не удалось сохранить кэш результата {path}: {e}")
+	_prune_cached_sims()
+
+
+def _prune_cached_sims() -> None:
+	"""Удаляет результаты симуляции старше RESULTS_CACHE_TTL (подкаталоги вроде hybrid_signals не трогаются)"""
+	try:
+		entries = list(os.scandir(RESULTS_CACHE_DIR))
+	except OSError:
+		return
+	now = time.time()
+	for entry in entries:
+		if not entry.name.endswith(".pkl"):
+			continue
+		try:
+			if entry.is_file() and now - entry.stat().st_mtime > RESULTS_CACHE_TTL:
+				os.remove(entry.path)
+		except OSError:
+			# Файл мог удалить параллельный бэктест
+			continue
+
+
+def create_backtest_session() -> "aiohttp.ClientSession":
+	"""HTTP-сессия с пулом соединений — одна на все загрузки запуска"""
+	import aiohttp
+
+	return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=HTTP_CONNECTION_LIMIT))
+
+
+async def fetch_backtest_data(session: "aiohttp.ClientSession", symbol: str, interval: str, limit: int) -> Optional["pd.DataFrame"]:
+	"""Загружает свечи для бэктеста (I/O-часть, с кэшем в памяти и на диске)"""
+	from data_provider import DataProvider
+
+	# Час в ключе — как у дискового кэша DataProvider
+	hour = int(time.time() // 3600)
+	key = (symbol, interval, limit, hour)
+	df = _klines_memory_cache.get(key)
+	if df is not None:
+		return df
+
+	lock = _klines_fetch_locks.setdefault(key, asyncio.Lock())
+	try:
+		async with lock:
+			# Пока ждали замок, свечи мог загрузить другой запрос
+			df = _klines_memory_cache.get(key)
+			if df is None:
+				provider = DataProvider(session, cache_dir=KLINES_CACHE_DIR)
+				df = await provider.fetch_klines(symbol=symbol, interval=interval, limit=limit)
+				# Свечи прошлых часов больше не запрашиваются
+				for stale_key in [k for k in _klines_memory_cache if k[3] != hour]:
+					del _klines_memory_cache[stale_key]
+				_klines_memory_cache[key] = df
+	finally:
+		if not lock.locked():
+			_klines_fetch_locks.pop(key, None)
+	return df
+
+
+async def prefetch_backtest_data(session: "aiohttp.ClientSession", symbols: List[str], interval: str, period_hours: int) -> None:
+	"""
+	Параллельно загружает свечи нескольких символов в кэш fetch_backtest_data.
+	Ошибки не пробрасываются: run_backtest повторит запрос и сообщит о них сам.
+	"""
+	limit = _klines_limit(interval, period_hours)
+	await asyncio.gather(*[
+		fetch_backtest_data(session, symbol, interval, limit) for symbol in symbols
+	], return_exceptions=True)
+
+
+def simulate_backtest(
+	df: "pd.DataFrame",
+	start_balance: float,
+	use_statistical_models: bool,
+	params: "np.ndarray"
+) -> Dict[str, Any]:
+	"""
+	Считает сигналы и прогоняет симуляцию (CPU-часть).
+	Функция верхнего уровня без I/O — её можно запускать в ProcessPoolExecutor.
+	params — неизменяемые настройки из build_params() (собираются один раз на запуск).
+	"""
+	import numpy as np
+	from signal_generator import SignalGenerator
+	from backtest_core import (
+		simulate, compute_sizing_arrays, CNT_STOP_LOSS, CNT_PARTIAL_TP, CNT_TRAILING_STOP, CNT_AVERAGING, CNT_WINS, CNT_LOSSES
+	)
+
+	min_window = 14  # минимальное количество строк для индикаторов
+	
+	# Цены как NumPy-массив: в цикле нет срезов и индексации DataFrame.
+	# copy=True: pandas отдаёт read-only представления, а simulate
+	# скомпилирован под обычные (записываемые) массивы.
+	# Цены и деньги остаются float64: у float32 ~7 значащих цифр,
+	# этого мало для цен вида 104523.17 (SL/TP сравниваются точно)
+	arr_close = df["close"].to_numpy(dtype=np.float64, copy=True)
+	
+	# Сигналы для всех свечей считаем один раз (индикаторы по всей истории, O(N))
+	gen = SignalGenerator(df, use_statistical_models=use_statistical_models)
+	signals_df = gen.generate_signals_vectorized(start_index=min_window - 1)
+	signal_codes = signals_df["signal_code"].to_numpy(dtype=np.int8, copy=True)
+	atrs = signals_df["ATR"].to_numpy(dtype=np.float64, copy=True)
+	strengths = np.abs(signals_df["bullish_votes"].to_numpy() - signals_df["bearish_votes"].to_numpy())
+
+	# Размер позиции и SL/TP входа — векторно для всех свечей
+	base_sizes, sl_pcts, tp_pcts = compute_sizing_arrays(arr_close, atrs, strengths, params)
+
+	# --- Бэктест: расчёт баланса за период с учетом комиссии (JIT-цикл по свечам) ---
+	balance, total_commission, events, counters = simulate(
+		arr_close, atrs, signal_codes, base_sizes, sl_pcts, tp_pcts,
+		min_window - 1, float(start_balance), params
+	)
+
+	return {
+		"balance": balance,
+		"total_commission": total_commission,
+		"stop_loss_triggers": int(counters[CNT_STOP_LOSS]),
+		"partial_tp_triggers": int(counters[CNT_PARTIAL_TP]),
+		"trailing_stop_triggers": int(counters[CNT_TRAILING_STOP]),
+		"averaging_triggers": int(counters[CNT_AVERAGING]),
+		"win_trades": int(counters[CNT_WINS]),
+		"loss_trades": int(counters[CNT_LOSSES]),
+		# Числовые события (строки EV_*) и сила сигналов по свечам: строки сделок
+		# формируются только при выводе (report_backtest), а из пула процессов
+		# и в кэш результатов передаются компактные массивы
+		"events": events,
+		"strengths": strengths
+	}
+
+
+def _write_result(path: str, result: Dict[str, Any]) -> None:
+	"""Сохраняет результат бэктеста в JSON (блокирующая запись, вызывается в потоке)"""
+	with open(path, "wb") as f:
+		f.write(dumps_pretty(result))
+
+
+async def report_backtest(
+	symbol: str,
+	interval: str,
+	period_hours: int,
+	start_balance: float,
+	use_statistical_models: bool,
+	enable_averaging: bool,
+	sim: Dict[str, Any]
+) -> Dict[str, Any]:
+	"""Печатает и сохраняет результат симуляции (запись файла — вне event loop)"""
+	balance = sim["balance"]
+	total_commission = sim["total_commission"]
+	stop_loss_triggers = sim["stop_loss_triggers"]
+	partial_close_triggers = sim["partial_tp_triggers"]
+	trailing_stop_triggers = sim["trailing_stop_triggers"]
+	averaging_triggers = sim["averaging_triggers"]
+	trades = _format_trades(sim["events"], sim["strengths"])
+
+	# Финальный баланс = свободные деньги
+	total_balance = balance
+	
+	profit = total_balance - start_balance
+	profit_percent = (profit / start_balance) * 100
+	
+	models_label = "со СТАТИСТИЧЕСКИМИ МОДЕЛЯМИ" if use_statistical_models else "БАЗОВАЯ стратегия"
+	
+	# Отчёт собираем целиком и выводим одной записью в stdout
+	report = [f"\n=== {symbol} ({models_label}) ==="]
+	report.append(f"Бэктест за {period_hours} часов")
+	report.append(f"Начальный баланс: ${start_balance:.2f}")
+	report.append(f"Итоговый баланс: ${total_balance:.2f}")
+	report.append(f"Доходность: {profit:.2f} USD ({profit_percent:+.2f}%)")
+	report.append(f"Общая комиссия: ${total_commission:.4f}")
+	report.append(f"Количество сделок: {len(trades)}")
+	report.append(f"Stop-loss срабатываний: {stop_loss_triggers}")
+	report.append(f"Partial Take-profit: {partial_close_triggers}")
+	report.append(f"Trailing-stop: {trailing_stop_triggers}")
+	report.append(f"Докупаний: {averaging_triggers}")
+	if len(trades) > 0:
+		# Винрейт по закрытиям (SL / partial TP / trailing / SELL / финальное) — счётчики симуляции
+		win_trades = sim["win_trades"]
+		loss_trades = sim["loss_trades"]
+		if win_trades + loss_trades > 0:
+			win_rate = (win_trades / (win_trades + loss_trades)) * 100
+			report.append(f"Винрейт: {win_rate:.1f}% ({win_trades}W / {loss_trades}L)")
+	report.append("Торговые действия:")
+	report.extend(trades)
+	sys.stdout.write("\n".join(report) + "\n")
+
+	# --- Сохраняем результат ---
+	output_dir = "backtests"
+	os.makedirs(output_dir, exist_ok=True)
+	# Добавляем timestamp к имени файла
+	timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+	output_file = os.path.join(output_dir, f"backtest_{symbol}_{interval}_{timestamp}.json")
+
+	# Создаем объект с результатами бэктеста
+	backtest_result = {
+		"symbol": symbol,
+		"start_balance": start_balance,
+		"end_balance": total_balance,
+		"profit": profit,
+		"profit_percent": profit_percent,
+		"total_commission": total_commission,
+		"trades_count": len(trades),
+		"stop_loss_triggers": stop_loss_triggers,
+		"partial_tp_triggers": partial_close_triggers,
+		"trailing_stop_triggers": trailing_stop_triggers,
+		"averaging_triggers": averaging_triggers,
+		"win_rate": win_rate if 'win_rate' in locals() else 0,
+		"use_statistical_models": use_statistical_models,
+		"enable_averaging": enable_averaging,
+		"trades": trades
+	}
+
+	await asyncio.to_thread(_write_result, output_file, backtest_result)
+
+	print(f"Результаты сохранены в {output_file}")
+	
+	return backtest_result
+
 
-# --- Бэктест стратегии ---
 async def run_backtest(
 	symbol: str, 
 	interval: str = "15m", 
@@ -80,338 +400,149 @@ async def run_backtest(
 	start_balance: float = None,
 	use_statistical_models: bool = False,
 	enable_kelly: bool = None,
-	enable_averaging: bool = None
+	enable_averaging: bool = None,
+	session: Optional["aiohttp.ClientSession"] = None
 ):
+	"""
+	Бэктест одного символа.
+	session — общая HTTP-сессия (если не передана, создаётся на время загрузки).
+	"""
+	from backtest_core import build_params
+
 	if start_balance is None:
 		start_balance = INITIAL_BALANCE
 	if enable_kelly is None:
 		enable_kelly = USE_KELLY_CRITERION
 	if enable_averaging is None:
 		enable_averaging = ENABLE_AVERAGING
-	
-	candles_per_hour = int(60 / int(interval.replace('m',''))) if 'm' in interval else 1
-	limit = period_hours * candles_per_hour
 
-	async with aiohttp.ClientSession() as session:
-		provider = DataProvider(session)
-		df = await provider.fetch_klines(symbol=symbol, interval=interval, limit=limit)
+	limit = _klines_limit(interval, period_hours)
+	cache_path = _results_cache_path(
+		symbol, interval, period_hours, start_balance,
+		use_statistical_models, enable_kelly, enable_averaging
+	)
+	sim = await asyncio.to_thread(_load_cached_sim, cache_path)
+
+	if sim is None:
+		if session is not None:
+			df = await fetch_backtest_data(session, symbol, interval, limit)
+		else:
+			async with create_backtest_session() as own_session:
+				df = await fetch_backtest_data(own_session, symbol, interval, limit)
 
 		if df is None or df.empty:
 			print(f"Нет данных для бэктеста {symbol}.")
 			return None
 
-		# --- Бэктест: расчёт баланса за период с учетом комиссии ---
-		balance = start_balance
-		position_obj = None  # Объект позиции (BacktestPosition или None)
-		entry_price = None
-		entry_strength = 0
-		entry_atr = 0.0  # ATR при входе (для динамического SL/TP)
-		dynamic_sl_percent = STOP_LOSS_PERCENT  # Динамический SL
-		dynamic_tp_percent = TAKE_PROFIT_PERCENT  # Динамический TP
-		trades = []
-		total_commission = 0.0
-		stop_loss_triggers = 0
-		take_profit_triggers = 0
-		partial_close_triggers = 0
-		trailing_stop_triggers = 0
-		averaging_triggers = 0
-		partial_closed = False  # Флаг частичного закрытия
-		max_price = 0.0  # Максимальная цена для trailing stop
-		
-		# Kelly Criterion: создаём PaperTrader для расчёта Kelly
-		kelly_tracker = PaperTrader(initial_balance=start_balance) if enable_kelly else None
-		
-		min_window = 14  # минимальное количество строк для индикаторов
+		params = build_params(enable_kelly, enable_averaging)
+		sim = simulate_backtest(df, start_balance, use_statistical_models, params)
+		await asyncio.to_thread(_save_cached_sim, cache_path, sim)
+	return await report_backtest(symbol, interval, period_hours, start_balance, use_statistical_models, enable_averaging, sim)
+
 
-		# ИСПРАВЛЕНО: Проходим по каждой свече и проверяем позиции
-		for i in range(len(df)):
-			sub_df = df.iloc[:i+1]
-			if len(sub_df) < min_window:
+async def presimulate_backtests(
+	session: "aiohttp.ClientSession",
+	symbols: List[str],
+	interval: str,
+	period_hours: int,
+	start_balance: float,
+	model_flags: List[bool],
+	enable_kelly: bool = None,
+	enable_averaging: bool = None
+) -> None:
+	"""
+	Считает симуляции для всех пар (символ, use_statistical_models) в пуле
+	процессов и сохраняет их в кэш результатов: последующие run_backtest
+	с теми же параметрами только печатают отчёт.
+	Ошибки не пробрасываются: run_backtest повторит расчёт и сообщит о них сам.
+	"""
+	from backtest_core import build_params
+
+	if enable_kelly is None:
+		enable_kelly = USE_KELLY_CRITERION
+	if enable_averaging is None:
+		enable_averaging = ENABLE_AVERAGING
+	params = build_params(enable_kelly, enable_averaging)
+	limit = _klines_limit(interval, period_hours)
+
+	# Что ещё не посчитано (или устарело)
+	pending = []
+	for symbol in symbols:
+		for use_statistical_models in model_flags:
+			cache_path = _results_cache_path(
+				symbol, interval, period_hours, start_balance,
+				use_statistical_models, enable_kelly, enable_averaging
+			)
+			if await asyncio.to_thread(_load_cached_sim, cache_path) is None:
+				pending.append((symbol, use_statistical_models, cache_path))
+	if not pending:
+		return
+
+	dfs = await asyncio.gather(*[
+		fetch_backtest_data(session, symbol, interval, limit) for symbol, _, _ in pending
+	], return_exceptions=True)
+
+	# CPU: симуляции в отдельных процессах (обход GIL)
+	loop = asyncio.get_running_loop()
+	max_workers = max(1, min(len(pending), os.cpu_count() or 1))
+	with ProcessPoolExecutor(max_workers=max_workers) as pool:
+		jobs = []
+		for (symbol, use_statistical_models, cache_path), df in zip(pending, dfs):
+			if isinstance(df, BaseException) or df is None or df.empty:
 				continue
-			
-			# Генерируем сигнал для текущей свечи
-			gen = SignalGenerator(sub_df, use_statistical_models=use_statistical_models)
-			gen.compute_indicators()
-			signal_result = gen.generate_signal()
-			
-			price = signal_result["price"]
-			sig = signal_result["signal"]
-			
-			# Получаем силу сигнала напрямую из результата
-			bullish = signal_result.get("bullish_votes", 0)
-			bearish = signal_result.get("bearish_votes", 0)
-			signal_strength = abs(bullish - bearish)
-			atr = signal_result.get("ATR", 0.0)
-			
-			# Проверка стоп-лосса и тейк-профита
-			if position_obj and entry_price:
-				# ИСПРАВЛЕНО: используем среднюю цену входа для расчета изменения
-				avg_entry = position_obj.average_entry_price
-				
-				# КРИТИЧНО: Пересчитываем SL/TP на каждой свече (как в real_trader!)
-				current_sl_percent = get_dynamic_stop_loss_percent(position_obj.atr, avg_entry)
-				current_tp_percent = max(0.04, current_sl_percent * 2.0)
-				current_tp_percent = min(current_tp_percent, 0.12)
-				
-				stop_loss_price = avg_entry * (1 - current_sl_percent)
-				take_profit_price = avg_entry * (1 + current_tp_percent)
-				
-				# Если позиция частично закрыта - проверяем trailing stop
-				if partial_closed:
-					# Обновляем максимальную цену
-					if price > max_price:
-						max_price = price
-					
-					# Проверяем trailing stop от максимальной цены
-					trailing_drop = (max_price - price) / max_price
-					if trailing_drop >= TRAILING_STOP_PERCENT:
-						sell_value = position_obj.amount * price
-						commission = sell_value * COMMISSION_RATE
-						total_commission += commission
-						balance += sell_value - commission
-						profit_from_max = ((price - max_price) / max_price) * 100
-						profit = (price - avg_entry) / avg_entry * 100
-						trades.append(f"TRAILING-STOP {position_obj.amount:.6f} @ {price} (от макс: {profit_from_max:+.2f}%, комиссия: ${commission:.4f})")
-						
-						# Kelly: добавляем сделку в историю
-						if kelly_tracker:
-							kelly_tracker.trades_history.append({
-								"type": "TRAILING-STOP",
-								"profit": sell_value - commission - (avg_entry * position_obj.amount),
-								"profit_percent": profit
-							})
-						
-						position_obj = None
-						entry_price = None
-						partial_closed = False
-						max_price = 0.0
-						trailing_stop_triggers += 1
-						continue
-				else:
-					# Обычная логика до частичного закрытия
-					
-					# Стоп-лосс (ДИНАМИЧЕСКИЙ на основе ATR)
-					if price <= stop_loss_price:
-						sell_value = position_obj.amount * price
-						commission = sell_value * COMMISSION_RATE
-						total_commission += commission
-						balance += sell_value - commission
-						profit = (price - avg_entry) / avg_entry * 100
-						price_change_percent = ((price - avg_entry) / avg_entry) * 100
-						trades.append(f"STOP-LOSS {position_obj.amount:.6f} @ {price} (потеря: {price_change_percent:.2f}%, SL: ${stop_loss_price:.2f}, комиссия: ${commission:.4f})")
-						
-						# Kelly: добавляем сделку в историю
-						if kelly_tracker:
-							kelly_tracker.trades_history.append({
-								"type": "STOP-LOSS",
-								"profit": sell_value - commission - (avg_entry * position_obj.amount),
-								"profit_percent": profit
-							})
-						
-						position_obj = None
-						entry_price = None
-						entry_atr = 0.0
-						stop_loss_triggers += 1
-						continue
-					
-					# Тейк-профит - частичное закрытие (ДИНАМИЧЕСКИЙ на основе ATR)
-					if price >= take_profit_price:
-						close_amount = position_obj.amount * PARTIAL_CLOSE_PERCENT
-						keep_amount = position_obj.amount - close_amount
-						
-						sell_value = close_amount * price
-						commission = sell_value * COMMISSION_RATE
-						total_commission += commission
-						balance += sell_value - commission
-						
-						price_change_percent = ((price - avg_entry) / avg_entry) * 100
-						trades.append(f"PARTIAL-TP {close_amount:.6f} @ {price} (прибыль: {price_change_percent:.2f}%, TP: ${take_profit_price:.2f}, закрыто: {PARTIAL_CLOSE_PERCENT*100:.0f}%, комиссия: ${commission:.4f})")
-						
-						position_obj.amount = keep_amount
-						partial_closed = True
-						max_price = price
-						partial_close_triggers += 1
-						continue
-			
-			# НОВОЕ: Проверка докупания (ПЕРЕД новыми входами)
-			if position_obj and sig == "BUY" and enable_averaging:
-				# Проверяем возможность докупания
-				if position_obj.can_average_down(price, balance):
-					# Выполняем докупание
-					averaging_invest, avg_commission = position_obj.average_down(price, balance)
-					
-					# Обновляем баланс и статистику
-					balance -= averaging_invest
-					total_commission += avg_commission
-					averaging_triggers += 1
-					
-					# КРИТИЧНО: Обновляем TP на основе НОВОЙ средней цены
-					dynamic_tp_percent = max(0.04, dynamic_sl_percent * 2.0)
-					dynamic_tp_percent = min(dynamic_tp_percent, 0.12)
-					
-					trades.append(f"  >> AVERAGING: докупание #{position_obj.averaging_count}, цена: ${price:.2f}, средняя: ${position_obj.average_entry_price:.2f}, монет: {position_obj.amount:.6f}")
-			
-			# Логика входа/выхода
-			if sig == "BUY" and not position_obj and balance > 0:
-				# Kelly Criterion: рассчитываем множитель
-				kelly_multiplier = 1.0
-				if kelly_tracker:
-					atr_percent = (atr / price) * 100 if atr > 0 and price > 0 else 1.5
-					kelly_multiplier = calculate_kelly_fraction(kelly_tracker.trades_history, atr_percent)
-				
-				# Динамический размер позиции с учётом волатильности и Kelly
-				position_size_percent = get_position_size_percent(signal_strength, atr, price, kelly_multiplier)
-				invest_amount = balance * position_size_percent
-				
-				# Рассчитываем ДИНАМИЧЕСКИЙ Stop-Loss на основе ATR
-				dynamic_sl_percent = get_dynamic_stop_loss_percent(atr, price)
-				
-				# Рассчитываем ДИНАМИЧЕСКИЙ Take-Profit
-				# Используем R:R = 2:1 но с минимумом 4% (чтобы не быть слишком консервативными)
-				dynamic_tp_percent = max(0.04, dynamic_sl_percent * 2.0)
-				dynamic_tp_percent = min(dynamic_tp_percent, 0.12)  # Максимум 12%
-				
-				commission = invest_amount * COMMISSION_RATE
-				total_commission += commission
-				initial_amount = (invest_amount - commission) / price
-				entry_price = price
-				entry_strength = signal_strength
-				entry_atr = atr
-				balance -= invest_amount
-				
-				# ИСПРАВЛЕНО: Создаем объект позиции (БЕЗ предсказания будущего)
-				position_obj = BacktestPosition(
-					entry_price=entry_price,
-					amount=initial_amount,
-					invest_amount=invest_amount,
-					atr=atr
-				)
-				
-				trades.append(f"BUY {initial_amount:.6f} @ {price} (сила: {signal_strength}, размер: {position_size_percent*100:.0f}%, SL: {dynamic_sl_percent*100:.1f}%, TP: {dynamic_tp_percent*100:.1f}%, комиссия: ${commission:.4f})")
-				
-			elif sig == "SELL" and position_obj:
-				# ИСПРАВЛЕНО: Убрали условие "not partial_closed" - закрываем по сигналу SELL всегда
-				# В реальном трейдере SELL сигнал тоже закрывает позицию
-				avg_entry = position_obj.average_entry_price
-				sell_value = position_obj.amount * price
-				commission = sell_value * COMMISSION_RATE
-				total_commission += commission
-				balance += sell_value - commission
-				
-				profit_on_trade = ((price - avg_entry) / avg_entry) * 100
-				trades.append(f"SELL {position_obj.amount:.6f} @ {price} (прибыль: {profit_on_trade:+.2f}%, комиссия: ${commission:.4f})")
-				
-				# Kelly: добавляем сделку в историю
-				if kelly_tracker:
-					kelly_tracker.trades_history.append({
-						"type": "SELL",
-						"profit": sell_value - commission - (avg_entry * position_obj.amount),
-						"profit_percent": profit_on_trade
-					})
-				
-				position_obj = None
-				entry_price = None
-				partial_closed = False
-
-		# Если позиция осталась открытой — закрываем по последней цене с учетом комиссии
-		if position_obj:
-			final_price = df["close"].iloc[-1]
-			avg_entry = position_obj.average_entry_price
-			sell_value = position_obj.amount * final_price
-			commission = sell_value * COMMISSION_RATE
-			total_commission += commission
-			balance += sell_value - commission
-			profit_on_trade = ((final_price - avg_entry) / avg_entry) * 100
-			close_type = "частичной" if partial_closed else "полной"
-			trades.append(f"Закрытие {close_type} позиции: SELL {position_obj.amount:.6f} @ {final_price} (прибыль: {profit_on_trade:+.2f}%, комиссия: ${commission:.4f})")
-			
-			# Kelly: добавляем сделку в историю
-			if kelly_tracker:
-				kelly_tracker.trades_history.append({
-					"type": "FINAL-CLOSE",
-					"profit": sell_value - commission - (avg_entry * position_obj.amount),
-					"profit_percent": profit_on_trade
-				})
-			
-			position_obj = None
-			partial_closed = False
+			jobs.append((cache_path, loop.run_in_executor(
+				pool, simulate_backtest, df, start_balance, use_statistical_models, params
+			)))
+		sims = await asyncio.gather(*[job for _, job in jobs], return_exceptions=True)
 
-		# Финальный баланс = свободные деньги
-		total_balance = balance
-		
-		profit = total_balance - start_balance
-		profit_percent = (profit / start_balance) * 100
-		
-		models_label = "со СТАТИСТИЧЕСКИМИ МОДЕЛЯМИ" if use_statistical_models else "БАЗОВАЯ стратегия"
-		
-		print(f"\n=== {symbol} ({models_label}) ===")
-		print(f"Бэктест за {period_hours} часов")
-		print(f"Начальный баланс: ${start_balance:.2f}")
-		print(f"Итоговый баланс: ${total_balance:.2f}")
-		print(f"Доходность: {profit:.2f} USD ({profit_percent:+.2f}%)")
-		print(f"Общая комиссия: ${total_commission:.4f}")
-		print(f"Количество сделок: {len(trades)}")
-		print(f"Stop-loss срабатываний: {stop_loss_triggers}")
-		print(f"Partial Take-profit: {partial_close_triggers}")
-		print(f"Trailing-stop: {trailing_stop_triggers}")
-		print(f"Докупаний: {averaging_triggers}")
-		if len(trades) > 0:
-			win_trades = sum(1 for t in trades if "прибыль: +" in t or "PARTIAL-TP" in t)
-			loss_trades = sum(1 for t in trades if "прибыль: -" in t or "STOP-LOSS" in t or "TRAILING-STOP" in t)
-			if win_trades + loss_trades > 0:
-				win_rate = (win_trades / (win_trades + loss_trades)) * 100
-				print(f"Винрейт: {win_rate:.1f}% ({win_trades}W / {loss_trades}L)")
-		print("Торговые действия:")
-		for t in trades:
-			print(t)
-
-		# --- Сохраняем результат ---
-		output_dir = "backtests"
-		os.makedirs(output_dir, exist_ok=True)
-		# Добавляем timestamp к имени файла
-		timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-		output_file = os.path.join(output_dir, f"backtest_{symbol}_{interval}_{timestamp}.json")
-
-		# Создаем объект с результатами бэктеста
-		backtest_result = {
-			"symbol": symbol,
-			"start_balance": start_balance,
-			"end_balance": total_balance,
-			"profit": profit,
-			"profit_percent": profit_percent,
-			"total_commission": total_commission,
-			"trades_count": len(trades),
-			"stop_loss_triggers": stop_loss_triggers,
-			"partial_tp_triggers": partial_close_triggers,
-			"trailing_stop_triggers": trailing_stop_triggers,
-			"averaging_triggers": averaging_triggers,
-			"win_rate": win_rate if 'win_rate' in locals() else 0,
-			"use_statistical_models": use_statistical_models,
-			"enable_averaging": enable_averaging,
-			"trades": trades
-		}
-
-		with open(output_file, "w", encoding="utf-8") as f:
-			json.dump(backtest_result, f, ensure_ascii=False, indent=2, default=str)
-
-		print(f"Результаты сохранены в {output_file}")
-		
-		return backtest_result
+	for (cache_path, _), sim in zip(jobs, sims):
+		if not isinstance(sim, BaseException):
+			await asyncio.to_thread(_save_cached_sim, cache_path, sim)
 
 
 async def run_backtest_multiple(symbols: list, interval: str = "15m", period_hours: int = 24, start_balance: float = None, use_statistical_models: bool = False):
-	"""Запускает бэктест для нескольких символов"""
+	"""
+	Запускает бэктест для нескольких символов.
+	Свечи грузятся параллельно (asyncio.gather), симуляции идут в пуле процессов.
+	"""
+	from backtest_core import build_params
+
 	if start_balance is None:
 		start_balance = INITIAL_BALANCE
+	enable_averaging = ENABLE_AVERAGING
+	# Настройки симуляции собираем один раз для всех символов
+	params = build_params(USE_KELLY_CRITERION, enable_averaging)
+	limit = _klines_limit(interval, period_hours)
 	results = []
 	
-	for symbol in symbols:
-		result = await run_backtest(symbol, interval, period_hours, start_balance, use_statistical_models)
-		if result:
-			results.append(result)
+	# I/O: загружаем данные всех символов одновременно
+	async with create_backtest_session() as session:
+		dfs = await asyncio.gather(*[
+			fetch_backtest_data(session, symbol, interval, limit) for symbol in symbols
+		])
+	
+	# CPU: симуляции в отдельных процессах (обход GIL)
+	loop = asyncio.get_running_loop()
+	max_workers = max(1, min(len(symbols), os.cpu_count() or 1))
+	with ProcessPoolExecutor(max_workers=max_workers) as pool:
+		jobs = [
+			loop.run_in_executor(pool, simulate_backtest, df, start_balance, use_statistical_models, params)
+			if df is not None and not df.empty else asyncio.sleep(0, result=None)
+			for df in dfs
+		]
+		sims = await asyncio.gather(*jobs)
+	
+	# Вывод в исходном порядке символов
+	for symbol, sim in zip(symbols, sims):
+		if sim is None:
+			print(f"Нет данных для бэктеста {symbol}.")
+			continue
+		results.append(await report_backtest(symbol, interval, period_hours, start_balance, use_statistical_models, enable_averaging, sim))
 	
 	# Выводим сводную таблицу
 	if results:
+		import pandas as pd
+
 		models_label = "со СТАТИСТИЧЕСКИМИ МОДЕЛЯМИ" if use_statistical_models else "БАЗОВАЯ стратегия"
 		print("\n" + "="*110)
 		print(f"СВОДНАЯ ТАБЛИЦА РЕЗУЛЬТАТОВ ({models_label})")
@@ -419,37 +550,29 @@ async def run_backtest_multiple(symbols: list, interval: str = "15m", period_hou
 		print(f"{'Символ':<10} {'Баланс':<10} {'Прибыль':<10} {'%':<8} {'Комиссия':<10} {'Сделок':<8} {'SL':<5} {'PTP':<5} {'TSL':<5} {'WinRate':<10}")
 		print("-"*110)
 		
-		total_profit = 0
-		total_commission = 0
-		total_sl = 0
-		total_ptp = 0
-		total_tsl = 0
-		
 		for r in results:
 			wr = f"{r['win_rate']:.1f}%" if r['win_rate'] > 0 else "N/A"
-			print(f"{r['symbol']:<10} ${r['final_balance']:<9.2f} ${r['profit']:<9.2f} {r['profit_percent']:>+6.2f}% ${r['total_commission']:<9.4f} {r['trades_count']:<8} {r['stop_loss_triggers']:<5} {r['partial_tp_triggers']:<5} {r['trailing_stop_triggers']:<5} {wr:<10}")
-			total_profit += r['profit']
-			total_commission += r['total_commission']
-			total_sl += r['stop_loss_triggers']
-			total_ptp += r['partial_tp_triggers']
-			total_tsl += r['trailing_stop_triggers']
+			print(f"{r['symbol']:<10} ${r['end_balance']:<9.2f} ${r['profit']:<9.2f} {r['profit_percent']:>+6.2f}% ${r['total_commission']:<9.4f} {r['trades_count']:<8} {r['stop_loss_triggers']:<5} {r['partial_tp_triggers']:<5} {r['trailing_stop_triggers']:<5} {wr:<10}")
+		
+		# Итоги — одной агрегацией по таблице результатов
+		totals = pd.DataFrame(results)[[
+			"profit", "total_commission", "stop_loss_triggers", "partial_tp_triggers", "trailing_stop_triggers"
+		]].sum()
 		
 		print("-"*110)
-		avg_profit_percent = (total_profit / (start_balance * len(results))) * 100
-		print(f"{'ИТОГО:':<10} {'':10} ${total_profit:<9.2f} {avg_profit_percent:>+6.2f}% ${total_commission:<9.4f} {'':8} {total_sl:<5} {total_ptp:<5} {total_tsl:<5}")
+		avg_profit_percent = (totals["profit"] / (start_balance * len(results))) * 100
+		print(f"{'ИТОГО:':<10} {'':10} ${totals['profit']:<9.2f} {avg_profit_percent:>+6.2f}% ${totals['total_commission']:<9.4f} {'':8} {int(totals['stop_loss_triggers']):<5} {int(totals['partial_tp_triggers']):<5} {int(totals['trailing_stop_triggers']):<5}")
 		print("="*110)
 		print("\nЛегенда: SL=Stop-Loss, PTP=Partial Take-Profit, TSL=Trailing-Stop")
 
 
 if __name__ == "__main__":
-	import sys
-	
 	# Проверяем, хочет ли пользователь протестировать tracked_symbols
 	if len(sys.argv) > 1 and sys.argv[1] == "--tracked":
 		# Читаем tracked_symbols.json
 		try:
-			with open("tracked_symbols.json", "r", encoding="utf-8") as f:
-				data = json.load(f)
+			with open("tracked_symbols.json", "rb") as f:
+				data = json_loads(f.read())
 				symbols = data.get("symbols", [])
 			
 			interval = sys.argv[2] if len(sys.argv) > 2 else "15m"
@@ -7,18 +7,25 @@
 """
 
 import asyncio
-import json
-from backtest import run_backtest, run_backtest_multiple
+from json_compat import loads as json_loads
+from backtest import (
+	run_backtest, run_backtest_multiple, prefetch_backtest_data, presimulate_backtests, create_backtest_session
+)
 from config import INITIAL_BALANCE
 
-async def compare_strategies(symbol: str, interval: str = "1h", period_hours: int = 168, start_balance: float = None):
+async def compare_strategies(symbol: str, interval: str = "1h", period_hours: int = 168, start_balance: float = None, session=None):
 	"""
 	Сравниваем две стратегии:
 	1. Базовая (без статистических моделей)
 	2. Со статистическими моделями
+	
+	session — общая HTTP-сессия (если не передана, создаётся на время сравнения).
 	"""
 	if start_balance is None:
 		start_balance = INITIAL_BALANCE
+	if session is None:
+		async with create_backtest_session() as own_session:
+			return await compare_strategies(symbol, interval, period_hours, start_balance, session=own_session)
 	
 	print("\n" + "="*120)
 	print(f"СРАВНЕНИЕ СТРАТЕГИЙ: {symbol} | {interval} | {period_hours}h")
@@ -26,11 +33,11 @@ async def compare_strategies(symbol: str, interval: str = "1h", period_hours: in
 	
 	# Базовая стратегия
 	print("\n[BASE] ЗАПУСК БАЗОВОЙ СТРАТЕГИИ...")
-	result_base = await run_backtest(symbol, interval, period_hours, start_balance, use_statistical_models=False)
+	result_base = await run_backtest(symbol, interval, period_hours, start_balance, use_statistical_models=False, session=session)
 	
 	# Со статистическими моделями
 	print("\n[STAT] ЗАПУСК СО СТАТИСТИЧЕСКИМИ МОДЕЛЯМИ...")
-	result_stat = await run_backtest(symbol, interval, period_hours, start_balance, use_statistical_models=True)
+	result_stat = await run_backtest(symbol, interval, period_hours, start_balance, use_statistical_models=True, session=session)
 	
 	# Сравниваем результаты
 	if result_base and result_stat:
@@ -106,15 +113,27 @@ async def compare_strategies(symbol: str, interval: str = "1h", period_hours: in
 
 async def compare_multiple(symbols: list, interval: str = "1h", period_hours: int = 168, start_balance: float = None):
 	"""Сравниваем стратегии на нескольких парах"""
+	import pandas as pd
+	
 	if start_balance is None:
 		start_balance = INITIAL_BALANCE
 	
 	comparisons = []
 	
-	for symbol in symbols:
-		result = await compare_strategies(symbol, interval, period_hours, start_balance)
-		if result:
-			comparisons.append(result)
+	async with create_backtest_session() as session:
+		# I/O: свечи всех символов грузим одновременно — они остаются в кэше,
+		# и оба прогона каждой пары обходятся без сети
+		await prefetch_backtest_data(session, symbols, interval, period_hours)
+		
+		# CPU: обе стратегии всех пар считаются в пуле процессов и попадают
+		# в кэш результатов — ниже остаётся только вывод
+		await presimulate_backtests(session, symbols, interval, period_hours, start_balance, [False, True])
+		
+		# Сравнения выводятся по очереди, в исходном порядке символов
+		for symbol in symbols:
+			result = await compare_strategies(symbol, interval, period_hours, start_balance, session=session)
+			if result:
+				comparisons.append(result)
 	
 	# Общая сводка
 	if comparisons:
@@ -124,12 +143,6 @@ async def compare_multiple(symbols: list, interval: str = "1h", period_hours: in
 		print(f"{'Символ':<15} {'База: Прибыль%':<20} {'Стат: Прибыль%':<20} {'Разница':<15} {'Сделки (diff)':<20} {'WR (diff)':<15}")
 		print("-"*120)
 		
-		total_base_profit = 0
-		total_stat_profit = 0
-		better_count = 0
-		worse_count = 0
-		same_count = 0
-		
 		for comp in comparisons:
 			base_pct = comp['base']['profit_percent']
 			stat_pct = comp['statistical']['profit_percent']
@@ -144,20 +157,20 @@ async def compare_multiple(symbols: list, interval: str = "1h", period_hours: in
 			indicator = "[+]" if diff > 0 else "[-]" if diff < 0 else "[=]"
 			
 			print(f"{comp['symbol']:<15} {base_pct:<19.2f}% {stat_pct:<19.2f}% {indicator} {diff:>+6.2f}%     {trades_base}->{trades_stat} ({trades_diff:+d})      {wr_diff:>+6.1f}%")
-			
-			total_base_profit += base_pct
-			total_stat_profit += stat_pct
-			
-			if diff > 0:
-				better_count += 1
-			elif diff < 0:
-				worse_count += 1
-			else:
-				same_count += 1
+		
+		# Итоги — агрегацией по таблице сравнений
+		summary = pd.DataFrame({
+			"base_pct": [comp['base']['profit_percent'] for comp in comparisons],
+			"stat_pct": [comp['statistical']['profit_percent'] for comp in comparisons],
+			"diff": [comp['profit_improvement'] for comp in comparisons],
+		})
+		better_count = int((summary["diff"] > 0).sum())
+		worse_count = int((summary["diff"] < 0).sum())
+		same_count = len(summary) - better_count - worse_count
 		
 		print("-"*120)
-		avg_base = total_base_profit / len(comparisons)
-		avg_stat = total_stat_profit / len(comparisons)
+		avg_base = summary["base_pct"].mean()
+		avg_stat = summary["stat_pct"].mean()
 		avg_diff = avg_stat - avg_base
 		
 		print(f"{'СРЕДНЯЯ':<15} {avg_base:<19.2f}% {avg_stat:<19.2f}% {'':3} {avg_diff:>+6.2f}%")
@@ -183,8 +196,8 @@ if __name__ == "__main__":
 	if len(sys.argv) > 1 and sys.argv[1] == "--tracked":
 		# Сравниваем все tracked symbols
 		try:
-			with open("tracked_symbols.json", "r", encoding="utf-8") as f:
-				data = json.load(f)
+			with open("tracked_symbols.json", "rb") as f:
+				data = json_loads(f.read())
 				symbols = data.get("symbols", [])
 			
 			interval = sys.argv[2] if len(sys.argv) > 2 else "1h"
@@ -0,0 +1,563 @@
+"""
+Ядро бэктеста: пошаговая симуляция торговли на NumPy-массивах.
+Компилируется Numba (@njit), без numba работает как обычный Python.
+
+Логика повторяет run_backtest из backtest.py (как в real_trader):
+динамический SL/TP по ATR, частичное закрытие на TP, trailing stop,
+докупание (averaging) и Kelly Criterion для размера позиции.
+"""
+import numpy as np
+from numba_compat import njit
+from signal_generator import SIGNAL_HOLD, SIGNAL_BUY, SIGNAL_SELL
+from config import (
+	COMMISSION_RATE, STOP_LOSS_PERCENT, PARTIAL_CLOSE_PERCENT, TRAILING_STOP_PERCENT,
+	DYNAMIC_SL_ATR_MULTIPLIER, DYNAMIC_SL_MIN, DYNAMIC_SL_MAX,
+	MAX_AVERAGING_ATTEMPTS, AVERAGING_PRICE_DROP_PERCENT, AVERAGING_SIZE_PERCENT,
+	POSITION_SIZE_STRONG, POSITION_SIZE_MEDIUM, POSITION_SIZE_WEAK,
+	SIGNAL_STRENGTH_STRONG, SIGNAL_STRENGTH_MEDIUM,
+	VOLATILITY_HIGH_THRESHOLD, VOLATILITY_LOW_THRESHOLD, VOLATILITY_ADJUSTMENT_MAX,
+	USE_KELLY_CRITERION, KELLY_FRACTION, MIN_TRADES_FOR_KELLY, KELLY_LOOKBACK_WINDOW,
+	KELLY_NEGATIVE_MULTIPLIER
+)
+
+# Типы событий (торговых действий)
+EVENT_BUY = 0
+EVENT_STOP_LOSS = 1
+EVENT_PARTIAL_TP = 2
+EVENT_TRAILING_STOP = 3
+EVENT_SELL = 4
+EVENT_AVERAGING = 5
+EVENT_FINAL_CLOSE = 6
+
+# Колонки массива событий
+EV_CODE = 0         # тип события
+EV_BAR = 1          # индекс свечи
+EV_PRICE = 2        # цена исполнения
+EV_AMOUNT = 3       # количество монет (для AVERAGING - итоговое в позиции)
+EV_COMMISSION = 4   # комиссия
+EV_PROFIT_PCT = 5   # изменение цены от средней цены входа, %
+EV_LEVEL = 6        # SL/TP цена, % от максимума (trailing) или новая средняя (averaging)
+EV_COUNT = 7        # номер докупания (averaging) / 1 если позиция была частично закрыта (final)
+EV_SIZE_PCT = 8     # размер позиции от баланса (BUY)
+EV_SL_PCT = 9       # динамический SL (BUY)
+EV_TP_PCT = 10      # динамический TP (BUY)
+EVENT_COLUMNS = 11
+
+# Колонки истории закрытых сделок для Kelly
+KELLY_PROFIT = 0       # прибыль в USD
+KELLY_PROFIT_PCT = 1   # прибыль в %
+
+# Счётчики срабатываний
+CNT_STOP_LOSS = 0
+CNT_PARTIAL_TP = 1
+CNT_TRAILING_STOP = 2
+CNT_AVERAGING = 3
+CNT_WINS = 4        # закрытия (полные и частичные) с прибылью
+CNT_LOSSES = 5      # закрытия с убытком (нулевой результат не считается)
+COUNTERS_COUNT = 6
+
+# Параметры симуляции (индексы в массиве params)
+P_COMMISSION = 0
+P_STOP_LOSS = 1
+P_PARTIAL_CLOSE = 2
+P_TRAILING_STOP = 3
+P_SL_ATR_MULTIPLIER = 4
+P_SL_MIN = 5
+P_SL_MAX = 6
+P_USE_AVERAGING = 7
+P_AVG_MAX_ATTEMPTS = 8
+P_AVG_PRICE_DROP = 9
+P_AVG_SIZE = 10
+P_SIZE_STRONG = 11
+P_SIZE_MEDIUM = 12
+P_SIZE_WEAK = 13
+P_STRENGTH_STRONG = 14
+P_STRENGTH_MEDIUM = 15
+P_VOL_HIGH = 16
+P_VOL_LOW = 17
+P_VOL_ADJ_MAX = 18
+P_USE_KELLY = 19
+P_KELLY_FRACTION = 20
+P_KELLY_MIN_TRADES = 21
+P_KELLY_LOOKBACK = 22
+P_KELLY_NEGATIVE = 23
+PARAMS_COUNT = 24
+
+
+def build_params(enable_kelly: bool, enable_averaging: bool) -> np.ndarray:
+	"""
+	Упаковывает настройки из config в массив для simulate().
+	Значения передаются аргументом, а не глобалами: кэш Numba
+	не должен «замораживать» старые значения config.
+	"""
+	params = np.zeros(PARAMS_COUNT, dtype=np.float64)
+	params[P_COMMISSION] = COMMISSION_RATE
+	params[P_STOP_LOSS] = STOP_LOSS_PERCENT
+	params[P_PARTIAL_CLOSE] = PARTIAL_CLOSE_PERCENT
+	params[P_TRAILING_STOP] = TRAILING_STOP_PERCENT
+	params[P_SL_ATR_MULTIPLIER] = DYNAMIC_SL_ATR_MULTIPLIER
+	params[P_SL_MIN] = DYNAMIC_SL_MIN
+	params[P_SL_MAX] = DYNAMIC_SL_MAX
+	params[P_USE_AVERAGING] = 1.0 if enable_averaging else 0.0
+	params[P_AVG_MAX_ATTEMPTS] = MAX_AVERAGING_ATTEMPTS
+	params[P_AVG_PRICE_DROP] = AVERAGING_PRICE_DROP_PERCENT
+	params[P_AVG_SIZE] = AVERAGING_SIZE_PERCENT
+	params[P_SIZE_STRONG] = POSITION_SIZE_STRONG
+	params[P_SIZE_MEDIUM] = POSITION_SIZE_MEDIUM
+	params[P_SIZE_WEAK] = POSITION_SIZE_WEAK
+	params[P_STRENGTH_STRONG] = SIGNAL_STRENGTH_STRONG
+	params[P_STRENGTH_MEDIUM] = SIGNAL_STRENGTH_MEDIUM
+	params[P_VOL_HIGH] = VOLATILITY_HIGH_THRESHOLD
+	params[P_VOL_LOW] = VOLATILITY_LOW_THRESHOLD
+	params[P_VOL_ADJ_MAX] = VOLATILITY_ADJUSTMENT_MAX
+	# calculate_kelly_fraction возвращает 1.0 при выключенном USE_KELLY_CRITERION
+	params[P_USE_KELLY] = 1.0 if (enable_kelly and USE_KELLY_CRITERION) else 0.0
+	params[P_KELLY_FRACTION] = KELLY_FRACTION
+	params[P_KELLY_MIN_TRADES] = MIN_TRADES_FOR_KELLY
+	params[P_KELLY_LOOKBACK] = KELLY_LOOKBACK_WINDOW
+	params[P_KELLY_NEGATIVE] = KELLY_NEGATIVE_MULTIPLIER
+	return params
+
+
+@njit(cache=True)
+def _dynamic_stop_loss_percent(atr, price, params):
+	"""Аналог position.get_dynamic_stop_loss_percent"""
+	if atr <= 0 or price <= 0:
+		return params[P_STOP_LOSS]
+	atr_based_sl = params[P_SL_ATR_MULTIPLIER] * atr / price
+	return max(params[P_SL_MIN], min(params[P_SL_MAX], atr_based_sl))
+
+
+@njit(cache=True)
+def _sl_tp_prices(atr, avg_entry, params):
+	"""
+	Уровни SL/TP позиции: динамический SL по ATR входа и TP с R:R = 2:1
+	(минимум 4%, максимум 12%) от средней цены входа.
+	"""
+	sl_percent = _dynamic_stop_loss_percent(atr, avg_entry, params)
+	tp_percent = max(0.04, sl_percent * 2.0)
+	tp_percent = min(tp_percent, 0.12)
+	return avg_entry * (1 - sl_percent), avg_entry * (1 + tp_percent)
+
+
+def _scalar_min(a, b):
+	"""Поэлементный min(a, b) с семантикой встроенного min (NaN в b игнорируется)"""
+	return np.where(b < a, b, a)
+
+
+def _scalar_max(a, b):
+	"""Поэлементный max(a, b) с семантикой встроенного max (NaN в b игнорируется)"""
+	return np.where(b > a, b, a)
+
+
+def compute_sizing_arrays(prices, atrs, strengths, params):
+	"""
+	Размер позиции и SL/TP входа для каждой свечи — один векторный проход
+	вместо вызовов на каждом BUY внутри simulate().
+
+	Возвращает float64-массивы (base_size, sl_pct, tp_pct):
+	- base_size: аналог position_sizing.get_position_size_percent до умножения
+	  на Kelly (он зависит от истории сделок и считается в цикле)
+	- sl_pct: аналог position.get_dynamic_stop_loss_percent
+	- tp_pct: TP с R:R = 2:1 (минимум 4%, максимум 12%)
+	"""
+	prices = np.asarray(prices, dtype=np.float64)
+	atrs = np.asarray(atrs, dtype=np.float64)
+	valid = (atrs > 0) & (prices > 0)
+
+	with np.errstate(divide="ignore", invalid="ignore"):
+		# Базовый размер по силе сигнала
+		base_size = np.where(
+			strengths >= params[P_STRENGTH_STRONG], params[P_SIZE_STRONG],
+			np.where(strengths >= params[P_STRENGTH_MEDIUM], params[P_SIZE_MEDIUM], params[P_SIZE_WEAK])
+		)
+
+		# Корректировка на волатильность
+		atr_percent = (atrs / prices) * 100
+		high_vol = valid & (atr_percent > params[P_VOL_HIGH])
+		low_vol = valid & ~high_vol & (atr_percent < params[P_VOL_LOW])
+		base_size = np.where(high_vol, base_size * (params[P_VOL_HIGH] / atr_percent), base_size)
+		base_size = np.where(
+			low_vol, base_size * _scalar_min(params[P_VOL_ADJ_MAX], params[P_VOL_LOW] / atr_percent), base_size
+		)
+
+		# Динамический SL по ATR (ATR <= 0 или цена <= 0 — фиксированный SL)
+		atr_based_sl = params[P_SL_ATR_MULTIPLIER] * atrs / prices
+		sl_pct = _scalar_max(params[P_SL_MIN], _scalar_min(params[P_SL_MAX], atr_based_sl))
+		sl_pct = np.where((atrs <= 0) | (prices <= 0), params[P_STOP_LOSS], sl_pct)
+
+	tp_pct = _scalar_min(_scalar_max(0.04, sl_pct * 2.0), 0.12)
+	return base_size.astype(np.float64), sl_pct.astype(np.float64), tp_pct.astype(np.float64)
+
+
+@njit(cache=True)
+def _kelly_fraction(kelly_hist, atr_percent, params):
+	"""
+	Аналог position_sizing.calculate_kelly_fraction.
+	kelly_hist - закрытые сделки по порядку: строки (прибыль в USD, прибыль в %).
+	"""
+	kelly_n = kelly_hist.shape[0]
+	if kelly_n < params[P_KELLY_MIN_TRADES]:
+		return 1.0
+
+	# Окно <= 0 — вся история (как kelly_hist[-0:] в calculate_kelly_fraction)
+	lookback = int(params[P_KELLY_LOOKBACK])
+	recent = kelly_hist[max(0, kelly_n - lookback):] if lookback > 0 else kelly_hist
+	total_trades = recent.shape[0]
+	win_count = 0
+	loss_count = 0
+	win_sum = 0.0
+	loss_sum = 0.0
+	for k in range(total_trades):
+		if recent[k, KELLY_PROFIT] > 0:
+			win_count += 1
+			win_sum += recent[k, KELLY_PROFIT_PCT]
+		else:
+			loss_count += 1
+			loss_sum += recent[k, KELLY_PROFIT_PCT]
+
+	win_rate = win_count / total_trades
+	avg_win = win_sum / win_count if win_count > 0 else 0.0
+	avg_loss = abs(loss_sum / loss_count) if loss_count > 0 else 1.0
+
+	if avg_win <= 0 or avg_loss <= 0:
+		return 1.0
+
+	kelly = (win_rate * avg_win - (1 - win_rate) * avg_loss) / avg_win
+	if kelly <= 0:
+		return params[P_KELLY_NEGATIVE]
+
+	kelly *= params[P_KELLY_FRACTION]
+	kelly *= 1 / (1 + (atr_percent / 2) ** 1.2)
+	return max(0.5, min(1.5, kelly))
+
+
+@njit(cache=True)
+def _record_event(events, k, code, bar, price, amount, commission, profit_pct, level):
+	"""Записывает событие в строку k массива событий"""
+	events[k, EV_CODE] = code
+	events[k, EV_BAR] = bar
+	events[k, EV_PRICE] = price
+	events[k, EV_AMOUNT] = amount
+	events[k, EV_COMMISSION] = commission
+	events[k, EV_PROFIT_PCT] = profit_pct
+	events[k, EV_LEVEL] = level
+
+
+@njit(cache=True)
+def _count_exit(counters, profit):
+	"""Учитывает закрытие в счётчиках прибыльных/убыточных сделок"""
+	if profit > 0:
+		counters[CNT_WINS] += 1
+	elif profit < 0:
+		counters[CNT_LOSSES] += 1
+
+
+@njit(cache=True)
+def _next_signal_index(signals):
+	"""next_signal[i] — индекс ближайшей свечи >= i с сигналом BUY/SELL (n, если таких нет)"""
+	n = signals.shape[0]
+	next_signal = np.empty(n + 1, dtype=np.int64)
+	next_signal[n] = n
+	for j in range(n - 1, -1, -1):
+		next_signal[j] = j if signals[j] != SIGNAL_HOLD else next_signal[j + 1]
+	return next_signal
+
+
+@njit(cache=True)
+def _first_sl_tp_hit(prices, start, end, stop_loss_price, take_profit_price):
+	"""Первая свеча в [start, end), где цена достигла SL или TP; end, если таких нет"""
+	for j in range(start, end):
+		price = prices[j]
+		# Без short-circuit между проверками SL и TP: обе считаются и объединяются
+		# побитово; выход из цикла по-прежнему через условный return
+		if (price <= stop_loss_price) | (price >= take_profit_price):
+			return j
+	return end
+
+
+@njit(cache=True)
+def _first_trailing_hit(prices, start, end, max_price, trailing_percent):
+	"""
+	Первая свеча в [start, end), где сработал trailing stop (end, если таких нет),
+	и максимум цены, обновлённый по пройденным свечам.
+	"""
+	for j in range(start, end):
+		price = prices[j]
+		if price > max_price:
+			max_price = price
+		if (max_price - price) / max_price >= trailing_percent:
+			return j, max_price
+	return end, max_price
+
+
+@njit(cache=True)
+def _average_down(price, avg_entry, amount, invest_amount, averaging_count, balance, params):
+	"""
+	Докупание по цене price (аналог averaging в real_trader).
+	Возвращает (вложение, комиссия, новое количество, новая средняя цена);
+	вложение 0.0 — условия докупания не выполнены, позиция не меняется.
+	"""
+	averaging_invest = invest_amount * params[P_AVG_SIZE]
+	price_drop = (avg_entry - price) / avg_entry
+	if not (
+		averaging_count < params[P_AVG_MAX_ATTEMPTS]
+		and price_drop >= params[P_AVG_PRICE_DROP]
+		and averaging_invest >= 1 and averaging_invest <= balance
+	):
+		return 0.0, 0.0, amount, avg_entry
+
+	commission = averaging_invest * params[P_COMMISSION]
+	averaging_amount = (averaging_invest - commission) / price
+	new_amount = amount + averaging_amount
+	# ПРАВИЛЬНАЯ формула средней цены (как в real_trader)
+	new_avg_entry = (avg_entry * amount + price * averaging_amount) / new_amount
+	return averaging_invest, commission, new_amount, new_avg_entry
+
+
+# Явная сигнатура: simulate компилируется при импорте, а cache=True сохраняет
+# машинный код на диск (__pycache__), поэтому повторные запуски не ждут JIT.
+# Типы аргументов должны совпадать с сигнатурой (см. backtest.simulate_backtest).
+SIMULATE_SIGNATURE = (
+	"Tuple((f8, f8, f8[:, :], i8[:]))"
+	"(f8[:], f8[:], i1[:], f8[:], f8[:], f8[:], i8, f8, f8[:])"
+)
+
+
+@njit(SIMULATE_SIGNATURE, cache=True)
+def simulate(prices, atrs, signals, base_sizes, sl_pcts, tp_pcts, start_index, start_balance, params):
+	"""
+	Пошаговая симуляция торговли по заранее посчитанным сигналам.
+
+	Параметры:
+	- prices, atrs: float64-массивы по свечам
+	- signals: int8-коды сигналов (SIGNAL_BUY / SIGNAL_SELL / HOLD)
+	- base_sizes, sl_pcts, tp_pcts: размер позиции (до Kelly) и SL/TP входа
+	  по свечам из compute_sizing_arrays()
+	- start_index: первая свеча, с которой разрешена торговля (int)
+	- start_balance: начальный баланс (float)
+	- params: float64-массив из build_params()
+
+	Возвращает (balance, total_commission, events, counters):
+	- events: массив событий (EVENT_COLUMNS колонок), строки в порядке исполнения
+	- counters: срабатывания SL / partial TP / trailing / докупаний,
+	  прибыльные и убыточные закрытия (индексы CNT_*)
+	"""
+	n = prices.shape[0]
+	commission_rate = params[P_COMMISSION]
+
+	# На свече возможно не больше двух событий (докупание + SELL) и финальное закрытие
+	events = np.zeros((2 * n + 1, EVENT_COLUMNS), dtype=np.float64)
+	n_events = 0
+	counters = np.zeros(COUNTERS_COUNT, dtype=np.int64)
+
+	# История закрытых сделок для Kelly
+	kelly_hist = np.empty((n + 1, 2), dtype=np.float64)
+	kelly_n = 0
+
+	balance = start_balance
+	total_commission = 0.0
+
+	# Состояние позиции (скаляры вместо объекта BacktestPosition)
+	pos_open = False
+	pos_amount = 0.0
+	pos_invest_amount = 0.0
+	pos_atr = 0.0
+	pos_avg_entry = 0.0
+	pos_total_invested = 0.0
+	pos_averaging_count = 0
+	# SL/TP зависят только от ATR входа и средней цены —
+	# пересчитываются при входе и докупании, а не на каждой свече
+	pos_sl_price = 0.0
+	pos_tp_price = 0.0
+	partial_closed = False
+	max_price = 0.0
+
+	# Свечи без сигнала, где не сработали SL/TP/trailing, ничего не меняют —
+	# пропускаем их отрезками до ближайшего события
+	next_signal = _next_signal_index(signals)
+
+	i = start_index
+	while i < n:
+		segment_end = next_signal[i]
+		if not pos_open:
+			i = segment_end
+		elif not partial_closed:
+			i = _first_sl_tp_hit(prices, i, segment_end, pos_sl_price, pos_tp_price)
+		else:
+			i, max_price = _first_trailing_hit(prices, i, segment_end, max_price, params[P_TRAILING_STOP])
+		if i >= n:
+			break
+
+		price = prices[i]
+		sig = signals[i]
+		atr = atrs[i]
+
+		# Проверка стоп-лосса и тейк-профита
+		if pos_open:
+			avg_entry = pos_avg_entry
+			stop_loss_price = pos_sl_price
+			take_profit_price = pos_tp_price
+
+			if partial_closed:
+				# Trailing stop от максимальной цены
+				if price > max_price:
+					max_price = price
+
+				trailing_drop = (max_price - price) / max_price
+				if trailing_drop >= params[P_TRAILING_STOP]:
+					sell_value = pos_amount * price
+					commission = sell_value * commission_rate
+					total_commission += commission
+					balance += sell_value - commission
+					profit_from_max = ((price - max_price) / max_price) * 100
+					profit = (price - avg_entry) / avg_entry * 100
+					_record_event(events, n_events, EVENT_TRAILING_STOP, i, price, pos_amount, commission, profit, profit_from_max)
+					n_events += 1
+					_count_exit(counters, profit)
+
+					kelly_hist[kelly_n, KELLY_PROFIT] = sell_value - commission - (avg_entry * pos_amount)
+					kelly_hist[kelly_n, KELLY_PROFIT_PCT] = profit
+					kelly_n += 1
+
+					pos_open = False
+					partial_closed = False
+					max_price = 0.0
+					counters[CNT_TRAILING_STOP] += 1
+					i += 1
+					continue
+			else:
+				# Стоп-лосс (ДИНАМИЧЕСКИЙ на основе ATR)
+				if price <= stop_loss_price:
+					sell_value = pos_amount * price
+					commission = sell_value * commission_rate
+					total_commission += commission
+					balance += sell_value - commission
+					profit = (price - avg_entry) / avg_entry * 100
+					_record_event(events, n_events, EVENT_STOP_LOSS, i, price, pos_amount, commission, profit, stop_loss_price)
+					n_events += 1
+					_count_exit(counters, profit)
+
+					kelly_hist[kelly_n, KELLY_PROFIT] = sell_value - commission - (avg_entry * pos_amount)
+					kelly_hist[kelly_n, KELLY_PROFIT_PCT] = profit
+					kelly_n += 1
+
+					pos_open = False
+					counters[CNT_STOP_LOSS] += 1
+					i += 1
+					continue
+
+				# Тейк-профит - частичное закрытие (ДИНАМИЧЕСКИЙ на основе ATR)
+				if price >= take_profit_price:
+					close_amount = pos_amount * params[P_PARTIAL_CLOSE]
+					keep_amount = pos_amount - close_amount
+
+					sell_value = close_amount * price
+					commission = sell_value * commission_rate
+					total_commission += commission
+					balance += sell_value - commission
+
+					price_change_percent = ((price - avg_entry) / avg_entry) * 100
+					_record_event(events, n_events, EVENT_PARTIAL_TP, i, price, close_amount, commission, price_change_percent, take_profit_price)
+					n_events += 1
+					_count_exit(counters, price_change_percent)
+
+					pos_amount = keep_amount
+					partial_closed = True
+					max_price = price
+					counters[CNT_PARTIAL_TP] += 1
+					i += 1
+					continue
+
+		# Докупание (ПЕРЕД новыми входами)
+		if pos_open and sig == SIGNAL_BUY and params[P_USE_AVERAGING] > 0:
+			averaging_invest, commission, new_amount, new_avg_entry = _average_down(
+				price, pos_avg_entry, pos_amount, pos_invest_amount, pos_averaging_count, balance, params
+			)
+			if averaging_invest > 0:
+				pos_total_invested += averaging_invest
+				pos_amount = new_amount
+				pos_averaging_count += 1
+				pos_avg_entry = new_avg_entry
+				# КРИТИЧНО: SL/TP от НОВОЙ средней цены
+				pos_sl_price, pos_tp_price = _sl_tp_prices(pos_atr, pos_avg_entry, params)
+
+				balance -= averaging_invest
+				total_commission += commission
+				counters[CNT_AVERAGING] += 1
+
+				_record_event(events, n_events, EVENT_AVERAGING, i, price, pos_amount, commission, 0.0, pos_avg_entry)
+				events[n_events, EV_COUNT] = pos_averaging_count
+				n_events += 1
+
+		# Логика входа/выхода
+		if sig == SIGNAL_BUY and not pos_open and balance > 0:
+			kelly_multiplier = 1.0
+			if params[P_USE_KELLY] > 0:
+				atr_percent = (atr / price) * 100 if atr > 0 and price > 0 else 1.5
+				kelly_multiplier = _kelly_fraction(kelly_hist[:kelly_n], atr_percent, params)
+
+			position_size_percent = min(base_sizes[i] * kelly_multiplier, params[P_SIZE_STRONG] * 1.2)
+			invest_amount = balance * position_size_percent
+
+			# ДИНАМИЧЕСКИЙ SL на основе ATR и TP с R:R = 2:1 (посчитаны заранее)
+			dynamic_sl_percent = sl_pcts[i]
+			dynamic_tp_percent = tp_pcts[i]
+
+			commission = invest_amount * commission_rate
+			total_commission += commission
+			initial_amount = (invest_amount - commission) / price
+			balance -= invest_amount
+
+			pos_open = True
+			pos_amount = initial_amount
+			pos_invest_amount = invest_amount
+			pos_atr = atr
+			pos_avg_entry = price
+			pos_sl_price, pos_tp_price = _sl_tp_prices(pos_atr, pos_avg_entry, params)
+			pos_total_invested = invest_amount
+			pos_averaging_count = 0
+
+			_record_event(events, n_events, EVENT_BUY, i, price, initial_amount, commission, 0.0, 0.0)
+			events[n_events, EV_SIZE_PCT] = position_size_percent
+			events[n_events, EV_SL_PCT] = dynamic_sl_percent
+			events[n_events, EV_TP_PCT] = dynamic_tp_percent
+			n_events += 1
+
+		elif sig == SIGNAL_SELL and pos_open:
+			# SELL сигнал закрывает позицию всегда (как в реальном трейдере)
+			avg_entry = pos_avg_entry
+			sell_value = pos_amount * price
+			commission = sell_value * commission_rate
+			total_commission += commission
+			balance += sell_value - commission
+
+			profit_on_trade = ((price - avg_entry) / avg_entry) * 100
+			_record_event(events, n_events, EVENT_SELL, i, price, pos_amount, commission, profit_on_trade, 0.0)
+			n_events += 1
+			_count_exit(counters, profit_on_trade)
+
+			kelly_hist[kelly_n, KELLY_PROFIT] = sell_value - commission - (avg_entry * pos_amount)
+			kelly_hist[kelly_n, KELLY_PROFIT_PCT] = profit_on_trade
+			kelly_n += 1
+
+			pos_open = False
+			partial_closed = False
+
+		i += 1
+
+	# Если позиция осталась открытой — закрываем по последней цене с учетом комиссии
+	if pos_open:
+		final_price = prices[n - 1]
+		avg_entry = pos_avg_entry
+		sell_value = pos_amount * final_price
+		commission = sell_value * commission_rate
+		total_commission += commission
+		balance += sell_value - commission
+		profit_on_trade = ((final_price - avg_entry) / avg_entry) * 100
+		_record_event(events, n_events, EVENT_FINAL_CLOSE, n - 1, final_price, pos_amount, commission, profit_on_trade, 0.0)
+		events[n_events, EV_COUNT] = 1.0 if partial_closed else 0.0
+		n_events += 1
+		_count_exit(counters, profit_on_trade)
+
+	return balance, total_commission, events[:n_events], counters
@@ -4,32 +4,47 @@
 """
 
 import os
+import time
+import pickle
+import hashlib
 import pandas as pd
 import numpy as np
 import aiohttp
 import asyncio
-import csv
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Any
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from data_provider import DataProvider
-from signal_generator import SignalGenerator
+from typing import Dict, List, Tuple, Any, Optional
+from backtest import create_backtest_session, fetch_backtest_data, config_hash, lttb_indices, PLOT_MAX_POINTS, RESULTS_CACHE_TTL
+from signal_generator import SignalGenerator, SIGNAL_CODES, SIGNAL_HOLD
+from backtest_hybrid_core import (
+	simulate, build_params, max_drawdown, MODE_CODES, MODE_NAMES, REASON_NAMES, TRADE_COLUMNS,
+	TR_ENTRY_BAR, TR_EXIT_BAR, TR_ENTRY_PRICE, TR_EXIT_PRICE, TR_ENTRY_MODE,
+	TR_PNL_PCT, TR_PNL_USD, TR_REASON, TR_HOURS_HELD,
+	MODE_CODE_NONE, MODE_CODE_TRANSITION, MODE_CODE_MEAN_REVERSION,
+	SWITCH_COLUMNS, SW_BAR, SW_FROM_MODE, SW_TO_MODE, SW_ADX,
+	CNT_WINS, CNT_LOSSES, CNT_MR_TRADES, CNT_TF_TRADES
+)
 from config import (
-	COMMISSION_RATE, INITIAL_BALANCE,
-	# Mean Reversion параметры v5
-	MR_TAKE_PROFIT_PERCENT, MR_STOP_LOSS_PERCENT, MR_MAX_HOLDING_HOURS,
-	# Трейлинг стоп v5
-	USE_TRAILING_STOP_MR, MR_TRAILING_ACTIVATION, MR_TRAILING_DISTANCE,
-	MR_TRAILING_AGGRESSIVE_ACTIVATION, MR_TRAILING_AGGRESSIVE_DISTANCE,
-	# Trend Following параметры
-	MAX_HOLDING_HOURS,
+	INITIAL_BALANCE,
 	# Гибридные параметры
-	HYBRID_ADX_MR_THRESHOLD, HYBRID_ADX_TF_THRESHOLD, HYBRID_MIN_TIME_IN_MODE,
-	# Partial TP v5.3
-	USE_PARTIAL_TP, PARTIAL_TP_PERCENT, PARTIAL_TP_TRIGGER, PARTIAL_TP_REMAINING_TP
+	HYBRID_ADX_MR_THRESHOLD, HYBRID_ADX_TF_THRESHOLD, HYBRID_MIN_TIME_IN_MODE
 )
 
+# Кэш сигналов: сигналы зависят только от свечей и config, поэтому при переборе
+# параметров симуляции (SL/TP/трейлинг в ядре) они не пересчитываются
+SIGNALS_CACHE_DIR = os.path.join("backtests", "cache", "hybrid_signals")
+SIGNALS_CACHE_VERSION = 2  # увеличивать при изменении генерации сигналов
+# Ключ — хэш свечей, а свечи обновляются раз в час: старые файлы больше не читаются
+SIGNALS_CACHE_TTL = RESULTS_CACHE_TTL  # секунд
+
+
+def _signals_cache_path(df: pd.DataFrame) -> str:
+	"""Путь к кэшу сигналов: ключ — содержимое свечей (с индексом) + хэш config"""
+	digest = hashlib.sha256()
+	digest.update(repr((SIGNALS_CACHE_VERSION, tuple(df.columns), config_hash())).encode("utf-8"))
+	digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+	return os.path.join(SIGNALS_CACHE_DIR, digest.hexdigest() + ".pkl")
+
+
 class HybridBacktest:
 	"""Бэктест для гибридной стратегии (MR + TF)"""
 	
@@ -39,25 +54,31 @@ class HybridBacktest:
 		self.period_days = period_days
 		self.start_balance = start_balance
 		self.balance = start_balance
-		self.position = 0.0
-		self.entry_price = None
-		self.entry_time = None
-		self.entry_mode = None  # "MR" или "TF"
-		self.entry_sl = None  # Динамический SL для MR
-		self.entry_tp = None  # Динамический TP для MR
-		self.max_price = 0.0
-		self.trailing_active = False
-		self.trailing_aggressive_active = False
-		self.partial_tp_taken = False  # v5.3: Флаг partial TP
-		self.breakeven_sl_active = False  # v5.3: Флаг break-even SL
-		self.trades = []
-		self.equity_curve = []
-		self.mode_switches = []  # История переключений режимов
+		# Состояние позиции живёт в njit-ядре (backtest_hybrid_core.simulate)
+		# Сделки — массив (TRADE_COLUMNS, число сделок): self.trades[TR_*] — колонка
+		self.trades = np.zeros((TRADE_COLUMNS, 0), dtype=np.float64)
+		self.bar_times = None
+		# Кривая equity и свечи симуляции (массивы, DataFrame — в equity_frame)
+		self.equity = np.zeros(0, dtype=np.float64)
+		self.bar_prices = np.zeros(0, dtype=np.float64)
+		self.bar_modes = np.zeros(0, dtype=np.int8)
+		# История переключений режимов: массив (SWITCH_COLUMNS, число переключений)
+		self.mode_switches = np.zeros((SWITCH_COLUMNS, 0), dtype=np.float64)
 		self.last_mode = None
 		self.last_mode_time = None
 		
-	async def fetch_data(self) -> pd.DataFrame:
-		"""Получаем данные с Binance"""
+	async def fetch_data(self, session: Optional[aiohttp.ClientSession] = None) -> pd.DataFrame:
+		"""
+		Получаем данные с Binance.
+		
+		session — общая HTTP-сессия (если не передана, создаётся на время загрузки).
+		Свечи кэшируются в памяти и на диске (backtest.fetch_backtest_data),
+		поэтому повторные запуски с теми же параметрами не ходят в API.
+		"""
+		if session is None:
+			async with create_backtest_session() as own_session:
+				return await self.fetch_data(session=own_session)
+		
 		# Вычисляем сколько свечей нужно
 		if self.interval.endswith('h'):
 			hours_per_candle = int(self.interval[:-1])
@@ -69,22 +90,20 @@ class HybridBacktest:
 		candles_per_hour = 1 / hours_per_candle
 		required_candles = int(self.period_days * 24 * candles_per_hour)
 		
-		# Binance API лимит обычно 1000-1500
-		limit = min(required_candles, 1500)
+		# Больше лимита одного запроса API — DataProvider загружает свечи страницами
+		limit = required_candles
 		
 		print(f"\nLoading data...")
 		print(f"NOTE: Requesting {limit} candles")
 		
-		async with aiohttp.ClientSession() as session:
-			provider = DataProvider(session)
-			df = await provider.fetch_klines(symbol=self.symbol, interval=self.interval, limit=limit)
-			
-			if df is not None and not df.empty:
-				# Пересчитываем реальное количество дней
-				actual_days = len(df) / (24 * candles_per_hour)
-				print(f"OK: Loaded {len(df)} candles ({actual_days:.1f} days)\n")
-			
-			return df
+		df = await fetch_backtest_data(session, self.symbol, self.interval, limit)
+		
+		if df is not None and not df.empty:
+			# Пересчитываем реальное количество дней
+			actual_days = len(df) / (24 * candles_per_hour)
+			print(f"OK: Loaded {len(df)} candles ({actual_days:.1f} days)\n")
+		
+		return df
 	
 	def run_backtest(self, df: pd.DataFrame) -> Dict[str, Any]:
 		"""
@@ -94,462 +113,60 @@ class HybridBacktest:
 			print(f"Нет данных для {self.symbol}")
 			return None
 		
-		# Генерируем сигналы
-		signals = []
-		min_window = 50
+		# Генерируем сигналы (или берём из кэша)
+		cache_path = _signals_cache_path(df)
+		cached = self._load_cached_signals(cache_path)
+		if cached is None:
+			cached = self._generate_signals(df)
+			self._save_cached_signals(cache_path, cached)
+		prices, signal_codes, mode_codes, position_sizes, dynamic_sls, dynamic_tps, times_ns = cached["arrays"]
+		times = cached["times"]
+		self.mode_switches = cached["mode_switches"]
+		self.last_mode, self.last_mode_time = cached["last_mode"]
 		
-		self.last_mode = None
-		self.last_mode_time = None
+		# Симулируем торговлю в njit-ядре
+		balance, total_commission, trades, equity, counters = simulate(
+			prices, signal_codes, mode_codes, position_sizes, dynamic_sls, dynamic_tps,
+			times_ns, float(self.start_balance), build_params()
+		)
+		self.balance = balance
+		wins = int(counters[CNT_WINS])
+		losses = int(counters[CNT_LOSSES])
+		mr_trades = int(counters[CNT_MR_TRADES])
+		tf_trades = int(counters[CNT_TF_TRADES])
 		
-		for i in range(len(df)):
-			sub_df = df.iloc[:i+1]
-			if len(sub_df) < min_window:
-				signals.append({
-					"time": sub_df.index[-1],
-					"price": sub_df["close"].iloc[-1],
-					"signal": "HOLD",
-					"active_mode": "NONE",
-					"adx": 0
-				})
-				continue
-			
-			gen = SignalGenerator(sub_df)
-			gen.compute_indicators()
-			
-			# Вычисляем время в последнем режиме
-			if self.last_mode_time is not None and i > 0:
-				time_diff = (sub_df.index[-1] - sub_df.index[-2]).total_seconds() / 3600
-				self.last_mode_time += time_diff
-			
-			res = gen.generate_signal_hybrid(
-				last_mode=self.last_mode,
-				last_mode_time=self.last_mode_time if self.last_mode_time else 0
-			)
-			
-			# Отслеживаем переключения режимов
-			current_mode = res.get("active_mode")
-			if current_mode != self.last_mode and current_mode not in ["NONE", "TRANSITION"]:
-				self.mode_switches.append({
-					"time": sub_df.index[-1],
-					"from_mode": self.last_mode,
-					"to_mode": current_mode,
-					"adx": res.get("ADX", 0)
-				})
-				self.last_mode = current_mode
-				self.last_mode_time = 0
-			
-			signals.append({
-				"time": sub_df.index[-1],
-				"price": res["price"],
-				"signal": res["signal"],
-				"active_mode": res.get("active_mode", "NONE"),
-				"adx": res.get("ADX", 0),
-				"zscore": res.get("zscore", 0),
-				"rsi": res.get("RSI", 50),
-				"position_size_percent": res.get("position_size_percent", 0.5),
-				"dynamic_sl": res.get("dynamic_sl", None),
-				"dynamic_tp": res.get("dynamic_tp", None),
-				"falling_knife": res.get("falling_knife_detected", False)
-			})
-		
-		# Симулируем торговлю
-		self.balance = self.start_balance
-		self.position = 0.0
-		self.entry_price = None
-		self.entry_time = None
-		self.entry_mode = None
-		self.entry_sl = None
-		self.entry_tp = None
-		self.max_price = 0.0
-		self.trailing_active = False
-		self.trailing_aggressive_active = False
-		self.trades = []
-		self.equity_curve = []
-		
-		total_commission = 0.0
-		wins = 0
-		losses = 0
-		max_equity = self.start_balance
-		max_drawdown = 0.0
-		
-		mr_trades = 0
-		tf_trades = 0
-		
-		for i, sig in enumerate(signals):
-			current_time = sig["time"]
-			price = sig["price"]
-			signal = sig["signal"]
-			active_mode = sig["active_mode"]
-			
-			# Расчёт equity
-			if self.position > 0:
-				position_value = self.position * price
-				total_equity = self.balance + position_value
-			else:
-				total_equity = self.balance
-			
-			self.equity_curve.append({
-				"time": current_time,
-				"equity": total_equity,
-				"price": price,
-				"mode": active_mode
-			})
-			
-			# Обновляем max equity и drawdown
-			if total_equity > max_equity:
-				max_equity = total_equity
-			
-			current_dd = (max_equity - total_equity) / max_equity if max_equity > 0 else 0
-			if current_dd > max_drawdown:
-				max_drawdown = current_dd
-			
-			# Проверка выхода из позиции
-			if self.position > 0 and self.entry_price:
-				pnl_percent = (price - self.entry_price) / self.entry_price
-				hours_held = (current_time - self.entry_time).total_seconds() / 3600 if self.entry_time else 0
-				
-				# Обновляем максимальную цену для трейлинг стопа
-				if price > self.max_price:
-					self.max_price = price
-				
-				# v5.3: PARTIAL TAKE PROFIT (приоритет над trailing stop)
-				if USE_PARTIAL_TP and not self.partial_tp_taken and pnl_percent >= PARTIAL_TP_TRIGGER:
-					# Закрыть 50% позиции на +2%
-					partial_position = self.position * PARTIAL_TP_PERCENT
-					sell_value = partial_position * price
-					commission = sell_value * COMMISSION_RATE
-					total_commission += commission
-					self.balance += sell_value - commission
-					
-					self.trades.append({
-						"symbol": self.symbol,
-						"entry_time": self.entry_time,
-						"entry_price": self.entry_price,
-						"entry_mode": self.entry_mode,
-						"exit_time": current_time,
-						"exit_price": price,
-						"pnl_percent": pnl_percent * 100,
-						"pnl_usd": (sell_value - commission) - (self.entry_price * partial_position),
-						"reason": "PARTIAL_TP",
-						"hours_held": hours_held
-					})
-					
-					wins += 1
-					self.position -= partial_position
-					self.partial_tp_taken = True
-					self.breakeven_sl_active = True  # Активируем break-even SL
-					# НЕ continue - оставляем позицию открытой
-				
-				# v5.3: BREAK-EVEN STOP LOSS (после partial TP)
-				if self.breakeven_sl_active and price <= self.entry_price:
-					sell_value = self.position * price
-					commission = sell_value * COMMISSION_RATE
-					total_commission += commission
-					self.balance += sell_value - commission
-					
-					pnl_for_remaining = (price - self.entry_price) / self.entry_price
-					
-					self.trades.append({
-						"symbol": self.symbol,
-						"entry_time": self.entry_time,
-						"entry_price": self.entry_price,
-						"entry_mode": self.entry_mode,
-						"exit_time": current_time,
-						"exit_price": price,
-						"pnl_percent": pnl_for_remaining * 100,
-						"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-						"reason": "BREAKEVEN_SL",
-						"hours_held": hours_held
-					})
-					
-					# Не считаем loss, т.к. это breakeven
-					self.position = 0.0
-					self.entry_price = None
-					self.entry_mode = None
-					self.partial_tp_taken = False
-					self.breakeven_sl_active = False
-					continue
-				
-				# Трейлинг стоп (только для MR)
-				if self.entry_mode == "MEAN_REVERSION" and USE_TRAILING_STOP_MR:
-					# Агрессивный трейлинг (после +2%)
-					if not self.trailing_aggressive_active and pnl_percent >= MR_TRAILING_AGGRESSIVE_ACTIVATION:
-						self.trailing_aggressive_active = True
-					
-					# Обычный трейлинг (после +0.8%)
-					if not self.trailing_active and pnl_percent >= MR_TRAILING_ACTIVATION:
-						self.trailing_active = True
-					
-					# Проверяем агрессивный трейлинг (приоритет)
-					if self.trailing_aggressive_active:
-						trailing_drop = (self.max_price - price) / self.max_price
-						if trailing_drop >= MR_TRAILING_AGGRESSIVE_DISTANCE:
-							sell_value = self.position * price
-							commission = sell_value * COMMISSION_RATE
-							total_commission += commission
-							self.balance += sell_value - commission
-							
-							self.trades.append({
-								"symbol": self.symbol,
-								"entry_time": self.entry_time,
-								"entry_price": self.entry_price,
-								"entry_mode": self.entry_mode,
-								"exit_time": current_time,
-								"exit_price": price,
-								"pnl_percent": pnl_percent * 100,
-								"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-								"reason": "TRAILING_AGGRESSIVE",
-								"hours_held": hours_held
-							})
-							
-							if pnl_percent > 0:
-								wins += 1
-							else:
-								losses += 1
-							
-							self.position = 0.0
-							self.entry_price = None
-							self.entry_mode = None
-							self.trailing_active = False
-							self.trailing_aggressive_active = False
-							self.max_price = 0.0
-							continue
-					
-					# Проверяем обычный трейлинг
-					elif self.trailing_active:
-						trailing_drop = (self.max_price - price) / self.max_price
-						if trailing_drop >= MR_TRAILING_DISTANCE:
-							sell_value = self.position * price
-							commission = sell_value * COMMISSION_RATE
-							total_commission += commission
-							self.balance += sell_value - commission
-							
-							self.trades.append({
-								"symbol": self.symbol,
-								"entry_time": self.entry_time,
-								"entry_price": self.entry_price,
-								"entry_mode": self.entry_mode,
-								"exit_time": current_time,
-								"exit_price": price,
-								"pnl_percent": pnl_percent * 100,
-								"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-								"reason": "TRAILING_STOP",
-								"hours_held": hours_held
-							})
-							
-							if pnl_percent > 0:
-								wins += 1
-							else:
-								losses += 1
-							
-							self.position = 0.0
-							self.entry_price = None
-							self.entry_mode = None
-							self.trailing_active = False
-							self.trailing_aggressive_active = False
-						self.max_price = 0.0
-						continue
-				
-				# Используем динамический SL если доступен (для MR)
-				if self.entry_mode == "MEAN_REVERSION":
-					current_sl = self.entry_sl if self.entry_sl else MR_STOP_LOSS_PERCENT
-					# v5.3: Если partial TP взят, используем повышенный TP для остатка
-					if self.partial_tp_taken:
-						current_tp = PARTIAL_TP_REMAINING_TP
-					else:
-						current_tp = self.entry_tp if self.entry_tp else MR_TAKE_PROFIT_PERCENT
-					max_holding = MR_MAX_HOLDING_HOURS
-				else:  # TF
-					current_sl = 0.05  # 5% SL для TF
-					# v5.3: Если partial TP взят, используем повышенный TP для остатка
-					if self.partial_tp_taken:
-						current_tp = PARTIAL_TP_REMAINING_TP
-					else:
-						current_tp = 0.05  # 5% TP для TF
-					max_holding = MAX_HOLDING_HOURS
-				
-				# Стоп-лосс
-				if pnl_percent <= -current_sl:
-					sell_value = self.position * price
-					commission = sell_value * COMMISSION_RATE
-					total_commission += commission
-					self.balance += sell_value - commission
-					
-					self.trades.append({
-						"symbol": self.symbol,
-						"entry_time": self.entry_time,
-						"entry_price": self.entry_price,
-						"entry_mode": self.entry_mode,
-						"exit_time": current_time,
-						"exit_price": price,
-						"pnl_percent": pnl_percent * 100,
-						"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-						"reason": "STOP_LOSS" if not self.entry_sl else "DYNAMIC_SL",
-						"hours_held": hours_held
-					})
-					
-					losses += 1
-					self.position = 0.0
-					self.entry_price = None
-					self.entry_mode = None
-					self.entry_sl = None
-					self.entry_tp = None
-					self.trailing_active = False
-					self.trailing_aggressive_active = False
-					self.partial_tp_taken = False
-					self.breakeven_sl_active = False
-					self.max_price = 0.0
-					continue
-				
-				# Таймаут
-				if hours_held > max_holding:
-					sell_value = self.position * price
-					commission = sell_value * COMMISSION_RATE
-					total_commission += commission
-					self.balance += sell_value - commission
-					
-					self.trades.append({
-						"symbol": self.symbol,
-						"entry_time": self.entry_time,
-						"entry_price": self.entry_price,
-						"entry_mode": self.entry_mode,
-						"exit_time": current_time,
-						"exit_price": price,
-						"pnl_percent": pnl_percent * 100,
-						"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-						"reason": "TIMEOUT",
-						"hours_held": hours_held
-					})
-					
-					if pnl_percent > 0:
-						wins += 1
-					else:
-						losses += 1
-					
-					self.position = 0.0
-					self.entry_price = None
-					self.entry_mode = None
-					self.entry_sl = None
-					self.entry_tp = None
-					self.trailing_active = False
-					self.trailing_aggressive_active = False
-					self.partial_tp_taken = False
-					self.breakeven_sl_active = False
-					self.max_price = 0.0
-					continue
-				
-				# Тейк-профит или сигнал выхода
-				if pnl_percent >= current_tp or signal == "SELL":
-					sell_value = self.position * price
-					commission = sell_value * COMMISSION_RATE
-					total_commission += commission
-					self.balance += sell_value - commission
-					
-					exit_reason = "TAKE_PROFIT" if pnl_percent >= current_tp else "SIGNAL_EXIT"
-					
-					self.trades.append({
-						"symbol": self.symbol,
-						"entry_time": self.entry_time,
-						"entry_price": self.entry_price,
-						"entry_mode": self.entry_mode,
-						"exit_time": current_time,
-						"exit_price": price,
-						"pnl_percent": pnl_percent * 100,
-						"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-						"reason": exit_reason,
-						"hours_held": hours_held
-					})
-					
-					if pnl_percent > 0:
-						wins += 1
-					else:
-						losses += 1
-					
-					self.position = 0.0
-					self.entry_price = None
-					self.entry_mode = None
-					self.entry_sl = None
-					self.entry_tp = None
-					self.partial_tp_taken = False
-					self.breakeven_sl_active = False
-					continue
-			
-			# ВХОД (BUY)
-			if signal == "BUY" and self.position == 0:
-				position_size_percent = sig.get("position_size_percent", 0.5)
-				invest_amount = self.balance * position_size_percent
-				commission = invest_amount * COMMISSION_RATE
-				total_commission += commission
-				self.position = (invest_amount - commission) / price
-				self.entry_price = price
-				self.entry_time = current_time
-				self.entry_mode = active_mode
-				self.entry_sl = sig.get("dynamic_sl", None)
-				self.entry_tp = sig.get("dynamic_tp", None)
-				self.max_price = price
-				self.trailing_active = False
-				self.trailing_aggressive_active = False
-				self.balance -= invest_amount
-				
-				if active_mode == "MEAN_REVERSION":
-					mr_trades += 1
-				elif active_mode == "TREND_FOLLOWING":
-					tf_trades += 1
-		
-		# Закрываем открытую позицию
-		if self.position > 0:
-			final_price = signals[-1]["price"]
-			sell_value = self.position * final_price
-			commission = sell_value * COMMISSION_RATE
-			total_commission += commission
-			self.balance += sell_value - commission
-			
-			pnl_percent = (final_price - self.entry_price) / self.entry_price
-			hours_held = (signals[-1]["time"] - self.entry_time).total_seconds() / 3600
-			
-			self.trades.append({
-				"symbol": self.symbol,
-				"entry_time": self.entry_time,
-				"entry_price": self.entry_price,
-				"entry_mode": self.entry_mode,
-				"exit_time": signals[-1]["time"],
-				"exit_price": final_price,
-				"pnl_percent": pnl_percent * 100,
-				"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-				"reason": "FINAL",
-				"hours_held": hours_held
-			})
-			
-			if pnl_percent > 0:
-				wins += 1
-			else:
-				losses += 1
+		self.equity = equity
+		self.bar_prices = prices
+		self.bar_modes = mode_codes
+		self.trades = trades
+		self.bar_times = times
+		trades_count = trades.shape[1]
 		
 		# Расчёт метрик
 		total_return = ((self.balance - self.start_balance) / self.start_balance) * 100
-		win_rate = (wins / len(self.trades)) * 100 if len(self.trades) > 0 else 0
+		win_rate = (wins / trades_count) * 100 if trades_count > 0 else 0
 		
 		# Avg win/loss
-		winning_trades = [t for t in self.trades if t["pnl_percent"] > 0]
-		losing_trades = [t for t in self.trades if t["pnl_percent"] <= 0]
-		avg_win = np.mean([t["pnl_percent"] for t in winning_trades]) if winning_trades else 0
-		avg_loss = np.mean([t["pnl_percent"] for t in losing_trades]) if losing_trades else 0
+		pnl_pct = trades[TR_PNL_PCT]
+		winning_mask = pnl_pct > 0
+		avg_win = pnl_pct[winning_mask].mean() if winning_mask.any() else 0
+		avg_loss = pnl_pct[~winning_mask].mean() if (~winning_mask).any() else 0
 		
 		# Sharpe Ratio
-		if len(self.trades) > 1:
-			returns = [t["pnl_percent"] for t in self.trades]
-			sharpe = (np.mean(returns) / np.std(returns)) * np.sqrt(len(self.trades)) if np.std(returns) > 0 else 0
+		if trades_count > 1:
+			pnl_std = pnl_pct.std()
+			sharpe = (pnl_pct.mean() / pnl_std) * np.sqrt(trades_count) if pnl_std > 0 else 0
 		else:
 			sharpe = 0
 		
 		# Average holding time
-		avg_holding = np.mean([t["hours_held"] for t in self.trades]) if self.trades else 0
+		avg_holding = trades[TR_HOURS_HELD].mean() if trades_count else 0
 		
 		return {
 			"total_return": total_return,
 			"win_rate": win_rate,
-			"max_drawdown": max_drawdown * 100,
-			"trades_count": len(self.trades),
+			"max_drawdown": max_drawdown(equity, float(self.start_balance)) * 100,
+			"trades_count": trades_count,
 			"wins": wins,
 			"losses": losses,
 			"avg_win": avg_win,
@@ -560,34 +177,202 @@ class HybridBacktest:
 			"final_balance": self.balance,
 			"mr_trades": mr_trades,
 			"tf_trades": tf_trades,
-			"mode_switches": len(self.mode_switches)
+			"mode_switches": self.mode_switches.shape[1]
+		}
+	
+	def _generate_signals(self, df: pd.DataFrame) -> Dict[str, Any]:
+		"""
+		Гибридные сигналы по всей истории, упакованные в массивы для njit-ядра.
+		Возвращает {"arrays": (...), "times": DatetimeIndex, "mode_switches": массив SW_*,
+		"last_mode": (режим, время в режиме)}.
+		"""
+		n = len(df)
+		# Входы njit-ядра заполняются прямо в цикле; значения по умолчанию —
+		# те же, что у сигнала без соответствующего ключа
+		prices = np.empty(n, dtype=np.float64)
+		signal_codes = np.full(n, SIGNAL_HOLD, dtype=np.int8)
+		mode_codes = np.full(n, MODE_CODE_NONE, dtype=np.int8)
+		position_sizes = np.full(n, 0.5, dtype=np.float64)
+		# None (SL/TP режима) кодируется как 0.0
+		dynamic_sls = np.zeros(n, dtype=np.float64)
+		dynamic_tps = np.zeros(n, dtype=np.float64)
+		# Переключений не больше, чем свечей
+		mode_switches = np.empty((SWITCH_COLUMNS, n), dtype=np.float64)
+		n_switches = 0
+		last_mode_code = MODE_CODE_NONE
+		min_window = 50
+		
+		last_mode = None
+		last_mode_time = None
+		
+		# Индикаторы считаются один раз по всей истории; в цикле остаётся
+		# только машина состояний режимов (last_mode/last_mode_time)
+		gen = SignalGenerator(df)
+		gen.compute_indicators_batch()
+		times = gen.df.index
+		# Время свечей в int64 наносекундах (как в ядре) — без Timedelta на каждой свече
+		times_ns = np.ascontiguousarray(times.as_unit("ns").asi8, dtype=np.int64)
+		
+		# Прогрев: HOLD без режима по цене закрытия
+		warmup = min(min_window - 1, n)
+		prices[:warmup] = gen.df["close"].to_numpy(dtype=np.float64)[:warmup]
+		
+		for i in range(warmup, n):
+			# Вычисляем время в последнем режиме
+			if last_mode_time is not None and i > 0:
+				time_diff = (times_ns[i] - times_ns[i-1]) / 1e9 / 3600
+				last_mode_time += time_diff
+			
+			res = gen.generate_signal_hybrid_at(
+				i,
+				last_mode=last_mode,
+				last_mode_time=last_mode_time if last_mode_time else 0
+			)
+			
+			# Отслеживаем переключения режимов (NONE и TRANSITION — не режимы)
+			current_mode = res.get("active_mode")
+			current_mode_code = MODE_CODES.get(current_mode, MODE_CODE_NONE)
+			if current_mode_code > MODE_CODE_TRANSITION and current_mode_code != last_mode_code:
+				mode_switches[SW_BAR, n_switches] = i
+				mode_switches[SW_FROM_MODE, n_switches] = last_mode_code
+				mode_switches[SW_TO_MODE, n_switches] = current_mode_code
+				mode_switches[SW_ADX, n_switches] = res.get("ADX", 0)
+				n_switches += 1
+				last_mode = current_mode
+				last_mode_code = current_mode_code
+				last_mode_time = 0
+			
+			prices[i] = res["price"]
+			signal_codes[i] = SIGNAL_CODES[res["signal"]]
+			mode_codes[i] = MODE_CODES[res.get("active_mode", "NONE")]
+			position_sizes[i] = res.get("position_size_percent", 0.5)
+			dynamic_sls[i] = res.get("dynamic_sl") or 0.0
+			dynamic_tps[i] = res.get("dynamic_tp") or 0.0
+		
+		return {
+			"arrays": (prices, signal_codes, mode_codes, position_sizes, dynamic_sls, dynamic_tps, times_ns),
+			"times": times,
+			"mode_switches": mode_switches[:, :n_switches].copy(),
+			"last_mode": (last_mode, last_mode_time)
 		}
 	
+	@staticmethod
+	def _load_cached_signals(path: str) -> Optional[Dict[str, Any]]:
+		"""Сигналы из кэша (None, если кэша нет, он устарел или не читается)"""
+		try:
+			if time.time() - os.path.getmtime(path) > SIGNALS_CACHE_TTL:
+				return None
+			with open(path, "rb") as f:
+				return pickle.load(f)
+		except FileNotFoundError:
+			return None
+		except Exception as e:
+			print(f"Не удалось прочитать кэш сигналов {path}: {e}")
+			return None
+	
+	@staticmethod
+	def _save_cached_signals(path: str, cached: Dict[str, Any]) -> None:
+		"""Сохраняет сигналы в кэш (ошибки записи не прерывают бэктест)"""
+		try:
+			os.makedirs(SIGNALS_CACHE_DIR, exist_ok=True)
+			with open(path, "wb") as f:
+				pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+		except Exception as e:
+			print(f"Не удалось сохранить кэш сигналов {path}: {e}")
+		HybridBacktest._prune_cached_signals()
+	
+	@staticmethod
+	def _prune_cached_signals() -> None:
+		"""Удаляет файлы кэша сигналов старше SIGNALS_CACHE_TTL"""
+		try:
+			names = os.listdir(SIGNALS_CACHE_DIR)
+		except OSError:
+			return
+		now = time.time()
+		for name in names:
+			path = os.path.join(SIGNALS_CACHE_DIR, name)
+			try:
+				if now - os.path.getmtime(path) > SIGNALS_CACHE_TTL:
+					os.remove(path)
+			except OSError:
+				# Файл мог удалить параллельный бэктест
+				continue
+	
+	def trades_frame(self) -> pd.DataFrame:
+		"""Сделки в виде DataFrame (одна строка на сделку) — для вывода и анализа"""
+		trades = self.trades
+		entry_bars = trades[TR_ENTRY_BAR].astype(np.int64)
+		exit_bars = trades[TR_EXIT_BAR].astype(np.int64)
+		
+		return pd.DataFrame({
+			"symbol": self.symbol,
+			"entry_time": self.bar_times[entry_bars],
+			"entry_price": trades[TR_ENTRY_PRICE],
+			"entry_mode": MODE_NAMES[trades[TR_ENTRY_MODE].astype(np.int64)],
+			"exit_time": self.bar_times[exit_bars],
+			"exit_price": trades[TR_EXIT_PRICE],
+			"pnl_percent": trades[TR_PNL_PCT],
+			"pnl_usd": trades[TR_PNL_USD],
+			"reason": REASON_NAMES[trades[TR_REASON].astype(np.int64)],
+			"hours_held": trades[TR_HOURS_HELD]
+		})
+	
+	def equity_frame(self) -> pd.DataFrame:
+		"""Кривая equity в виде DataFrame (одна строка на свечу) — для графиков"""
+		return pd.DataFrame({
+			"time": self.bar_times,
+			"equity": self.equity,
+			"price": self.bar_prices,
+			"mode": MODE_NAMES[self.bar_modes.astype(np.int64)]
+		})
+	
+	def mode_switches_frame(self) -> pd.DataFrame:
+		"""Переключения режимов в виде DataFrame (одна строка на переключение)"""
+		switches = self.mode_switches
+		from_codes = switches[SW_FROM_MODE].astype(np.int64)
+		from_modes = MODE_NAMES[from_codes]
+		from_modes[from_codes == MODE_CODE_NONE] = None
+		return pd.DataFrame({
+			"time": self.bar_times[switches[SW_BAR].astype(np.int64)],
+			"from_mode": pd.Series(from_modes, dtype=object),  # None для первого переключения
+			"to_mode": MODE_NAMES[switches[SW_TO_MODE].astype(np.int64)],
+			"adx": switches[SW_ADX]
+		})
+	
 	def save_trades_to_csv(self, filename: str):
 		"""Сохраняет сделки в CSV"""
-		if not self.trades:
+		if self.trades.shape[1] == 0:
 			print(f"No trades to save")
 			return
 		
-		with open(filename, 'w', newline='') as f:
-			writer = csv.DictWriter(f, fieldnames=self.trades[0].keys())
-			writer.writeheader()
-			writer.writerows(self.trades)
+		self.trades_frame().to_csv(filename, index=False)
 		
 		print(f"CSV saved: {filename}")
 	
 	def plot_equity_curve(self, save_path: str = "equity_curve_hybrid.png"):
 		"""Строит график equity curve с отметками режимов"""
-		if not self.equity_curve:
+		if self.equity.size == 0:
 			print("No equity data to plot")
 			return
 		
-		df_equity = pd.DataFrame(self.equity_curve)
+		# matplotlib нужен только для графика: импорт здесь, без GUI-бэкенда
+		import matplotlib
+		matplotlib.use("Agg")
+		import matplotlib.pyplot as plt
+		
+		df_equity = self.equity_frame()
+		
+		# Длинные серии прореживаются: на графике шириной ~2000 px лишние точки не видны
+		x = self.bar_times.as_unit("ns").asi8.astype(np.float64)
+		equity_idx = lttb_indices(x, self.equity, PLOT_MAX_POINTS)
+		price_idx = lttb_indices(x, self.bar_prices, PLOT_MAX_POINTS)
+		df_eq_plot = df_equity.iloc[equity_idx]
+		df_price_plot = df_equity.iloc[price_idx]
 		
 		fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 8), sharex=True)
 		
 		# График equity
-		ax1.plot(df_equity["time"], df_equity["equity"], label="Equity", color="green", linewidth=2)
+		ax1.plot(df_eq_plot["time"], df_eq_plot["equity"], label="Equity", color="green", linewidth=2)
 		ax1.axhline(y=self.start_balance, color="gray", linestyle="--", label="Start Balance")
 		ax1.set_ylabel("Balance (USD)", fontsize=12)
 		ax1.set_title(f"Hybrid Strategy Equity Curve - {self.symbol}", fontsize=14, fontweight="bold")
@@ -595,14 +380,16 @@ class HybridBacktest:
 		ax1.grid(True, alpha=0.3)
 		
 		# График цены с отметками режимов
-		ax2.plot(df_equity["time"], df_equity["price"], label="Price", color="blue", alpha=0.7)
+		ax2.plot(df_price_plot["time"], df_price_plot["price"], label="Price", color="blue", alpha=0.7)
 		
 		# Отмечаем переключения режимов
-		for switch in self.mode_switches:
-			color = "orange" if switch["to_mode"] == "MEAN_REVERSION" else "purple"
-			ax2.axvline(x=switch["time"], color=color, linestyle=":", alpha=0.5)
-			ax2.text(switch["time"], df_equity["price"].max() * 0.95, 
-					f"→ {switch['to_mode'][:2]}", 
+		switch_times = self.bar_times[self.mode_switches[SW_BAR].astype(np.int64)]
+		price_max = self.bar_prices.max()
+		for switch_time, to_code in zip(switch_times, self.mode_switches[SW_TO_MODE].astype(np.int64)):
+			color = "orange" if to_code == MODE_CODE_MEAN_REVERSION else "purple"
+			ax2.axvline(x=switch_time, color=color, linestyle=":", alpha=0.5)
+			ax2.text(switch_time, price_max * 0.95, 
+					f"→ {MODE_NAMES[to_code][:2]}", 
 					rotation=90, fontsize=8, color=color)
 		
 		ax2.set_ylabel("Price (USDT)", fontsize=12)
@@ -616,7 +403,8 @@ class HybridBacktest:
 		print(f"Chart saved: {save_path}")
 
 
-async def main():
+async def main(plot: bool = False):
+	"""plot — строить график equity (python backtest_hybrid.py --plot)"""
 	# Параметры бэктеста
 	symbol = "BTCUSDT"
 	interval = "1h"
@@ -655,9 +443,10 @@ async def main():
 	# Сохраняем CSV
 	backtest.save_trades_to_csv("hybrid_trades.csv")
 	
-	# Создаём графики
-	print("\nCreating charts...")
-	backtest.plot_equity_curve()
+	# Создаём графики (по запросу: для прогонов параметров не нужны)
+	if plot:
+		print("\nCreating charts...")
+		backtest.plot_equity_curve()
 	
 	# Выводим результаты
 	print("\n" + "="*80)
@@ -678,10 +467,13 @@ async def main():
 	
 	print("\nBacktest completed!")
 	print(f"CSV file: hybrid_trades.csv")
-	print(f"Chart: equity_curve_hybrid.png")
+	if plot:
+		print(f"Chart: equity_curve_hybrid.png")
 	print("="*80)
 
 
 if __name__ == "__main__":
-	asyncio.run(main())
+	import sys
+	
+	asyncio.run(main(plot="--plot" in sys.argv[1:]))
 
@@ -0,0 +1,400 @@
+"""
+Ядро гибридного бэктеста: пошаговая симуляция торговли на NumPy-массивах.
+Компилируется Numba (@njit), без numba работает как обычный Python.
+
+Логика повторяет торговый цикл HybridBacktest.run_backtest (backtest_hybrid.py):
+partial TP, break-even SL, трейлинг стоп для MR, SL/TP/таймаут по режиму входа.
+"""
+import numpy as np
+from numba_compat import njit
+from signal_generator import SIGNAL_BUY, SIGNAL_SELL
+from config import (
+	COMMISSION_RATE,
+	MR_TAKE_PROFIT_PERCENT, MR_STOP_LOSS_PERCENT, MR_MAX_HOLDING_HOURS,
+	USE_TRAILING_STOP_MR, MR_TRAILING_ACTIVATION, MR_TRAILING_DISTANCE,
+	MR_TRAILING_AGGRESSIVE_ACTIVATION, MR_TRAILING_AGGRESSIVE_DISTANCE,
+	MAX_HOLDING_HOURS,
+	USE_PARTIAL_TP, PARTIAL_TP_PERCENT, PARTIAL_TP_TRIGGER, PARTIAL_TP_REMAINING_TP,
+	MODE_MEAN_REVERSION, MODE_TREND_FOLLOWING, MODE_TRANSITION
+)
+
+# SL/TP для Trend Following (фиксированные)
+TF_STOP_LOSS_PERCENT = 0.05
+TF_TAKE_PROFIT_PERCENT = 0.05
+
+# Коды режимов (active_mode сигнала)
+MODE_CODE_NONE = 0
+MODE_CODE_TRANSITION = 1
+MODE_CODE_MEAN_REVERSION = 2
+MODE_CODE_TREND_FOLLOWING = 3
+MODE_CODE_COUNT = 4
+MODE_CODES = {
+	"NONE": MODE_CODE_NONE,
+	MODE_TRANSITION: MODE_CODE_TRANSITION,
+	MODE_MEAN_REVERSION: MODE_CODE_MEAN_REVERSION,
+	MODE_TREND_FOLLOWING: MODE_CODE_TREND_FOLLOWING,
+}
+# Обратное отображение: MODE_NAMES[code]
+MODE_NAMES = np.array(["NONE", MODE_TRANSITION, MODE_MEAN_REVERSION, MODE_TREND_FOLLOWING], dtype=object)
+
+# Причины выхода из позиции
+REASON_NONE = -1         # выхода нет (внутри ядра)
+REASON_PARTIAL_TP = 0
+REASON_BREAKEVEN_SL = 1
+REASON_TRAILING_AGGRESSIVE = 2
+REASON_TRAILING_STOP = 3
+REASON_STOP_LOSS = 4
+REASON_DYNAMIC_SL = 5
+REASON_TIMEOUT = 6
+REASON_TAKE_PROFIT = 7
+REASON_SIGNAL_EXIT = 8
+REASON_FINAL = 9
+# Обратное отображение: REASON_NAMES[code]
+REASON_NAMES = np.array([
+	"PARTIAL_TP", "BREAKEVEN_SL", "TRAILING_AGGRESSIVE", "TRAILING_STOP", "STOP_LOSS",
+	"DYNAMIC_SL", "TIMEOUT", "TAKE_PROFIT", "SIGNAL_EXIT", "FINAL",
+], dtype=object)
+
+# Колонки массива сделок (struct-of-arrays: trades[TR_*] — колонка по всем сделкам)
+TR_ENTRY_BAR = 0     # индекс свечи входа
+TR_EXIT_BAR = 1      # индекс свечи выхода
+TR_ENTRY_PRICE = 2
+TR_EXIT_PRICE = 3
+TR_ENTRY_MODE = 4    # код режима входа (MODE_CODE_*)
+TR_PNL_PCT = 5       # изменение цены от входа, %
+TR_PNL_USD = 6
+TR_REASON = 7        # код причины выхода (REASON_*)
+TR_HOURS_HELD = 8
+TRADE_COLUMNS = 9
+
+# Колонки массива переключений режимов (как у сделок: switches[SW_*] — колонка)
+SW_BAR = 0           # индекс свечи переключения
+SW_FROM_MODE = 1     # код прежнего режима (MODE_CODE_NONE — режима ещё не было)
+SW_TO_MODE = 2       # код нового режима
+SW_ADX = 3
+SWITCH_COLUMNS = 4
+
+# Счётчики
+CNT_WINS = 0
+CNT_LOSSES = 1
+CNT_MR_TRADES = 2    # входы в режиме Mean Reversion
+CNT_TF_TRADES = 3    # входы в режиме Trend Following
+COUNTERS_COUNT = 4
+
+# Параметры симуляции (индексы в массиве params)
+P_COMMISSION = 0
+P_MR_STOP_LOSS = 1
+P_MR_TAKE_PROFIT = 2
+P_MR_MAX_HOLDING = 3
+P_TF_STOP_LOSS = 4
+P_TF_TAKE_PROFIT = 5
+P_TF_MAX_HOLDING = 6
+P_USE_TRAILING_MR = 7
+P_TRAILING_ACTIVATION = 8
+P_TRAILING_DISTANCE = 9
+P_TRAILING_AGG_ACTIVATION = 10
+P_TRAILING_AGG_DISTANCE = 11
+P_USE_PARTIAL_TP = 12
+P_PARTIAL_TP_PERCENT = 13
+P_PARTIAL_TP_TRIGGER = 14
+P_PARTIAL_TP_REMAINING_TP = 15
+PARAMS_COUNT = 16
+
+
+def build_params() -> np.ndarray:
+	"""
+	Упаковывает настройки из config в массив для simulate().
+	Значения передаются аргументом, а не глобалами: кэш Numba
+	не должен «замораживать» старые значения config.
+	"""
+	params = np.zeros(PARAMS_COUNT, dtype=np.float64)
+	params[P_COMMISSION] = COMMISSION_RATE
+	params[P_MR_STOP_LOSS] = MR_STOP_LOSS_PERCENT
+	params[P_MR_TAKE_PROFIT] = MR_TAKE_PROFIT_PERCENT
+	params[P_MR_MAX_HOLDING] = MR_MAX_HOLDING_HOURS
+	params[P_TF_STOP_LOSS] = TF_STOP_LOSS_PERCENT
+	params[P_TF_TAKE_PROFIT] = TF_TAKE_PROFIT_PERCENT
+	params[P_TF_MAX_HOLDING] = MAX_HOLDING_HOURS
+	params[P_USE_TRAILING_MR] = 1.0 if USE_TRAILING_STOP_MR else 0.0
+	params[P_TRAILING_ACTIVATION] = MR_TRAILING_ACTIVATION
+	params[P_TRAILING_DISTANCE] = MR_TRAILING_DISTANCE
+	params[P_TRAILING_AGG_ACTIVATION] = MR_TRAILING_AGGRESSIVE_ACTIVATION
+	params[P_TRAILING_AGG_DISTANCE] = MR_TRAILING_AGGRESSIVE_DISTANCE
+	params[P_USE_PARTIAL_TP] = 1.0 if USE_PARTIAL_TP else 0.0
+	params[P_PARTIAL_TP_PERCENT] = PARTIAL_TP_PERCENT
+	params[P_PARTIAL_TP_TRIGGER] = PARTIAL_TP_TRIGGER
+	params[P_PARTIAL_TP_REMAINING_TP] = PARTIAL_TP_REMAINING_TP
+	return params
+
+
+@njit(cache=True)
+def _record_trade(trades, k, entry_bar, exit_bar, entry_price, exit_price, entry_mode, pnl_pct, pnl_usd, reason, hours_held):
+	"""Записывает сделку k в колонки массива сделок"""
+	trades[TR_ENTRY_BAR, k] = entry_bar
+	trades[TR_EXIT_BAR, k] = exit_bar
+	trades[TR_ENTRY_PRICE, k] = entry_price
+	trades[TR_EXIT_PRICE, k] = exit_price
+	trades[TR_ENTRY_MODE, k] = entry_mode
+	trades[TR_PNL_PCT, k] = pnl_pct
+	trades[TR_PNL_USD, k] = pnl_usd
+	trades[TR_REASON, k] = reason
+	trades[TR_HOURS_HELD, k] = hours_held
+
+
+@njit(cache=True)
+def _close_position(trades, k, entry_bar, exit_bar, entry_price, exit_price, entry_mode, quantity, commission_rate, reason, hours_held):
+	"""
+	Продаёт quantity по exit_price и записывает сделку k.
+	Возвращает (выручка за вычетом комиссии, комиссия).
+	"""
+	sell_value = quantity * exit_price
+	commission = sell_value * commission_rate
+	proceeds = sell_value - commission
+	pnl_percent = (exit_price - entry_price) / entry_price
+	_record_trade(
+		trades, k, entry_bar, exit_bar, entry_price, exit_price, entry_mode, pnl_percent * 100,
+		proceeds - (entry_price * quantity), reason, hours_held
+	)
+	return proceeds, commission
+
+
+# Явная сигнатура: simulate компилируется при импорте, а cache=True сохраняет
+# машинный код на диск (__pycache__), поэтому повторные запуски не ждут JIT.
+# Типы аргументов должны совпадать с сигнатурой (см. HybridBacktest.run_backtest).
+SIMULATE_SIGNATURE = (
+	"Tuple((f8, f8, f8[:, :], f8[:], i8[:]))"
+	"(f8[:], i1[:], i1[:], f8[:], f8[:], f8[:], i8[:], f8, f8[:])"
+)
+
+
+@njit(SIMULATE_SIGNATURE, cache=True)
+def simulate(prices, signals, modes, position_sizes, dynamic_sls, dynamic_tps, times_ns, start_balance, params):
+	"""
+	Пошаговая симуляция торговли по заранее посчитанным гибридным сигналам.
+
+	Параметры:
+	- prices: float64-массив цен закрытия
+	- signals: int8-коды сигналов (SIGNAL_BUY / SIGNAL_SELL / HOLD)
+	- modes: int8-коды активного режима (MODE_CODE_*)
+	- position_sizes: доля баланса на вход
+	- dynamic_sls, dynamic_tps: динамические SL/TP сигнала (0.0 — нет, берутся SL/TP режима)
+	- times_ns: время свечей, int64 наносекунды
+	- start_balance: начальный баланс (float)
+	- params: float64-массив из build_params()
+
+	Возвращает (balance, total_commission, trades, equity, counters):
+	- trades: массив сделок формы (TRADE_COLUMNS, число сделок) в порядке закрытия;
+	  trades[TR_*] — непрерывная колонка по всем сделкам
+	- equity: баланс с учётом открытой позиции на каждой свече
+	- counters: прибыльные/убыточные закрытия и входы MR/TF (индексы CNT_*)
+	"""
+	n = prices.shape[0]
+	commission_rate = params[P_COMMISSION]
+
+	# На свече не больше двух закрытий (partial TP + выход) и финальное закрытие
+	trades = np.zeros((TRADE_COLUMNS, 2 * n + 1), dtype=np.float64)
+	n_trades = 0
+	equity = np.empty(n, dtype=np.float64)
+	counters = np.zeros(COUNTERS_COUNT, dtype=np.int64)
+
+	balance = start_balance
+	total_commission = 0.0
+
+	# SL/TP/таймаут по коду режима входа (все режимы, кроме MR, — параметры TF)
+	sl_table = np.full(MODE_CODE_COUNT, params[P_TF_STOP_LOSS])
+	tp_table = np.full(MODE_CODE_COUNT, params[P_TF_TAKE_PROFIT])
+	holding_table = np.full(MODE_CODE_COUNT, params[P_TF_MAX_HOLDING])
+	sl_table[MODE_CODE_MEAN_REVERSION] = params[P_MR_STOP_LOSS]
+	tp_table[MODE_CODE_MEAN_REVERSION] = params[P_MR_TAKE_PROFIT]
+	holding_table[MODE_CODE_MEAN_REVERSION] = params[P_MR_MAX_HOLDING]
+
+	# Состояние позиции (entry_price = 0.0 — входа нет)
+	position = 0.0
+	entry_price = 0.0
+	entry_bar = 0
+	entry_time_ns = 0
+	entry_mode = MODE_CODE_NONE
+	entry_sl = 0.0
+	entry_tp = 0.0
+	trade_sl = 0.0  # SL/TP/таймаут сделки, выбираются при входе
+	trade_tp = 0.0
+	max_holding = 0.0
+	max_price = 0.0
+	trailing_active = False
+	trailing_aggressive_active = False
+	partial_tp_taken = False
+	breakeven_sl_active = False
+
+	for i in range(n):
+		price = prices[i]
+		signal = signals[i]
+
+		# Расчёт equity (просадка считается по массиву после симуляции, см. max_drawdown)
+		if position > 0:
+			equity[i] = balance + position * price
+		else:
+			equity[i] = balance
+
+		# Проверка выхода из позиции
+		if position > 0 and entry_price != 0.0:
+			pnl_percent = (price - entry_price) / entry_price
+			hours_held = (times_ns[i] - entry_time_ns) / 1e9 / 3600
+
+			# Обновляем максимальную цену для трейлинг стопа
+			if price > max_price:
+				max_price = price
+
+			# v5.3: PARTIAL TAKE PROFIT (приоритет над trailing stop)
+			if params[P_USE_PARTIAL_TP] > 0 and not partial_tp_taken and pnl_percent >= params[P_PARTIAL_TP_TRIGGER]:
+				partial_position = position * params[P_PARTIAL_TP_PERCENT]
+				proceeds, commission = _close_position(
+					trades, n_trades, entry_bar, i, entry_price, price, entry_mode,
+					partial_position, commission_rate, REASON_PARTIAL_TP, hours_held
+				)
+				n_trades += 1
+				total_commission += commission
+				balance += proceeds
+
+				counters[CNT_WINS] += 1
+				position -= partial_position
+				partial_tp_taken = True
+				breakeven_sl_active = True  # Активируем break-even SL
+				# НЕ continue - оставляем позицию открытой
+
+			# Определяем причину полного выхода (REASON_NONE — позиция остаётся)
+			exit_reason = REASON_NONE
+
+			# v5.3: BREAK-EVEN STOP LOSS (после partial TP)
+			if breakeven_sl_active and price <= entry_price:
+				exit_reason = REASON_BREAKEVEN_SL
+
+			# Трейлинг стоп (только для MR)
+			elif entry_mode == MODE_CODE_MEAN_REVERSION and params[P_USE_TRAILING_MR] > 0:
+				# Агрессивный трейлинг
+				if not trailing_aggressive_active and pnl_percent >= params[P_TRAILING_AGG_ACTIVATION]:
+					trailing_aggressive_active = True
+
+				# Обычный трейлинг
+				if not trailing_active and pnl_percent >= params[P_TRAILING_ACTIVATION]:
+					trailing_active = True
+
+				# Проверяем агрессивный трейлинг (приоритет)
+				if trailing_aggressive_active:
+					trailing_drop = (max_price - price) / max_price
+					if trailing_drop >= params[P_TRAILING_AGG_DISTANCE]:
+						exit_reason = REASON_TRAILING_AGGRESSIVE
+
+				# Проверяем обычный трейлинг
+				elif trailing_active:
+					trailing_drop = (max_price - price) / max_price
+					if trailing_drop >= params[P_TRAILING_DISTANCE]:
+						exit_reason = REASON_TRAILING_STOP
+
+			if exit_reason == REASON_NONE:
+				# v5.3: Если partial TP взят, используем повышенный TP для остатка
+				if partial_tp_taken:
+					current_tp = params[P_PARTIAL_TP_REMAINING_TP]
+				else:
+					current_tp = trade_tp
+
+				if pnl_percent <= -trade_sl:
+					exit_reason = REASON_STOP_LOSS if entry_sl == 0.0 else REASON_DYNAMIC_SL
+				elif hours_held > max_holding:
+					exit_reason = REASON_TIMEOUT
+				elif pnl_percent >= current_tp:
+					exit_reason = REASON_TAKE_PROFIT
+				elif signal == SIGNAL_SELL:
+					exit_reason = REASON_SIGNAL_EXIT
+
+			# Полный выход: одна ветка для всех причин
+			if exit_reason != REASON_NONE:
+				proceeds, commission = _close_position(
+					trades, n_trades, entry_bar, i, entry_price, price, entry_mode,
+					position, commission_rate, exit_reason, hours_held
+				)
+				n_trades += 1
+				total_commission += commission
+				balance += proceeds
+
+				# Break-even не считаем ни прибылью, ни убытком; стоп-лосс — всегда убыток
+				if exit_reason == REASON_BREAKEVEN_SL:
+					pass
+				elif pnl_percent > 0 and exit_reason != REASON_STOP_LOSS and exit_reason != REASON_DYNAMIC_SL:
+					counters[CNT_WINS] += 1
+				else:
+					counters[CNT_LOSSES] += 1
+
+				position = 0.0
+				entry_price = 0.0
+				entry_mode = MODE_CODE_NONE
+				entry_sl = 0.0
+				entry_tp = 0.0
+				trailing_active = False
+				trailing_aggressive_active = False
+				max_price = 0.0
+				partial_tp_taken = False
+				breakeven_sl_active = False
+				continue
+
+		# ВХОД (BUY)
+		if signal == SIGNAL_BUY and position == 0:
+			invest_amount = balance * position_sizes[i]
+			commission = invest_amount * commission_rate
+			total_commission += commission
+			position = (invest_amount - commission) / price
+			entry_price = price
+			entry_bar = i
+			entry_time_ns = times_ns[i]
+			entry_mode = modes[i]
+			entry_sl = dynamic_sls[i]
+			entry_tp = dynamic_tps[i]
+			# Используем динамический SL/TP если доступен (для MR)
+			trade_sl = sl_table[entry_mode]
+			trade_tp = tp_table[entry_mode]
+			max_holding = holding_table[entry_mode]
+			if entry_mode == MODE_CODE_MEAN_REVERSION:
+				if entry_sl != 0.0:
+					trade_sl = entry_sl
+				if entry_tp != 0.0:
+					trade_tp = entry_tp
+			max_price = price
+			trailing_active = False
+			trailing_aggressive_active = False
+			balance -= invest_amount
+
+			if entry_mode == MODE_CODE_MEAN_REVERSION:
+				counters[CNT_MR_TRADES] += 1
+			elif entry_mode == MODE_CODE_TREND_FOLLOWING:
+				counters[CNT_TF_TRADES] += 1
+
+	# Закрываем открытую позицию
+	if position > 0:
+		final_price = prices[n - 1]
+		pnl_percent = (final_price - entry_price) / entry_price
+		hours_held = (times_ns[n - 1] - entry_time_ns) / 1e9 / 3600
+		proceeds, commission = _close_position(
+			trades, n_trades, entry_bar, n - 1, entry_price, final_price, entry_mode,
+			position, commission_rate, REASON_FINAL, hours_held
+		)
+		n_trades += 1
+		total_commission += commission
+		balance += proceeds
+
+		if pnl_percent > 0:
+			counters[CNT_WINS] += 1
+		else:
+			counters[CNT_LOSSES] += 1
+
+	return balance, total_commission, trades[:, :n_trades], equity, counters
+
+
+def max_drawdown(equity: np.ndarray, start_balance: float) -> float:
+	"""
+	Максимальная просадка (доля от пика) по кривой equity из simulate().
+	Пик — накопленный максимум equity, начиная со start_balance.
+	"""
+	if equity.size == 0:
+		return 0.0
+	peaks = np.maximum.accumulate(np.maximum(equity, start_balance))
+	drawdowns = np.divide(peaks - equity, peaks, out=np.zeros_like(equity), where=peaks > 0)
+	return float(drawdowns.max())
@@ -11,21 +11,23 @@ import pandas as pd
 import numpy as np
 import aiohttp
 import asyncio
-import csv
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Any
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from data_provider import DataProvider
-from signal_generator import SignalGenerator
-from config import (
-	COMMISSION_RATE, INITIAL_BALANCE,
-	# Mean Reversion параметры v4
-	MR_TAKE_PROFIT_PERCENT, MR_STOP_LOSS_PERCENT, MR_MAX_HOLDING_HOURS,
-	# Трейлинг стоп v4 (двухуровневый)
-	USE_TRAILING_STOP_MR, MR_TRAILING_ACTIVATION, MR_TRAILING_DISTANCE,
-	MR_TRAILING_AGGRESSIVE_ACTIVATION, MR_TRAILING_AGGRESSIVE_DISTANCE
+from typing import Dict, List, Tuple, Any, Optional
+from backtest import create_backtest_session, fetch_backtest_data, lttb_indices, PLOT_MAX_POINTS
+from signal_generator import SignalGenerator, SIGNAL_CODES, SIGNAL_HOLD
+from backtest_hybrid_core import max_drawdown
+from backtest_mean_reversion_core import (
+	simulate, build_params, REASON_NAMES, TRADE_COLUMNS, CNT_WINS, CNT_LOSSES,
+	TR_ENTRY_BAR, TR_EXIT_BAR, TR_ENTRY_PRICE, TR_ENTRY_ZSCORE, TR_EXIT_PRICE,
+	TR_PNL_PCT, TR_PNL_USD, TR_REASON, TR_HOURS_HELD
 )
+from config import INITIAL_BALANCE
+
+# PNG графиков: быстрое сжатие (файл чуть больше, сохранение заметно быстрее)
+PLOT_PNG_OPTIONS = {"compress_level": 1}
+# Z-score vs P&L: при большем числе сделок scatter заменяется на hexbin
+PLOT_SCATTER_MAX_TRADES = 500
 
 class MeanReversionBacktest:
 	"""Бэктест для mean reversion стратегии"""
@@ -45,30 +47,37 @@ class MeanReversionBacktest:
 		self.max_price = 0.0  # Для трейлинг стопа
 		self.trailing_active = False  # Флаг активации обычного трейлинг стопа
 		self.trailing_aggressive_active = False  # v4: Флаг агрессивного трейлинга
-		self.trades = []
-		self.equity_curve = []
-		self.zscore_pnl_data = []  # Для scatter графика
+		# Результаты последнего прогона (struct-of-arrays, см. trades_frame/equity_frame)
+		self.trades = np.zeros((TRADE_COLUMNS, 0), dtype=np.float64)  # колонки TR_*
+		self.bar_times = pd.DatetimeIndex([])
+		self.equity = np.zeros(0, dtype=np.float64)
+		self.bar_prices = np.zeros(0, dtype=np.float64)
+		
+	async def fetch_data(self, session: Optional[aiohttp.ClientSession] = None) -> pd.DataFrame:
+		"""
+		Получаем данные с биржи.
+		
+		session — общая HTTP-сессия (если не передана, создаётся на время загрузки).
+		Свечи кэшируются в памяти и на диске (backtest.fetch_backtest_data),
+		поэтому повторные запуски с теми же параметрами не ходят в API.
+		"""
+		if session is None:
+			async with create_backtest_session() as own_session:
+				return await self.fetch_data(session=own_session)
 		
-	async def fetch_data(self) -> pd.DataFrame:
-		"""Получаем данные с Binance"""
 		candles_per_hour = int(60 / int(self.interval.replace('m',''))) if 'm' in self.interval else 1
 		required_candles = self.period_days * 24 * candles_per_hour
 		
-		# Binance API лимит обычно 1000-1500, но для большого периода берём максимум
-		# Если требуется больше - будет меньше дней, чем запросили
-		limit = min(required_candles, 1500)
+		# Больше лимита одного запроса API — DataProvider загружает свечи страницами
+		df = await fetch_backtest_data(session, self.symbol, self.interval, required_candles)
 		
-		async with aiohttp.ClientSession() as session:
-			provider = DataProvider(session)
-			df = await provider.fetch_klines(symbol=self.symbol, interval=self.interval, limit=limit)
-			
-			if df is not None and not df.empty:
-				# Пересчитываем реальное количество дней
-				actual_days = len(df) / (24 * candles_per_hour)
-				if actual_days < self.period_days:
-					print(f"NOTE: Loaded {actual_days:.1f} days instead of {self.period_days} (API limit)")
-			
-			return df
+		if df is not None and not df.empty:
+			# Пересчитываем реальное количество дней
+			actual_days = len(df) / (24 * candles_per_hour)
+			if actual_days < self.period_days:
+				print(f"NOTE: Loaded {actual_days:.1f} days instead of {self.period_days} (history is shorter)")
+		
+		return df
 	
 	def run_backtest(self, df: pd.DataFrame, strategy: str = "mean_reversion") -> Dict[str, Any]:
 		"""
@@ -79,350 +88,27 @@ class MeanReversionBacktest:
 			print(f"Нет данных для {self.symbol}")
 			return None
 		
-		# Генерируем сигналы
-		signals = []
-		min_window = 50  # Для Z-score нужно 50 свечей
-		
-		for i in range(len(df)):
-			sub_df = df.iloc[:i+1]
-			if len(sub_df) < min_window:
-				signals.append({
-					"time": sub_df.index[-1],
-					"price": sub_df["close"].iloc[-1],
-					"signal": "HOLD",
-					"zscore": 0,
-					"rsi": 50,
-					"adx": 0
-				})
-				continue
-			
-			gen = SignalGenerator(sub_df)
-			gen.compute_indicators()
-			
-			if strategy == "mean_reversion":
-				res = gen.generate_signal_mean_reversion()
-			else:
-				res = gen.generate_signal()
-			
-			signals.append({
-				"time": sub_df.index[-1],
-				"price": res["price"],
-				"signal": res["signal"],
-				"zscore": res.get("zscore", 0),
-				"rsi": res.get("RSI", 50),
-				"adx": res.get("ADX", 0),
-				"position_size_percent": res.get("position_size_percent", 0.5),
-				"dynamic_sl": res.get("dynamic_sl", None),
-				"dynamic_tp": res.get("dynamic_tp", None),  # v4: Динамический TP
-				"falling_knife": res.get("falling_knife_detected", False)
-			})
-		
-		# Симулируем торговлю
-		self.balance = self.start_balance
+		# Сигналы как массивы NumPy (цена, код сигнала, Z-score, размер позиции, SL/TP)
+		prices, signal_codes, zscores, position_sizes, dynamic_sls, dynamic_tps = self._generate_signals(df, strategy)
+		times = df.index
+		# Время свечей в int64 наносекундах — без Timedelta на каждой свече
+		times_ns = np.ascontiguousarray(times.as_unit("ns").asi8, dtype=np.int64)
+		
+		# Симулируем торговлю (njit-ядро, см. backtest_mean_reversion_core.simulate)
+		balance, total_commission, trades, equity, counters = simulate(
+			prices, signal_codes, zscores, position_sizes, dynamic_sls, dynamic_tps,
+			times_ns, float(self.start_balance), build_params()
+		)
+		wins = int(counters[CNT_WINS])
+		losses = int(counters[CNT_LOSSES])
+		
+		self.balance = balance
 		self.position = 0.0
-		self.entry_price = None
-		self.entry_time = None
-		self.entry_zscore = None
-		self.entry_sl = None
-		self.entry_tp = None  # v4
-		self.max_price = 0.0
-		self.trailing_active = False
-		self.trailing_aggressive_active = False  # v4
-		self.trades = []
-		self.equity_curve = []
-		
-		total_commission = 0.0
-		wins = 0
-		losses = 0
-		max_equity = self.start_balance
-		max_drawdown = 0.0
-		
-		for i, sig in enumerate(signals):
-			current_time = sig["time"]
-			price = sig["price"]
-			signal = sig["signal"]
-			zscore = sig["zscore"]
-			
-			# Расчёт equity
-			if self.position > 0:
-				position_value = self.position * price
-				total_equity = self.balance + position_value
-			else:
-				total_equity = self.balance
-			
-			self.equity_curve.append({
-				"time": current_time,
-				"equity": total_equity,
-				"price": price
-			})
-			
-			# Обновляем max equity и drawdown
-			if total_equity > max_equity:
-				max_equity = total_equity
-			
-			current_dd = (max_equity - total_equity) / max_equity if max_equity > 0 else 0
-			if current_dd > max_drawdown:
-				max_drawdown = current_dd
-			
-			# Проверка выхода из позиции
-			if self.position > 0 and self.entry_price:
-				pnl_percent = (price - self.entry_price) / self.entry_price
-				hours_held = (current_time - self.entry_time).total_seconds() / 3600 if self.entry_time else 0
-				
-				# Обновляем максимальную цену для трейлинг стопа
-				if price > self.max_price:
-					self.max_price = price
-				
-				# v4: Двухуровневый трейлинг стоп
-				if USE_TRAILING_STOP_MR:
-					# Агрессивный трейлинг (после +2%)
-					if not self.trailing_aggressive_active and pnl_percent >= MR_TRAILING_AGGRESSIVE_ACTIVATION:
-						self.trailing_aggressive_active = True
-					
-					# Обычный трейлинг (после +0.8%)
-					if not self.trailing_active and pnl_percent >= MR_TRAILING_ACTIVATION:
-						self.trailing_active = True
-					
-					# Проверяем агрессивный трейлинг (приоритет)
-					if self.trailing_aggressive_active:
-						trailing_drop = (self.max_price - price) / self.max_price
-						if trailing_drop >= MR_TRAILING_AGGRESSIVE_DISTANCE:
-							sell_value = self.position * price
-							commission = sell_value * COMMISSION_RATE
-							total_commission += commission
-							self.balance += sell_value - commission
-							
-							reason = "TRAILING_AGGRESSIVE" if self.trailing_aggressive_active else "TRAILING_STOP"
-							self.trades.append({
-								"symbol": self.symbol,
-								"entry_time": self.entry_time,
-								"entry_price": self.entry_price,
-								"entry_zscore": self.entry_zscore,
-								"exit_time": current_time,
-								"exit_price": price,
-								"pnl_percent": pnl_percent * 100,
-								"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-								"reason": reason,
-								"hours_held": hours_held
-							})
-							
-							self.zscore_pnl_data.append({
-								"zscore": self.entry_zscore,
-								"pnl": pnl_percent * 100
-							})
-							
-							if pnl_percent > 0:
-								wins += 1
-							else:
-								losses += 1
-							
-							self.position = 0.0
-							self.entry_price = None
-							self.trailing_active = False
-							self.trailing_aggressive_active = False
-							self.max_price = 0.0
-							continue
-					
-					# Проверяем обычный трейлинг
-					elif self.trailing_active:
-						trailing_drop = (self.max_price - price) / self.max_price
-						if trailing_drop >= MR_TRAILING_DISTANCE:
-							sell_value = self.position * price
-							commission = sell_value * COMMISSION_RATE
-							total_commission += commission
-							self.balance += sell_value - commission
-							
-							self.trades.append({
-								"symbol": self.symbol,
-								"entry_time": self.entry_time,
-								"entry_price": self.entry_price,
-								"entry_zscore": self.entry_zscore,
-								"exit_time": current_time,
-								"exit_price": price,
-								"pnl_percent": pnl_percent * 100,
-								"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-								"reason": "TRAILING_STOP",
-								"hours_held": hours_held
-							})
-							
-							self.zscore_pnl_data.append({
-								"zscore": self.entry_zscore,
-								"pnl": pnl_percent * 100
-							})
-							
-							if pnl_percent > 0:
-								wins += 1
-							else:
-								losses += 1
-							
-							self.position = 0.0
-							self.entry_price = None
-							self.trailing_active = False
-							self.trailing_aggressive_active = False
-							self.max_price = 0.0
-							continue
-				
-				# Используем динамический SL если доступен
-				current_sl = self.entry_sl if self.entry_sl else MR_STOP_LOSS_PERCENT
-				
-				# Стоп-лосс (динамический или фиксированный)
-				if pnl_percent <= -current_sl:
-					sell_value = self.position * price
-					commission = sell_value * COMMISSION_RATE
-					total_commission += commission
-					self.balance += sell_value - commission
-					
-					sl_type = "DYNAMIC_SL" if self.entry_sl else "STOP_LOSS"
-					
-					self.trades.append({
-						"symbol": self.symbol,
-						"entry_time": self.entry_time,
-						"entry_price": self.entry_price,
-						"entry_zscore": self.entry_zscore,
-						"exit_time": current_time,
-						"exit_price": price,
-						"pnl_percent": pnl_percent * 100,
-						"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-						"reason": sl_type,
-						"hours_held": hours_held
-					})
-					
-					self.zscore_pnl_data.append({
-						"zscore": self.entry_zscore,
-						"pnl": pnl_percent * 100
-					})
-					
-					losses += 1
-					self.position = 0.0
-					self.entry_price = None
-					self.entry_sl = None
-					self.trailing_active = False
-					self.max_price = 0.0
-					continue
-				
-				# v5: Таймаут (max holding time) - проверяем до TP
-				if hours_held > MR_MAX_HOLDING_HOURS:
-					sell_value = self.position * price
-					commission = sell_value * COMMISSION_RATE
-					total_commission += commission
-					self.balance += sell_value - commission
-					
-					self.trades.append({
-						"symbol": self.symbol,
-						"entry_time": self.entry_time,
-						"entry_price": self.entry_price,
-						"entry_zscore": self.entry_zscore,
-						"exit_time": current_time,
-						"exit_price": price,
-						"pnl_percent": pnl_percent * 100,
-						"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-						"reason": "TIMEOUT",
-						"hours_held": hours_held
-					})
-					
-					self.zscore_pnl_data.append({
-						"zscore": self.entry_zscore,
-						"pnl": pnl_percent * 100
-					})
-					
-					if pnl_percent > 0:
-						wins += 1
-					else:
-						losses += 1
-					
-					self.position = 0.0
-					self.entry_price = None
-					continue
-				
-				# v4: Тейк-профит (динамический или фиксированный)
-				current_tp = self.entry_tp if self.entry_tp else MR_TAKE_PROFIT_PERCENT
-				if pnl_percent >= current_tp or signal == "SELL":
-					sell_value = self.position * price
-					commission = sell_value * COMMISSION_RATE
-					total_commission += commission
-					self.balance += sell_value - commission
-					
-					exit_reason = "TAKE_PROFIT" if pnl_percent >= current_tp else "SIGNAL_EXIT"
-					
-					self.trades.append({
-						"symbol": self.symbol,
-						"entry_time": self.entry_time,
-						"entry_price": self.entry_price,
-						"entry_zscore": self.entry_zscore,
-						"exit_time": current_time,
-						"exit_price": price,
-						"pnl_percent": pnl_percent * 100,
-						"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-						"reason": exit_reason,
-						"hours_held": hours_held
-					})
-					
-					self.zscore_pnl_data.append({
-						"zscore": self.entry_zscore,
-						"pnl": pnl_percent * 100
-					})
-					
-				if pnl_percent > 0:
-					wins += 1
-				else:
-					losses += 1
-				
-				self.position = 0.0
-				self.entry_price = None
-				continue
-			
-			# Вход в позицию
-			if signal == "BUY" and self.position == 0 and self.balance > 0:
-				position_size_percent = sig.get("position_size_percent", 0.5)
-				invest_amount = self.balance * position_size_percent
-				commission = invest_amount * COMMISSION_RATE
-				total_commission += commission
-				self.position = (invest_amount - commission) / price
-				self.entry_price = price
-				self.entry_time = current_time
-				self.entry_zscore = zscore
-				self.entry_sl = sig.get("dynamic_sl", None)  # Сохраняем динамический SL
-				self.entry_tp = sig.get("dynamic_tp", None)  # v4: Сохраняем динамический TP
-				self.max_price = price  # Инициализируем для трейлинг стопа
-				self.trailing_active = False
-				self.trailing_aggressive_active = False
-				self.balance -= invest_amount
-		
-		# Закрываем открытую позицию
-		if self.position > 0:
-			final_price = signals[-1]["price"]
-			sell_value = self.position * final_price
-			commission = sell_value * COMMISSION_RATE
-			total_commission += commission
-			self.balance += sell_value - commission
-			
-			pnl_percent = (final_price - self.entry_price) / self.entry_price
-			hours_held = (signals[-1]["time"] - self.entry_time).total_seconds() / 3600
-			
-			self.trades.append({
-				"symbol": self.symbol,
-				"entry_time": self.entry_time,
-				"entry_price": self.entry_price,
-				"entry_zscore": self.entry_zscore,
-				"exit_time": signals[-1]["time"],
-				"exit_price": final_price,
-				"pnl_percent": pnl_percent * 100,
-				"pnl_usd": (sell_value - commission) - (self.entry_price * self.position),
-				"reason": "FINAL_CLOSE",
-				"hours_held": hours_held
-			})
-			
-			self.zscore_pnl_data.append({
-				"zscore": self.entry_zscore,
-				"pnl": pnl_percent * 100
-			})
-			
-			if pnl_percent > 0:
-				wins += 1
-			else:
-				losses += 1
-			
-			self.position = 0.0
+		self.trades = trades
+		self.bar_times = times
+		self.equity = equity
+		self.bar_prices = prices
+		trades_count = trades.shape[1]
 		
 		# Расчёт метрик
 		total_return = self.balance - self.start_balance
@@ -430,18 +116,19 @@ class MeanReversionBacktest:
 		win_rate = (wins / (wins + losses)) * 100 if (wins + losses) > 0 else 0
 		
 		# Average win/loss
-		profitable_trades = [t for t in self.trades if t["pnl_percent"] > 0]
-		losing_trades = [t for t in self.trades if t["pnl_percent"] < 0]
+		pnl_pct = trades[TR_PNL_PCT]
+		winning_mask = pnl_pct > 0
+		losing_mask = pnl_pct < 0
 		
-		avg_win = np.mean([t["pnl_percent"] for t in profitable_trades]) if profitable_trades else 0
-		avg_loss = np.mean([t["pnl_percent"] for t in losing_trades]) if losing_trades else 0
+		avg_win = pnl_pct[winning_mask].mean() if winning_mask.any() else 0
+		avg_loss = pnl_pct[losing_mask].mean() if losing_mask.any() else 0
 		
 		# Среднее время удержания
-		avg_holding_time = np.mean([t["hours_held"] for t in self.trades]) if self.trades else 0
+		avg_holding_time = trades[TR_HOURS_HELD].mean() if trades_count else 0
 		
 		# Sharpe Ratio (упрощённый)
-		returns = [t["pnl_percent"] for t in self.trades]
-		sharpe_ratio = (np.mean(returns) / np.std(returns)) if len(returns) > 1 and np.std(returns) > 0 else 0
+		pnl_std = pnl_pct.std() if trades_count > 1 else 0
+		sharpe_ratio = (pnl_pct.mean() / pnl_std) if pnl_std > 0 else 0
 		
 		return {
 			"strategy": strategy,
@@ -451,48 +138,119 @@ class MeanReversionBacktest:
 			"total_return": total_return,
 			"total_return_pct": total_return_pct,
 			"total_commission": total_commission,
-			"trades_count": len(self.trades),
+			"trades_count": trades_count,
 			"wins": wins,
 			"losses": losses,
 			"win_rate": win_rate,
 			"avg_win": avg_win,
 			"avg_loss": avg_loss,
-			"max_drawdown": max_drawdown * 100,
+			"max_drawdown": max_drawdown(equity, float(self.start_balance)) * 100,
 			"avg_holding_hours": avg_holding_time,
 			"sharpe_ratio": sharpe_ratio
 		}
 	
+	def _generate_signals(self, df: pd.DataFrame, strategy: str) -> Tuple[np.ndarray, ...]:
+		"""
+		Сигналы по всей истории, упакованные в массивы:
+		(цены, коды сигналов, Z-score, размеры позиций, динамические SL, динамические TP)
+		"""
+		n = len(df)
+		min_window = 50  # Для Z-score нужно 50 свечей
+		# Значения по умолчанию — те же, что у сигнала без соответствующего ключа
+		prices = df["close"].to_numpy(dtype=np.float64).copy()
+		signal_codes = np.full(n, SIGNAL_HOLD, dtype=np.int8)
+		zscores = np.zeros(n, dtype=np.float64)
+		position_sizes = np.full(n, 0.5, dtype=np.float64)
+		# None (нет динамического SL/TP) кодируется как 0.0
+		dynamic_sls = np.zeros(n, dtype=np.float64)
+		dynamic_tps = np.zeros(n, dtype=np.float64)
+		
+		# Индикаторы считаются один раз по всей истории (без заглядывания вперёд),
+		# а не заново на каждом срезе df[:i+1]
+		gen = SignalGenerator(df)
+		gen.compute_indicators_batch()
+		
+		# Свечи прогрева (меньше min_window) остаются HOLD по цене закрытия
+		for i in range(min(min_window - 1, n), n):
+			if strategy == "mean_reversion":
+				res = gen.generate_signal_mean_reversion_at(i)
+			else:
+				res = gen.generate_signal_at(i, strict=False)
+			
+			prices[i] = res["price"]
+			signal_codes[i] = SIGNAL_CODES[res["signal"]]
+			zscores[i] = res.get("zscore", 0)
+			position_sizes[i] = res.get("position_size_percent", 0.5)
+			dynamic_sls[i] = res.get("dynamic_sl") or 0.0
+			dynamic_tps[i] = res.get("dynamic_tp") or 0.0
+		
+		return prices, signal_codes, zscores, position_sizes, dynamic_sls, dynamic_tps
+	
+	def trades_frame(self) -> pd.DataFrame:
+		"""Сделки в виде DataFrame (одна строка на сделку) — для вывода и анализа"""
+		trades = self.trades
+		return pd.DataFrame({
+			"symbol": self.symbol,
+			"entry_time": self.bar_times[trades[TR_ENTRY_BAR].astype(np.int64)],
+			"entry_price": trades[TR_ENTRY_PRICE],
+			"entry_zscore": trades[TR_ENTRY_ZSCORE],
+			"exit_time": self.bar_times[trades[TR_EXIT_BAR].astype(np.int64)],
+			"exit_price": trades[TR_EXIT_PRICE],
+			"pnl_percent": trades[TR_PNL_PCT],
+			"pnl_usd": trades[TR_PNL_USD],
+			"reason": REASON_NAMES[trades[TR_REASON].astype(np.int64)],
+			"hours_held": trades[TR_HOURS_HELD]
+		})
+	
+	def equity_frame(self) -> pd.DataFrame:
+		"""Кривая equity в виде DataFrame (одна строка на свечу) — для графиков"""
+		return pd.DataFrame({
+			"time": self.bar_times,
+			"equity": self.equity,
+			"price": self.bar_prices
+		})
+	
 	def save_trades_to_csv(self, filename: str):
 		"""Сохраняем сделки в CSV"""
-		if not self.trades:
+		if self.trades.shape[1] == 0:
 			return
 		
-		with open(filename, 'w', newline='', encoding='utf-8') as f:
-			fieldnames = ["symbol", "entry_time", "entry_price", "entry_zscore", 
-						  "exit_time", "exit_price", "pnl_percent", "pnl_usd", 
-						  "reason", "hours_held"]
-			writer = csv.DictWriter(f, fieldnames=fieldnames)
-			writer.writeheader()
-			writer.writerows(self.trades)
+		self.trades_frame().to_csv(filename, index=False)
 		
 		print(f"CSV saved: {filename}")
 	
+	def _plot_indices(self, values: np.ndarray) -> np.ndarray:
+		"""
+		Индексы свечей для графика серии: длинные серии прореживаются LTTB
+		(на графике шириной ~2000 px лишние точки не видны)
+		"""
+		x = self.bar_times.as_unit("ns").asi8.astype(np.float64)
+		return lttb_indices(x, values, PLOT_MAX_POINTS)
+	
 	def plot_equity_curve(self, compare_with: 'MeanReversionBacktest' = None, save_path: str = None):
 		"""Рисуем equity curve"""
-		if not self.equity_curve:
+		if self.equity.size == 0:
 			return
 		
-		df_equity = pd.DataFrame(self.equity_curve)
-		df_equity['time'] = pd.to_datetime(df_equity['time'])
+		# matplotlib нужен только для графика: импорт здесь, без GUI-бэкенда
+		import matplotlib
+		matplotlib.use("Agg")
+		import matplotlib.pyplot as plt
+		import matplotlib.dates as mdates
+		
+		df_equity = self.equity_frame()
+		df_eq_plot = df_equity.iloc[self._plot_indices(self.equity)]
+		df_price_plot = df_equity.iloc[self._plot_indices(self.bar_prices)]
 		
-		fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10), sharex=True)
+		# constrained layout раскладывает оси при отрисовке — без tight_layout и bbox_inches='tight',
+		# которые рендерят фигуру лишний раз
+		fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10), sharex=True, layout='constrained')
 		
 		# График 1: Equity curve
-		ax1.plot(df_equity['time'], df_equity['equity'], label='Mean Reversion', linewidth=2, color='blue')
+		ax1.plot(df_eq_plot['time'], df_eq_plot['equity'], label='Mean Reversion', linewidth=2, color='blue')
 		
-		if compare_with and compare_with.equity_curve:
-			df_compare = pd.DataFrame(compare_with.equity_curve)
-			df_compare['time'] = pd.to_datetime(df_compare['time'])
+		if compare_with and compare_with.equity.size:
+			df_compare = compare_with.equity_frame().iloc[compare_with._plot_indices(compare_with.equity)]
 			ax1.plot(df_compare['time'], df_compare['equity'], label='Trend Following', 
 					linewidth=2, color='orange', alpha=0.7)
 		
@@ -503,7 +261,7 @@ class MeanReversionBacktest:
 		ax1.grid(True, alpha=0.3)
 		
 		# График 2: Цена актива
-		ax2.plot(df_equity['time'], df_equity['price'], label=f'{self.symbol} Price', 
+		ax2.plot(df_price_plot['time'], df_price_plot['price'], label=f'{self.symbol} Price', 
 				linewidth=2, color='green', alpha=0.7)
 		ax2.set_ylabel('Цена ($)', fontsize=12)
 		ax2.set_xlabel('Дата', fontsize=12)
@@ -515,34 +273,45 @@ class MeanReversionBacktest:
 		ax2.xaxis.set_major_locator(mdates.DayLocator(interval=7))
 		plt.xticks(rotation=45)
 		
-		plt.tight_layout()
-		
 		if save_path:
-			plt.savefig(save_path, dpi=150, bbox_inches='tight')
+			fig.savefig(save_path, dpi=150, pil_kwargs=PLOT_PNG_OPTIONS)
 			print(f"Chart saved: {save_path}")
 		else:
-			plt.savefig('equity_curve.png', dpi=150, bbox_inches='tight')
+			fig.savefig('equity_curve.png', dpi=150, pil_kwargs=PLOT_PNG_OPTIONS)
 			print("Chart saved: equity_curve.png")
 		
-		plt.close()
+		plt.close(fig)
 	
 	def plot_zscore_vs_pnl(self, save_path: str = None):
-		"""Scatter график Z-score vs P&L"""
-		if not self.zscore_pnl_data:
+		"""Scatter график Z-score vs P&L (hexbin, если сделок больше PLOT_SCATTER_MAX_TRADES)"""
+		if self.trades.shape[1] == 0:
 			return
 		
-		df_scatter = pd.DataFrame(self.zscore_pnl_data)
+		# matplotlib нужен только для графика: импорт здесь, без GUI-бэкенда
+		import matplotlib
+		matplotlib.use("Agg")
+		import matplotlib.pyplot as plt
 		
-		fig, ax = plt.subplots(figsize=(12, 8))
+		df_scatter = pd.DataFrame({
+			"zscore": self.trades[TR_ENTRY_ZSCORE],
+			"pnl": self.trades[TR_PNL_PCT]
+		})
 		
-		# Разделяем на прибыльные и убыточные
-		profitable = df_scatter[df_scatter['pnl'] > 0]
-		losing = df_scatter[df_scatter['pnl'] <= 0]
+		fig, ax = plt.subplots(figsize=(12, 8), layout='constrained')
 		
-		ax.scatter(profitable['zscore'], profitable['pnl'], 
-				  c='green', alpha=0.6, s=100, label='Прибыльные', edgecolors='black', linewidth=0.5)
-		ax.scatter(losing['zscore'], losing['pnl'], 
-				  c='red', alpha=0.6, s=100, label='Убыточные', edgecolors='black', linewidth=0.5)
+		if len(df_scatter) > PLOT_SCATTER_MAX_TRADES:
+			# Много сделок: плотность в шестиугольниках — один artist вместо тысяч маркеров
+			hb = ax.hexbin(df_scatter['zscore'], df_scatter['pnl'], gridsize=30, mincnt=1, cmap='viridis')
+			fig.colorbar(hb, ax=ax, label='Сделок')
+		else:
+			# Разделяем на прибыльные и убыточные
+			profitable = df_scatter[df_scatter['pnl'] > 0]
+			losing = df_scatter[df_scatter['pnl'] <= 0]
+			
+			ax.scatter(profitable['zscore'], profitable['pnl'], 
+					  c='green', alpha=0.6, s=100, label='Прибыльные', edgecolors='black', linewidth=0.5)
+			ax.scatter(losing['zscore'], losing['pnl'], 
+					  c='red', alpha=0.6, s=100, label='Убыточные', edgecolors='black', linewidth=0.5)
 		
 		# Линии для порогов
 		ax.axvline(x=-2.5, color='blue', linestyle='--', alpha=0.5, label='Z-score порог входа (-2.5)')
@@ -556,16 +325,24 @@ class MeanReversionBacktest:
 		ax.legend(loc='best')
 		ax.grid(True, alpha=0.3)
 		
-		plt.tight_layout()
-		
 		if save_path:
-			plt.savefig(save_path, dpi=150, bbox_inches='tight')
+			fig.savefig(save_path, dpi=150, pil_kwargs=PLOT_PNG_OPTIONS)
 			print(f"Chart saved: {save_path}")
 		else:
-			plt.savefig('zscore_vs_pnl.png', dpi=150, bbox_inches='tight')
+			fig.savefig('zscore_vs_pnl.png', dpi=150, pil_kwargs=PLOT_PNG_OPTIONS)
 			print("Chart saved: zscore_vs_pnl.png")
 		
-		plt.close()
+		plt.close(fig)
+
+
+def run_strategy_backtest(backtest: MeanReversionBacktest, df: pd.DataFrame, strategy: str) -> Tuple[MeanReversionBacktest, Dict[str, Any]]:
+	"""
+	Прогоняет бэктест стратегии и возвращает (бэктест с результатами, метрики).
+	Функция верхнего уровня без I/O — её можно запускать в ProcessPoolExecutor
+	(бэктест возвращается, т.к. в дочернем процессе изменяется его копия).
+	"""
+	results = backtest.run_backtest(df, strategy=strategy)
+	return backtest, results
 
 
 async def main():
@@ -600,17 +377,17 @@ async def main():
 	
 	print(f"OK: Loaded {len(df)} candles")
 	
-	# Запускаем бэктест Mean Reversion
-	print("\n" + "="*80)
-	print("Running MEAN REVERSION strategy...")
-	print("="*80)
-	mr_results = mr_backtest.run_backtest(df, strategy="mean_reversion")
-	
-	# Запускаем бэктест Trend Following
+	# Бэктесты Mean Reversion и Trend Following независимы: считаем их
+	# параллельно в отдельных процессах (генерация сигналов упирается в GIL)
 	print("\n" + "="*80)
-	print("Running TREND FOLLOWING strategy (baseline)...")
+	print("Running MEAN REVERSION and TREND FOLLOWING (baseline) strategies...")
 	print("="*80)
-	tf_results = tf_backtest.run_backtest(df, strategy="trend_following")
+	loop = asyncio.get_running_loop()
+	with ProcessPoolExecutor(max_workers=2) as pool:
+		(mr_backtest, mr_results), (tf_backtest, tf_results) = await asyncio.gather(
+			loop.run_in_executor(pool, run_strategy_backtest, mr_backtest, df, "mean_reversion"),
+			loop.run_in_executor(pool, run_strategy_backtest, tf_backtest, df, "trend_following")
+		)
 	
 	# Сохраняем сделки в CSV
 	mr_backtest.save_trades_to_csv("mean_reversion_trades.csv")
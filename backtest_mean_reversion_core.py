@@ -0,0 +1,272 @@
+"""
+Ядро бэктеста mean reversion: пошаговая симуляция торговли на NumPy-массивах.
+Компилируется Numba (@njit), без numba работает как обычный Python.
+
+Логика повторяет торговый цикл MeanReversionBacktest.run_backtest
+(backtest_mean_reversion.py): двухуровневый трейлинг стоп, динамические SL/TP,
+таймаут, выход по TP или сигналу SELL.
+"""
+import numpy as np
+from numba_compat import njit
+from signal_generator import SIGNAL_BUY, SIGNAL_SELL
+from config import (
+	COMMISSION_RATE,
+	MR_TAKE_PROFIT_PERCENT, MR_STOP_LOSS_PERCENT, MR_MAX_HOLDING_HOURS,
+	USE_TRAILING_STOP_MR, MR_TRAILING_ACTIVATION, MR_TRAILING_DISTANCE,
+	MR_TRAILING_AGGRESSIVE_ACTIVATION, MR_TRAILING_AGGRESSIVE_DISTANCE
+)
+
+# Причины выхода из позиции
+REASON_NONE = -1         # выхода нет (внутри ядра)
+REASON_TRAILING_AGGRESSIVE = 0
+REASON_TRAILING_STOP = 1
+REASON_STOP_LOSS = 2
+REASON_DYNAMIC_SL = 3
+REASON_TIMEOUT = 4
+REASON_TAKE_PROFIT = 5
+REASON_SIGNAL_EXIT = 6
+REASON_FINAL_CLOSE = 7
+# Обратное отображение: REASON_NAMES[code]
+REASON_NAMES = np.array([
+	"TRAILING_AGGRESSIVE", "TRAILING_STOP", "STOP_LOSS", "DYNAMIC_SL",
+	"TIMEOUT", "TAKE_PROFIT", "SIGNAL_EXIT", "FINAL_CLOSE",
+], dtype=object)
+
+# Колонки массива сделок (struct-of-arrays: trades[TR_*] — колонка по всем сделкам)
+TR_ENTRY_BAR = 0     # индекс свечи входа
+TR_EXIT_BAR = 1      # индекс свечи выхода
+TR_ENTRY_PRICE = 2
+TR_ENTRY_ZSCORE = 3
+TR_EXIT_PRICE = 4
+TR_PNL_PCT = 5       # изменение цены от входа, %
+TR_PNL_USD = 6
+TR_REASON = 7        # код причины выхода (REASON_*)
+TR_HOURS_HELD = 8
+TRADE_COLUMNS = 9
+
+# Счётчики
+CNT_WINS = 0
+CNT_LOSSES = 1
+COUNTERS_COUNT = 2
+
+# Параметры симуляции (индексы в массиве params)
+P_COMMISSION = 0
+P_STOP_LOSS = 1
+P_TAKE_PROFIT = 2
+P_MAX_HOLDING = 3
+P_USE_TRAILING = 4
+P_TRAILING_ACTIVATION = 5
+P_TRAILING_DISTANCE = 6
+P_TRAILING_AGG_ACTIVATION = 7
+P_TRAILING_AGG_DISTANCE = 8
+PARAMS_COUNT = 9
+
+
+def build_params() -> np.ndarray:
+	"""
+	Упаковывает настройки из config в массив для simulate().
+	Значения передаются аргументом, а не глобалами: кэш Numba
+	не должен «замораживать» старые значения config.
+	"""
+	params = np.zeros(PARAMS_COUNT, dtype=np.float64)
+	params[P_COMMISSION] = COMMISSION_RATE
+	params[P_STOP_LOSS] = MR_STOP_LOSS_PERCENT
+	params[P_TAKE_PROFIT] = MR_TAKE_PROFIT_PERCENT
+	params[P_MAX_HOLDING] = MR_MAX_HOLDING_HOURS
+	params[P_USE_TRAILING] = 1.0 if USE_TRAILING_STOP_MR else 0.0
+	params[P_TRAILING_ACTIVATION] = MR_TRAILING_ACTIVATION
+	params[P_TRAILING_DISTANCE] = MR_TRAILING_DISTANCE
+	params[P_TRAILING_AGG_ACTIVATION] = MR_TRAILING_AGGRESSIVE_ACTIVATION
+	params[P_TRAILING_AGG_DISTANCE] = MR_TRAILING_AGGRESSIVE_DISTANCE
+	return params
+
+
+@njit(cache=True)
+def _close_position(trades, k, entry_bar, exit_bar, entry_price, entry_zscore, exit_price, quantity, commission_rate, reason, hours_held):
+	"""
+	Продаёт quantity по exit_price и записывает сделку k.
+	Возвращает (выручка за вычетом комиссии, комиссия).
+	"""
+	sell_value = quantity * exit_price
+	commission = sell_value * commission_rate
+	proceeds = sell_value - commission
+	pnl_percent = (exit_price - entry_price) / entry_price
+	trades[TR_ENTRY_BAR, k] = entry_bar
+	trades[TR_EXIT_BAR, k] = exit_bar
+	trades[TR_ENTRY_PRICE, k] = entry_price
+	trades[TR_ENTRY_ZSCORE, k] = entry_zscore
+	trades[TR_EXIT_PRICE, k] = exit_price
+	trades[TR_PNL_PCT, k] = pnl_percent * 100
+	trades[TR_PNL_USD, k] = proceeds - (entry_price * quantity)
+	trades[TR_REASON, k] = reason
+	trades[TR_HOURS_HELD, k] = hours_held
+	return proceeds, commission
+
+
+# Явная сигнатура: simulate компилируется при импорте, а cache=True сохраняет
+# машинный код на диск (__pycache__), поэтому повторные запуски не ждут JIT.
+# Типы аргументов должны совпадать с сигнатурой (см. MeanReversionBacktest.run_backtest).
+SIMULATE_SIGNATURE = (
+	"Tuple((f8, f8, f8[:, :], f8[:], i8[:]))"
+	"(f8[:], i1[:], f8[:], f8[:], f8[:], f8[:], i8[:], f8, f8[:])"
+)
+
+
+@njit(SIMULATE_SIGNATURE, cache=True)
+def simulate(prices, signals, zscores, position_sizes, dynamic_sls, dynamic_tps, times_ns, start_balance, params):
+	"""
+	Пошаговая симуляция торговли по заранее посчитанным сигналам.
+
+	Параметры:
+	- prices: float64-массив цен
+	- signals: int8-коды сигналов (SIGNAL_BUY / SIGNAL_SELL / HOLD)
+	- zscores: Z-score сигнала (сохраняется для сделки при входе)
+	- position_sizes: доля баланса на вход
+	- dynamic_sls, dynamic_tps: динамические SL/TP сигнала (0.0 — нет, берутся фиксированные)
+	- times_ns: время свечей, int64 наносекунды
+	- start_balance: начальный баланс (float)
+	- params: float64-массив из build_params()
+
+	Возвращает (balance, total_commission, trades, equity, counters):
+	- trades: массив сделок формы (TRADE_COLUMNS, число сделок) в порядке закрытия
+	- equity: баланс с учётом открытой позиции на каждой свече
+	- counters: прибыльные/убыточные закрытия (индексы CNT_*)
+	"""
+	n = prices.shape[0]
+	commission_rate = params[P_COMMISSION]
+	use_trailing = params[P_USE_TRAILING] > 0
+
+	# На свече не больше одного закрытия и финальное закрытие
+	trades = np.zeros((TRADE_COLUMNS, n + 1), dtype=np.float64)
+	n_trades = 0
+	equity = np.empty(n, dtype=np.float64)
+	counters = np.zeros(COUNTERS_COUNT, dtype=np.int64)
+
+	balance = start_balance
+	total_commission = 0.0
+
+	# Состояние позиции (entry_price = 0.0 — входа нет)
+	position = 0.0
+	entry_price = 0.0
+	entry_bar = 0
+	entry_zscore = 0.0
+	entry_sl = 0.0  # 0.0 — динамического SL нет
+	entry_tp = 0.0  # 0.0 — динамического TP нет
+	max_price = 0.0
+	trailing_active = False
+	trailing_aggressive_active = False
+
+	for i in range(n):
+		price = prices[i]
+
+		# Расчёт equity (просадка считается по массиву после симуляции)
+		if position > 0:
+			equity[i] = balance + position * price
+		else:
+			equity[i] = balance
+
+		# Проверка выхода из позиции
+		if position > 0 and entry_price != 0.0:
+			pnl_percent = (price - entry_price) / entry_price
+			hours_held = (times_ns[i] - times_ns[entry_bar]) / 1e9 / 3600
+
+			# Обновляем максимальную цену для трейлинг стопа
+			if price > max_price:
+				max_price = price
+
+			exit_reason = REASON_NONE
+
+			# v4: Двухуровневый трейлинг стоп
+			if use_trailing:
+				# Агрессивный трейлинг (после +2%)
+				if not trailing_aggressive_active and pnl_percent >= params[P_TRAILING_AGG_ACTIVATION]:
+					trailing_aggressive_active = True
+
+				# Обычный трейлинг (после +0.8%)
+				if not trailing_active and pnl_percent >= params[P_TRAILING_ACTIVATION]:
+					trailing_active = True
+
+				# Проверяем агрессивный трейлинг (приоритет), затем обычный
+				if trailing_aggressive_active:
+					if (max_price - price) / max_price >= params[P_TRAILING_AGG_DISTANCE]:
+						exit_reason = REASON_TRAILING_AGGRESSIVE
+				elif trailing_active:
+					if (max_price - price) / max_price >= params[P_TRAILING_DISTANCE]:
+						exit_reason = REASON_TRAILING_STOP
+
+			if exit_reason == REASON_NONE:
+				# Используем динамический SL/TP если доступен
+				current_sl = entry_sl if entry_sl != 0.0 else params[P_STOP_LOSS]
+				current_tp = entry_tp if entry_tp != 0.0 else params[P_TAKE_PROFIT]
+
+				if pnl_percent <= -current_sl:
+					exit_reason = REASON_STOP_LOSS if entry_sl == 0.0 else REASON_DYNAMIC_SL
+				elif hours_held > params[P_MAX_HOLDING]:
+					# v5: Таймаут (max holding time) - проверяем до TP
+					exit_reason = REASON_TIMEOUT
+				elif pnl_percent >= current_tp:
+					exit_reason = REASON_TAKE_PROFIT
+				elif signals[i] == SIGNAL_SELL:
+					exit_reason = REASON_SIGNAL_EXIT
+
+			# Полный выход: одна ветка для всех причин
+			if exit_reason != REASON_NONE:
+				proceeds, commission = _close_position(
+					trades, n_trades, entry_bar, i, entry_price, entry_zscore, price,
+					position, commission_rate, exit_reason, hours_held
+				)
+				n_trades += 1
+				total_commission += commission
+				balance += proceeds
+
+				# Стоп-лосс — всегда убыток
+				if pnl_percent > 0 and exit_reason != REASON_STOP_LOSS and exit_reason != REASON_DYNAMIC_SL:
+					counters[CNT_WINS] += 1
+				else:
+					counters[CNT_LOSSES] += 1
+
+				position = 0.0
+				entry_price = 0.0
+				entry_sl = 0.0
+				entry_tp = 0.0
+				trailing_active = False
+				trailing_aggressive_active = False
+				max_price = 0.0
+			# Позиция закрыта или остаётся открытой — вход на этой свече не проверяется
+			continue
+
+		# Вход в позицию
+		if signals[i] == SIGNAL_BUY and position == 0 and balance > 0:
+			invest_amount = balance * position_sizes[i]
+			commission = invest_amount * commission_rate
+			total_commission += commission
+			position = (invest_amount - commission) / price
+			entry_price = price
+			entry_bar = i
+			entry_zscore = zscores[i]
+			entry_sl = dynamic_sls[i]  # Сохраняем динамический SL
+			entry_tp = dynamic_tps[i]  # v4: Сохраняем динамический TP
+			max_price = price  # Инициализируем для трейлинг стопа
+			trailing_active = False
+			trailing_aggressive_active = False
+			balance -= invest_amount
+
+	# Закрываем открытую позицию
+	if position > 0:
+		final_price = prices[n - 1]
+		pnl_percent = (final_price - entry_price) / entry_price
+		hours_held = (times_ns[n - 1] - times_ns[entry_bar]) / 1e9 / 3600
+		proceeds, commission = _close_position(
+			trades, n_trades, entry_bar, n - 1, entry_price, entry_zscore, final_price,
+			position, commission_rate, REASON_FINAL_CLOSE, hours_held
+		)
+		n_trades += 1
+		total_commission += commission
+		balance += proceeds
+
+		if pnl_percent > 0:
+			counters[CNT_WINS] += 1
+		else:
+			counters[CNT_LOSSES] += 1
+
+	return balance, total_commission, trades[:, :n_trades], equity, counters
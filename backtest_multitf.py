@@ -11,9 +11,12 @@ import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 from data_provider import DataProvider
 from signal_generator import SignalGenerator
+from backtest_multitf_core import scan_exits, EXIT_NAMES, EXIT_SCAN_BARS, EXIT_TIME_BARS
 from logger import logger
 from config import (
 	STRATEGY_MODE,
@@ -24,6 +27,116 @@ from config import (
 	TAKE_PROFIT_PERCENT
 )
 
+# Свечей старшего таймфрейма до начала бэктеста (прогрев индикаторов, как limit=200 в живом MTF анализе)
+MTF_WARMUP_CANDLES = 200
+
+
+def _signal_at(generator: SignalGenerator, i: int, strategy: str) -> Dict:
+	"""
+	Сигнал single TF на свече i по заранее посчитанным индикаторам —
+	то же, что генерация сигнала стратегии на срезе df[:i+1].
+	"""
+	if strategy == "MEAN_REVERSION":
+		return generator.generate_signal_mean_reversion_at(i)
+	elif strategy == "HYBRID":
+		return generator.generate_signal_hybrid_at(i)
+	else:
+		return generator.generate_signal_at(i, strict=False)
+
+
+
+def _simulate_trades(
+	closes: np.ndarray, entry_bars: List[int], position_sizes: List[float],
+	balance: float, alignments: List[float] = None
+) -> Tuple[Dict[str, np.ndarray], float]:
+	"""
+	Сделки по свечам входа. Выход сделки зависит только от свечи входа,
+	поэтому выходы всех входов ищутся одним вызовом ядра; баланс затем
+	проходится последовательно (размер позиции — доля текущего баланса).
+	
+	Возвращает (trades, итоговый баланс). trades — struct-of-arrays:
+	{"entry_price", "exit_price", "pnl", "pnl_percent", "reason" (коды EXIT_*)[, "alignment"]}.
+	"""
+	entries = np.asarray(entry_bars, dtype=np.int64)
+	entry_prices = closes[entries]
+	stop_losses = entry_prices * (1 - STOP_LOSS_PERCENT)
+	take_profits = entry_prices * (1 + TAKE_PROFIT_PERCENT)
+	_, exit_prices, exit_codes = scan_exits(
+		closes, entries, stop_losses, take_profits, EXIT_SCAN_BARS, EXIT_TIME_BARS
+	)
+	
+	n_entries = len(entries)
+	pnls = np.empty(n_entries, dtype=np.float64)
+	pnl_percents = np.empty(n_entries, dtype=np.float64)
+	n_trades = 0
+	for k in range(n_entries):
+		# Баланс исчерпан — следующие входы тоже пропускаются
+		if balance <= 0:
+			break
+		
+		# Открываем позицию
+		entry_price = entry_prices[k]
+		invest = balance * position_sizes[k]
+		commission = invest * COMMISSION_RATE
+		amount = (invest - commission) / entry_price
+		
+		# Считаем PnL
+		sell_value = amount * exit_prices[k]
+		sell_commission = sell_value * COMMISSION_RATE
+		net_value = sell_value - sell_commission
+		pnl = net_value - invest
+		pnls[k] = pnl
+		pnl_percents[k] = (pnl / invest) * 100
+		
+		balance += pnl
+		n_trades += 1
+	
+	# Совершённые сделки — первые n_trades входов
+	trades = {
+		"entry_price": entry_prices[:n_trades],
+		"exit_price": exit_prices[:n_trades],
+		"pnl": pnls[:n_trades],
+		"pnl_percent": pnl_percents[:n_trades],
+		"reason": exit_codes[:n_trades]
+	}
+	if alignments is not None:
+		trades["alignment"] = np.asarray(alignments, dtype=np.float64)[:n_trades]
+	return trades, float(balance)
+
+
+def _trade_stats(trades: Dict[str, np.ndarray], initial_balance: float, final_balance: float) -> Dict:
+	"""Статистика бэктеста по колонке PnL сделок (одна для single TF и MTF)"""
+	pnl = trades["pnl"]
+	total_trades = len(pnl)
+	winning_trades = int(np.count_nonzero(pnl > 0))
+	losing_trades = int(np.count_nonzero(pnl < 0))
+	
+	total_pnl = float(pnl.sum())
+	avg_pnl = total_pnl / total_trades if total_trades > 0 else 0
+	
+	win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
+	
+	roi = ((final_balance - initial_balance) / initial_balance) * 100
+	
+	return {
+		"total_trades": total_trades,
+		"winning_trades": winning_trades,
+		"losing_trades": losing_trades,
+		"win_rate": win_rate,
+		"total_pnl": total_pnl,
+		"avg_pnl": avg_pnl,
+		"roi": roi,
+		"final_balance": final_balance,
+		"trades": trades
+	}
+
+
+def _trade_records(trades: Dict[str, np.ndarray]) -> List[Dict]:
+	"""Сделки (struct-of-arrays) → список записей для JSON"""
+	columns = {name: values.tolist() for name, values in trades.items()}
+	columns["reason"] = EXIT_NAMES[trades["reason"]].tolist()
+	return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
 
 class MTFBacktest:
 	"""Бэктест для сравнения single TF и MTF анализа"""
@@ -45,7 +158,8 @@ class MTFBacktest:
 			provider = DataProvider(session)
 			
 			# Загружаем данные
-			# Для бэктеста нужно больше данных (lookback_days * 24 * 2 для запаса)
+			# Для бэктеста нужно больше данных (lookback_days * 24 * 2 для запаса).
+			# Больше лимита одного запроса API — DataProvider загружает свечи страницами
 			if self.interval == "1h":
 				limit = self.lookback_days * 24 * 2
 			elif self.interval == "15m":
@@ -55,13 +169,15 @@ class MTFBacktest:
 			else:
 				limit = 1000
 			
-			limit = min(limit, 1000)  # API limit
-			
 			try:
-				klines = await provider.fetch_klines(
-					symbol=self.symbol,
-					interval=self.interval,
-					limit=limit
+				# Свечи бэктеста и старших таймфреймов MTF загружаются одновременно
+				klines, mtf_frames = await asyncio.gather(
+					provider.fetch_klines(
+						symbol=self.symbol,
+						interval=self.interval,
+						limit=limit
+					),
+					self._fetch_mtf_frames(provider, limit * pd.Timedelta(self.interval))
 				)
 				df = provider.klines_to_dataframe(klines)
 				
@@ -71,13 +187,18 @@ class MTFBacktest:
 				
 				logger.info(f"Загружено {len(df)} свечей")
 				
-				# Бэктест single TF
-				logger.info("Запуск Single TF бэктеста...")
-				single_tf_stats = await self._backtest_single_tf(df, provider)
-				
-				# Бэктест MTF
-				logger.info("Запуск MTF бэктеста...")
-				mtf_stats = await self._backtest_mtf(df, provider)
+				# Бэктесты single TF и MTF независимы и не ходят в сеть:
+				# считаются параллельно в двух процессах (сигналы — Python-код под GIL).
+				# spawn, а не fork: после fork() parallel-ядро Numba (scan_exits)
+				# вешает родительский процесс на выходе
+				logger.info("Запуск Single TF и MTF бэктестов...")
+				loop = asyncio.get_running_loop()
+				mp_context = multiprocessing.get_context("spawn")
+				with ProcessPoolExecutor(max_workers=2, mp_context=mp_context) as pool:
+					single_tf_stats, mtf_stats = await asyncio.gather(
+						loop.run_in_executor(pool, self._backtest_single_tf, df),
+						loop.run_in_executor(pool, self._backtest_mtf, df, mtf_frames)
+					)
 				
 				# Сравнение результатов
 				self._compare_results(single_tf_stats, mtf_stats)
@@ -85,241 +206,140 @@ class MTFBacktest:
 			except Exception as e:
 				logger.error(f"Ошибка бэктеста: {e}")
 	
-	async def _backtest_single_tf(self, df: pd.DataFrame, provider: DataProvider) -> Dict:
+	async def _fetch_mtf_frames(self, provider: DataProvider, period: pd.Timedelta) -> Dict[str, pd.DataFrame]:
+		"""
+		Свечи таймфреймов MTF_TIMEFRAMES за период бэктеста плюс прогрев индикаторов.
+		Таймфреймы, для которых данных нет, пропускаются (в анализе они HOLD).
+		При выключенном USE_MULTI_TIMEFRAME ничего не загружается.
+		"""
+		if not USE_MULTI_TIMEFRAME:
+			return {}
+		
+		tasks = []
+		for tf in MTF_TIMEFRAMES:
+			limit = int(np.ceil(period / pd.Timedelta(tf))) + MTF_WARMUP_CANDLES
+			tasks.append(provider.fetch_klines(symbol=self.symbol, interval=tf, limit=limit))
+		
+		mtf_frames = {}
+		for tf, klines in zip(MTF_TIMEFRAMES, await asyncio.gather(*tasks, return_exceptions=True)):
+			if isinstance(klines, Exception):
+				logger.warning(f"MTF: ошибка данных для {tf}: {klines}")
+				continue
+			frame = provider.klines_to_dataframe(klines)
+			if frame.empty:
+				logger.warning(f"MTF: пустой DataFrame для {tf}")
+				continue
+			mtf_frames[tf] = frame
+		
+		logger.info(f"MTF: загружено {', '.join(f'{tf}={len(frame)}' for tf, frame in mtf_frames.items())} свечей")
+		return mtf_frames
+	
+	def _backtest_single_tf(self, df: pd.DataFrame) -> Dict:
 		"""Бэктест single timeframe"""
 		
-		trades = []
 		balance = 1000.0
 		initial_balance = balance
 		
 		# Минимальное окно для индикаторов
 		min_window = 200
 		
+		# Цены закрытия одним массивом для поиска выхода
+		# (copy=True: pandas отдаёт read-only представление, а сигнатура ядра — f8[:])
+		closes = df['close'].to_numpy(dtype=np.float64, copy=True)
+		
+		# Индикаторы считаются один раз по всей истории (без заглядывания вперёд),
+		# на каждой свече читается готовая строка
+		generator = SignalGenerator(df)
+		generator.compute_indicators_batch()
+		
+		# Фаза 1: свечи входа по сигналам
+		entry_bars = []
 		for i in range(min_window, len(df)):
-			# Берём данные до текущей свечи
-			sub_df = df.iloc[:i+1].copy()
-			
 			try:
-				# Генерируем сигнал
-				generator = SignalGenerator(sub_df)
-				generator.compute_indicators()
-				
-				if STRATEGY_MODE == "MEAN_REVERSION":
-					result = generator.generate_signal_mean_reversion()
-				elif STRATEGY_MODE == "HYBRID":
-					result = generator.generate_signal_hybrid()
-				else:
-					result = generator.generate_signal()
-				
-				signal = result.get("signal", "HOLD")
-				price = float(sub_df['close'].iloc[-1])
-				
-				# Симулируем сделку
-				if signal == "BUY" and balance > 0:
-					# Открываем позицию
-					invest = balance * 0.3  # 30% от баланса
-					commission = invest * COMMISSION_RATE
-					amount = (invest - commission) / price
-					
-					# Ищем выход
-					entry_idx = i
-					entry_price = price
-					stop_loss = entry_price * (1 - STOP_LOSS_PERCENT)
-					take_profit = entry_price * (1 + TAKE_PROFIT_PERCENT)
-					
-					exit_price = None
-					exit_reason = None
-					
-					# Проверяем следующие свечи
-					for j in range(i+1, min(i+100, len(df))):
-						future_price = float(df['close'].iloc[j])
-						
-						if future_price <= stop_loss:
-							exit_price = stop_loss
-							exit_reason = "SL"
-							break
-						elif future_price >= take_profit:
-							exit_price = take_profit
-							exit_reason = "TP"
-							break
-					
-					# Если не вышли - выходим по текущей цене
-					if exit_price is None:
-						exit_idx = min(i+50, len(df)-1)
-						exit_price = float(df['close'].iloc[exit_idx])
-						exit_reason = "TIME"
-					
-					# Считаем PnL
-					sell_value = amount * exit_price
-					sell_commission = sell_value * COMMISSION_RATE
-					net_value = sell_value - sell_commission
-					pnl = net_value - invest
-					pnl_percent = (pnl / invest) * 100
-					
-					balance += pnl
-					
-					trades.append({
-						"entry_price": entry_price,
-						"exit_price": exit_price,
-						"pnl": pnl,
-						"pnl_percent": pnl_percent,
-						"reason": exit_reason
-					})
-					
+				# Генерируем сигнал на свече i
+				result = _signal_at(generator, i, STRATEGY_MODE)
 			except Exception as e:
 				logger.warning(f"Ошибка на свече {i}: {e}")
 				continue
+			
+			if result.get("signal", "HOLD") == "BUY":
+				entry_bars.append(i)
 		
-		# Статистика
-		total_trades = len(trades)
-		winning_trades = len([t for t in trades if t['pnl'] > 0])
-		losing_trades = len([t for t in trades if t['pnl'] < 0])
-		
-		total_pnl = sum(t['pnl'] for t in trades)
-		avg_pnl = total_pnl / total_trades if total_trades > 0 else 0
-		
-		win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
-		
-		final_balance = balance
-		roi = ((final_balance - initial_balance) / initial_balance) * 100
-		
-		return {
-			"total_trades": total_trades,
-			"winning_trades": winning_trades,
-			"losing_trades": losing_trades,
-			"win_rate": win_rate,
-			"total_pnl": total_pnl,
-			"avg_pnl": avg_pnl,
-			"roi": roi,
-			"final_balance": final_balance,
-			"trades": trades
-		}
+		# Фаза 2: сделки (30% от баланса на вход)
+		trades, balance = _simulate_trades(closes, entry_bars, [0.3] * len(entry_bars), balance)
+		
+		return _trade_stats(trades, initial_balance, balance)
 	
-	async def _backtest_mtf(self, df: pd.DataFrame, provider: DataProvider) -> Dict:
-		"""Бэктест multi-timeframe"""
+	def _backtest_mtf(self, df: pd.DataFrame, mtf_frames: Dict[str, pd.DataFrame]) -> Dict:
+		"""
+		Бэктест multi-timeframe.
+		mtf_frames - свечи старших таймфреймов из _fetch_mtf_frames().
+		"""
 		
-		trades = []
 		balance = 1000.0
 		initial_balance = balance
 		
 		# Минимальное окно для индикаторов
 		min_window = 200
 		
+		# Цены закрытия одним массивом для поиска выхода
+		# (copy=True: pandas отдаёт read-only представление, а сигнатура ядра — f8[:])
+		closes = df['close'].to_numpy(dtype=np.float64, copy=True)
+		
+		# Индикаторы текущего таймфрейма — один раз по всей истории
+		generator = SignalGenerator(df)
+		generator.compute_indicators_batch()
+		
+		# На свече i MTF анализ видит только свечи старших таймфреймов, закрытые к её закрытию
+		bar_close_times = df.index + pd.Timedelta(self.interval)
+		
+		# Фаза 1: свечи входа по MTF сигналам и размер позиции
+		entry_bars = []
+		position_sizes = []
+		alignments = []
 		for i in range(min_window, len(df)):
-			# Берём данные до текущей свечи
-			sub_df = df.iloc[:i+1].copy()
-			
 			try:
 				# Генерируем MTF сигнал
-				generator = SignalGenerator(sub_df)
-				generator.compute_indicators()
-				
-				# Используем MTF анализ
-				result = await generator.generate_signal_multi_timeframe(
-					data_provider=provider,
-					symbol=self.symbol,
-					strategy=STRATEGY_MODE
-				)
-				
-				signal = result.get("signal", "HOLD")
-				price = float(sub_df['close'].iloc[-1])
-				alignment_strength = result.get("alignment_strength", 0)
-				buy_score = result.get("buy_score", 0)
-				
-				# MTF сигнал - принимаем любой BUY, но адаптируем размер
-				if signal == "BUY" and balance > 0:
-					# Адаптивный размер позиции на основе согласованности и buy_score
-					if alignment_strength >= 1.0:
-						# Полное согласие всех TF
-						position_size = 0.5
-					elif buy_score >= 1.0:
-						# Высокий weighted score
-						position_size = 0.4
-					elif buy_score >= 0.6:
-						# Средний score
-						position_size = 0.3
-					else:
-						# Низкий score - пропускаем
-						continue
-					
-					invest = balance * position_size
-					commission = invest * COMMISSION_RATE
-					amount = (invest - commission) / price
-					
-					# Ищем выход
-					entry_idx = i
-					entry_price = price
-					stop_loss = entry_price * (1 - STOP_LOSS_PERCENT)
-					take_profit = entry_price * (1 + TAKE_PROFIT_PERCENT)
-					
-					exit_price = None
-					exit_reason = None
-					
-					# Проверяем следующие свечи
-					for j in range(i+1, min(i+100, len(df))):
-						future_price = float(df['close'].iloc[j])
-						
-						if future_price <= stop_loss:
-							exit_price = stop_loss
-							exit_reason = "SL"
-							break
-						elif future_price >= take_profit:
-							exit_price = take_profit
-							exit_reason = "TP"
-							break
-					
-					# Если не вышли - выходим по текущей цене
-					if exit_price is None:
-						exit_idx = min(i+50, len(df)-1)
-						exit_price = float(df['close'].iloc[exit_idx])
-						exit_reason = "TIME"
-					
-					# Считаем PnL
-					sell_value = amount * exit_price
-					sell_commission = sell_value * COMMISSION_RATE
-					net_value = sell_value - sell_commission
-					pnl = net_value - invest
-					pnl_percent = (pnl / invest) * 100
-					
-					balance += pnl
-					
-					trades.append({
-						"entry_price": entry_price,
-						"exit_price": exit_price,
-						"pnl": pnl,
-						"pnl_percent": pnl_percent,
-						"reason": exit_reason,
-						"alignment": alignment_strength
-					})
-					
+				if USE_MULTI_TIMEFRAME:
+					# Используем MTF анализ
+					result = generator.generate_signal_multi_timeframe_offline(
+						mtf_frames, bar_close_times[i], strategy=STRATEGY_MODE
+					)
+				else:
+					# MTF выключен: анализатор вернул бы сигнал текущего таймфрейма
+					result = _signal_at(generator, i, STRATEGY_MODE)
 			except Exception as e:
 				logger.warning(f"Ошибка MTF на свече {i}: {e}")
 				continue
+			
+			signal = result.get("signal", "HOLD")
+			alignment_strength = result.get("alignment_strength", 0)
+			buy_score = result.get("buy_score", 0)
+			
+			# MTF сигнал - принимаем любой BUY, но адаптируем размер
+			if signal == "BUY":
+				# Адаптивный размер позиции на основе согласованности и buy_score
+				if alignment_strength >= 1.0:
+					# Полное согласие всех TF
+					position_size = 0.5
+				elif buy_score >= 1.0:
+					# Высокий weighted score
+					position_size = 0.4
+				elif buy_score >= 0.6:
+					# Средний score
+					position_size = 0.3
+				else:
+					# Низкий score - пропускаем
+					continue
+				
+				entry_bars.append(i)
+				position_sizes.append(position_size)
+				alignments.append(alignment_strength)
 		
-		# Статистика
-		total_trades = len(trades)
-		winning_trades = len([t for t in trades if t['pnl'] > 0])
-		losing_trades = len([t for t in trades if t['pnl'] < 0])
-		
-		total_pnl = sum(t['pnl'] for t in trades)
-		avg_pnl = total_pnl / total_trades if total_trades > 0 else 0
-		
-		win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
-		
-		final_balance = balance
-		roi = ((final_balance - initial_balance) / initial_balance) * 100
-		
-		return {
-			"total_trades": total_trades,
-			"winning_trades": winning_trades,
-			"losing_trades": losing_trades,
-			"win_rate": win_rate,
-			"total_pnl": total_pnl,
-			"avg_pnl": avg_pnl,
-			"roi": roi,
-			"final_balance": final_balance,
-			"trades": trades
-		}
+		# Фаза 2: сделки
+		trades, balance = _simulate_trades(closes, entry_bars, position_sizes, balance, alignments)
+		
+		return _trade_stats(trades, initial_balance, balance)
 	
 	def _compare_results(self, single_tf: Dict, mtf: Dict):
 		"""Сравнивает результаты single TF vs MTF"""
@@ -378,8 +398,8 @@ class MTFBacktest:
 			"interval": self.interval,
 			"lookback_days": self.lookback_days,
 			"timestamp": timestamp,
-			"single_tf": single_tf,
-			"mtf": mtf,
+			"single_tf": {**single_tf, "trades": _trade_records(single_tf["trades"])},
+			"mtf": {**mtf, "trades": _trade_records(mtf["trades"])},
 			"comparison": {
 				"win_rate_diff": win_rate_diff,
 				"roi_diff": roi_diff,
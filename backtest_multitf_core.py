@@ -0,0 +1,82 @@
+"""
+Ядро бэктеста multi-timeframe: поиск выхода из сделки по ценам закрытия.
+Компилируется Numba (@njit), без numba работает как обычный Python.
+
+Логика повторяет поиск выхода MTFBacktest (backtest_multitf.py):
+стоп-лосс / тейк-профит на следующих свечах, иначе выход по времени.
+"""
+import numpy as np
+from numba_compat import njit, prange
+
+# Причины выхода из сделки
+EXIT_STOP_LOSS = 0
+EXIT_TAKE_PROFIT = 1
+EXIT_TIME = 2
+# Обратное отображение: EXIT_NAMES[code]
+EXIT_NAMES = np.array(["SL", "TP", "TIME"], dtype=object)
+
+# Сколько свечей после входа проверяется SL/TP (свеча входа + 99 следующих)
+EXIT_SCAN_BARS = 100
+# Через сколько свечей выход по времени, если SL/TP не сработали
+EXIT_TIME_BARS = 50
+
+
+# Явная сигнатура: функция компилируется при импорте, cache=True сохраняет
+# машинный код на диск (__pycache__)
+SCAN_EXIT_SIGNATURE = "Tuple((i8, f8, i8))(f8[:], i8, f8, f8, i8, i8)"
+
+
+@njit(SCAN_EXIT_SIGNATURE, cache=True)
+def scan_exit(closes, i, stop_loss, take_profit, max_bars, time_bars):
+	"""
+	Выход из сделки, открытой на свече i.
+
+	Параметры:
+	- closes: float64-массив цен закрытия
+	- i: индекс свечи входа
+	- stop_loss, take_profit: уровни SL/TP (цены)
+	- max_bars: проверяются свечи i+1 .. i+max_bars-1
+	- time_bars: выход по времени на свече i+time_bars (не дальше последней)
+
+	Возвращает (exit_idx, exit_price, reason): SL/TP исполняются по уровню,
+	выход по времени — по цене закрытия свечи.
+	"""
+	n = closes.shape[0]
+	for j in range(i + 1, min(i + max_bars, n)):
+		price = closes[j]
+		if price <= stop_loss:
+			return j, stop_loss, EXIT_STOP_LOSS
+		elif price >= take_profit:
+			return j, take_profit, EXIT_TAKE_PROFIT
+
+	exit_idx = min(i + time_bars, n - 1)
+	return exit_idx, closes[exit_idx], EXIT_TIME
+
+
+SCAN_EXITS_SIGNATURE = "Tuple((i8[:], f8[:], i1[:]))(f8[:], i8[:], f8[:], f8[:], i8, i8)"
+
+
+# parallel=True: входы независимы, prange делит их между потоками Numba.
+# Процессы бэктеста запускаются через spawn (MTFBacktest.run): после fork()
+# загруженное parallel-ядро вешает родительский процесс на выходе
+@njit(SCAN_EXITS_SIGNATURE, cache=True, parallel=True)
+def scan_exits(closes, entry_bars, stop_losses, take_profits, max_bars, time_bars):
+	"""
+	Выходы для всех входов сразу: сделка зависит только от свечи входа и
+	своих уровней SL/TP, поэтому выходы не требуют баланса и ищутся независимо
+	(параллельно по входам). Баланс проходится после, последовательно.
+
+	Возвращает массивы (exit_bars, exit_prices, reasons) в порядке entry_bars.
+	"""
+	n_entries = entry_bars.shape[0]
+	exit_bars = np.empty(n_entries, dtype=np.int64)
+	exit_prices = np.empty(n_entries, dtype=np.float64)
+	reasons = np.empty(n_entries, dtype=np.int8)
+	for k in prange(n_entries):
+		exit_idx, exit_price, reason = scan_exit(
+			closes, entry_bars[k], stop_losses[k], take_profits[k], max_bars, time_bars
+		)
+		exit_bars[k] = exit_idx
+		exit_prices[k] = exit_price
+		reasons[k] = reason
+	return exit_bars, exit_prices, reasons
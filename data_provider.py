@@ -1,7 +1,10 @@
+import os
+import asyncio
 import aiohttp
 import pandas as pd
-from typing import List
+from typing import List, Optional, Tuple
 from logger import logger
+from json_compat import loads as json_loads
 from dataclasses import dataclass
 import time
 from config import API_TIMEOUT as API_TIMEOUT_SECONDS
@@ -22,14 +25,23 @@ class Kline:
 
 class DataProvider:
     BYBIT_KLINES = "https://api.bybit.com/v5/market/kline"
+    # Максимум свечей в одном ответе Bybit: больший limit загружается страницами
+    BYBIT_KLINES_PAGE_LIMIT = 1000
 
-    def __init__(self, session: aiohttp.ClientSession):
+    def __init__(self, session: aiohttp.ClientSession, cache_dir: Optional[str] = None):
+        """
+        cache_dir - каталог дискового кэша свечей (для бэктестов).
+        По умолчанию кэш выключен: живой торговле нужны свежие данные.
+        """
         self.session = session
+        self.cache_dir = cache_dir
 
     async def fetch_klines(self, symbol="BTCUSDT", interval="1m", limit=200, category=None):
         """
         Получение исторических свечей с Bybit API.
         Если категория не указана, автоматически пробует spot и linear.
+        limit больше BYBIT_KLINES_PAGE_LIMIT загружается параллельными
+        запросами по соседним временным окнам.
         """
 
         interval_map = {
@@ -40,7 +52,6 @@ class DataProvider:
 
         interval = interval_map.get(interval, interval)
         categories = [category] if category else ["spot", "linear"]
-        last_error = None
 
         # временные рамки (Bybit требует start/end для корректного возврата)
         now = int(time.time() * 1000)
@@ -58,6 +69,87 @@ class DataProvider:
                 interval_minutes = 15  # fallback
         start_time = now - limit * interval_minutes * 60 * 1000
 
+        # Дисковый кэш: ключ (symbol, interval, limit, текущий час)
+        cache_file = None
+        if self.cache_dir:
+            end_hour = now // (3600 * 1000)
+            cache_file = os.path.join(self.cache_dir, f"{symbol}_{interval}_{limit}_{end_hour}.pkl")
+            if os.path.exists(cache_file):
+                try:
+                    return pd.read_pickle(cache_file)
+                except Exception as e:
+                    logger.warning(f"Не удалось прочитать кэш свечей {cache_file}: {e}")
+
+        page_limit = self.BYBIT_KLINES_PAGE_LIMIT
+        if limit <= page_limit:
+            df, _ = await self._fetch_klines_page(symbol, interval, limit, start_time, now, categories)
+        else:
+            # Окна по page_limit свечей от текущего момента назад
+            interval_ms = interval_minutes * 60 * 1000
+            pages = []
+            for page_start in range(0, limit, page_limit):
+                page_end = now - page_start * interval_ms
+                count = min(page_limit, limit - page_start)
+                pages.append(self._fetch_klines_page(
+                    symbol, interval, count, page_end - count * interval_ms, page_end, categories
+                ))
+            frames = []
+            page_category = None
+            # Окна идут от нового к старому: после первого неудачного окна более
+            # старые отбрасываются, иначе в середине истории остаётся дыра
+            for page in await asyncio.gather(*pages, return_exceptions=True):
+                if isinstance(page, BaseException):
+                    # Старых окон может не быть (история пары короче): берём то, что есть
+                    if not frames or not isinstance(page, ValueError):
+                        raise page
+                    logger.warning(f"Часть истории {symbol} недоступна: {page}")
+                    # Неполный результат не кэшируется: ошибка могла быть временной
+                    cache_file = None
+                    break
+                page_df, cat = page
+                # Категорию задаёт самое новое окно: свечи spot и linear не склеиваются
+                if page_category is None:
+                    page_category = cat
+                elif cat != page_category:
+                    logger.warning(
+                        f"Часть истории {symbol} есть только в {cat}, а не в {page_category}: старые окна отброшены"
+                    )
+                    cache_file = None
+                    break
+                frames.append(page_df)
+            df = pd.concat(frames)
+            # Свечи на границах окон приходят дважды
+            df = df[~df.index.duplicated(keep="last")].sort_index()
+
+        if cache_file:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                df.to_pickle(cache_file)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить кэш свечей {cache_file}: {e}")
+            self._prune_klines_cache(f"{symbol}_{interval}_{limit}_", cache_file)
+        return df
+
+    def _prune_klines_cache(self, prefix: str, keep_file: str):
+        """Удаляет кэш свечей прошлых часов для того же ключа (symbol, interval, limit)"""
+        keep_name = os.path.basename(keep_file)
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefix) and name.endswith(".pkl") and name != keep_name:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError as e:
+                    logger.warning(f"Не удалось удалить устаревший кэш свечей {name}: {e}")
+
+    async def _fetch_klines_page(self, symbol, interval, limit, start_time, end_time, categories) -> Tuple[pd.DataFrame, str]:
+        """
+        Одно окно свечей [start_time, end_time] (мс); interval — в формате Bybit.
+        Возвращает (свечи, категория, из которой они получены).
+        """
+        last_error = None
         for cat in categories:
             params = {
                 "category": cat,
@@ -65,11 +157,12 @@ class DataProvider:
                 "interval": interval,
                 "limit": limit,
                 "start": start_time,
-                "end": now
+                "end": end_time
             }
 
             async with self.session.get(self.BYBIT_KLINES, params=params, timeout=API_TIMEOUT) as resp:
-                data = await resp.json()
+                # Тело ответа разбирается orjson (если установлен) — быстрее resp.json()
+                data = json_loads(await resp.read())
 
             if data.get("retCode") != 0:
                 last_error = data.get("retMsg", "Unknown error")
@@ -110,7 +203,7 @@ class DataProvider:
             df = df.sort_values("open_time").reset_index(drop=True)
             df.set_index("open_time", inplace=True)
             df = df.astype(float)
-            return df
+            return df, cat
 
         raise ValueError(f"Не удалось получить данные для {symbol}: {last_error}")
 
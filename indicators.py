@@ -14,6 +14,9 @@ from config import (
 	ATR_WINDOW, VOLUME_MA_WINDOW, VOLUME_HIGH_RATIO, VOLUME_MODERATE_RATIO, VOLUME_LOW_RATIO
 )
 
+# Минимум свечей для расчёта индикаторов (уменьшено для бэктестов)
+MIN_INDICATOR_CANDLES = max(50, EMA_LONG_WINDOW, RSI_WINDOW, MACD_SLOW, ADX_WINDOW)
+
 class IndicatorsCalculator:
 	"""
 	🧮 КАЛЬКУЛЯТОР ИНДИКАТОРОВ
@@ -27,6 +30,7 @@ class IndicatorsCalculator:
 		if "close" not in self.df.columns:
 			raise ValueError("DataFrame must contain 'close' column")
 		self.df.sort_index(inplace=True)
+		self._columns = None  # NumPy-колонки после compute_indicators_batch
 	
 	def compute_indicators(
 		self, ema_short_window=None, ema_long_window=None, rsi_window=None,
@@ -54,34 +58,117 @@ class IndicatorsCalculator:
 		else:
 			volatility_percent = 1.5  # Средняя волатильность по умолчанию
 		
-		# Адаптируем параметры на основе волатильности
-		# При высокой волатильности (>3%) → увеличиваем периоды (сглаживаем шум)
-		# При низкой волатильности (<1%) → уменьшаем периоды (быстрее реагируем)
-		
-		volatility_factor = 1.0  # Базовый множитель
-		if volatility_percent > 3.0:
-			volatility_factor = 1.3  # Увеличиваем периоды на 30%
-		elif volatility_percent > 2.0:
-			volatility_factor = 1.15  # Увеличиваем на 15%
-		elif volatility_percent < 0.8:
-			volatility_factor = 0.85  # Уменьшаем на 15%
-		elif volatility_percent < 1.2:
-			volatility_factor = 0.95  # Уменьшаем на 5%
+		volatility_factor = float(self._volatility_factor(volatility_percent))
 		
 		# Используем значения из config с адаптацией, если не переданы явно
+		if rsi_window is None:
+			rsi_window = max(10, int(RSI_WINDOW * volatility_factor))
+		windows = self._adaptive_windows(
+			volatility_factor, ema_short_window, ema_long_window,
+			macd_fast, macd_slow, macd_signal
+		)
+		
+		self._compute_columns(windows)
+		self.df.ffill(inplace=True)
+		self.df.bfill(inplace=True)
+		return self.df
+	
+	def compute_indicators_batch(self) -> pd.DataFrame:
+		"""
+		📊 ВЫЧИСЛЕНИЕ ИНДИКАТОРОВ ДЛЯ КАЖДОЙ СВЕЧИ (ДЛЯ БЭКТЕСТОВ)
+		
+		Строка i совпадает с последней строкой compute_indicators() на срезе df[:i+1],
+		но вся история считается за один проход вместо пересчёта на каждом срезе.
+		Индикаторы ta причинные, поэтому достаточно:
+		- выбирать адаптивные периоды EMA/MACD по волатильности самой свечи i;
+		- заполнять пропуски только вперёд (bfill заглядывал бы в будущее).
+		"""
+		close = self.df["close"].astype(float)
+		high = self.df["high"].astype(float)
+		low = self.df["low"].astype(float)
+		n = len(self.df)
+		
+		# Волатильность на каждой свече (как временный ATR в compute_indicators)
+		volatility_percent = np.full(n, 1.5)
+		if n >= ATR_WINDOW:
+			atr = ta.volatility.average_true_range(high, low, close, window=ATR_WINDOW).to_numpy()
+			prices = close.to_numpy()
+			ready = (np.arange(n) >= ATR_WINDOW - 1) & (prices > 0)
+			volatility_percent[ready] = atr[ready] / prices[ready] * 100
+		factors = self._volatility_factor(volatility_percent)
+		
+		# Неадаптивные индикаторы одинаковы для всех свечей
+		last_windows = self._adaptive_windows(float(factors[-1])) if n else self._adaptive_windows(1.0)
+		self._compute_columns(last_windows)
+		
+		# Адаптивные колонки пересчитываем для каждого встретившегося множителя
+		for factor in np.unique(factors):
+			windows = self._adaptive_windows(float(factor))
+			if windows == last_windows:
+				continue
+			mask = factors == factor
+			for name, series in self._adaptive_columns(close, windows).items():
+				self.df[name] = np.where(mask, series.to_numpy(), self.df[name].to_numpy())
+		
+		self.df.ffill(inplace=True)
+		
+		# Колонки как NumPy-массивы: get_indicators_data(i) читает значения без iloc по DataFrame
+		self._columns = {name: self.df[name].to_numpy() for name in self.df.columns}
+		return self.df
+	
+	@staticmethod
+	def _volatility_factor(volatility_percent):
+		"""
+		Множитель периодов по волатильности (ATR в % от цены).
+		Принимает скаляр или массив.
+		"""
+		# При высокой волатильности (>3%) → увеличиваем периоды (сглаживаем шум)
+		# При низкой волатильности (<1%) → уменьшаем периоды (быстрее реагируем)
+		volatility_percent = np.asarray(volatility_percent, dtype=float)
+		return np.select(
+			[volatility_percent > 3.0, volatility_percent > 2.0, volatility_percent < 0.8, volatility_percent < 1.2],
+			[1.3, 1.15, 0.85, 0.95],  # +30%, +15%, -15%, -5%
+			default=1.0
+		)
+	
+	@staticmethod
+	def _adaptive_windows(
+		volatility_factor: float, ema_short_window=None, ema_long_window=None,
+		macd_fast=None, macd_slow=None, macd_signal=None
+	) -> tuple:
+		"""Периоды EMA/MACD с адаптацией под волатильность (если не заданы явно)"""
 		if ema_short_window is None:
 			ema_short_window = max(8, int(EMA_SHORT_WINDOW * volatility_factor))
 		if ema_long_window is None:
 			ema_long_window = max(20, int(EMA_LONG_WINDOW * volatility_factor))
-		if rsi_window is None:
-			rsi_window = max(10, int(RSI_WINDOW * volatility_factor))
 		if macd_fast is None:
 			macd_fast = max(10, int(MACD_FAST * volatility_factor))
 		if macd_slow is None:
 			macd_slow = max(20, int(MACD_SLOW * volatility_factor))
 		if macd_signal is None:
 			macd_signal = max(7, int(MACD_SIGNAL * volatility_factor))
-		
+		return ema_short_window, ema_long_window, macd_fast, macd_slow, macd_signal
+	
+	def _adaptive_columns(self, close: pd.Series, windows: tuple) -> Dict[str, pd.Series]:
+		"""EMA_short/EMA_long/MACD для заданных периодов"""
+		ema_short_window, ema_long_window, macd_fast, macd_slow, macd_signal = windows
+		columns = {
+			"EMA_short": ta.trend.ema_indicator(close, window=ema_short_window) if len(close) >= ema_short_window else pd.Series([np.nan]*len(close), index=close.index),
+			"EMA_long": ta.trend.ema_indicator(close, window=ema_long_window) if len(close) >= ema_long_window else pd.Series([np.nan]*len(close), index=close.index),
+		}
+		if len(close) >= max(macd_slow, macd_fast, macd_signal):
+			macd = ta.trend.MACD(close, window_slow=macd_slow, window_fast=macd_fast, window_sign=macd_signal)
+			columns["MACD"] = macd.macd()
+			columns["MACD_signal"] = macd.macd_signal()
+			columns["MACD_hist"] = macd.macd_diff()
+		else:
+			columns["MACD"] = pd.Series([np.nan]*len(close), index=close.index)
+			columns["MACD_signal"] = pd.Series([np.nan]*len(close), index=close.index)
+			columns["MACD_hist"] = pd.Series([np.nan]*len(close), index=close.index)
+		return columns
+	
+	def _compute_columns(self, windows: tuple):
+		"""Записывает все индикаторы в self.df для заданных периодов EMA/MACD"""
 		close = self.df["close"].astype(float)
 		high = self.df["high"].astype(float)
 		low = self.df["low"].astype(float)
@@ -137,45 +224,36 @@ class IndicatorsCalculator:
 		self.df["Stoch_D"] = ta.momentum.stoch_signal(high, low, close, window=STOCH_WINDOW, smooth_window=STOCH_SMOOTH_WINDOW) if len(self.df) >= STOCH_WINDOW else pd.Series([np.nan]*len(self.df), index=self.df.index)
 
 		# Базовые индикаторы (ИСПРАВЛЕНО: убрано дублирование RSI)
-		self.df["EMA_short"] = ta.trend.ema_indicator(close, window=ema_short_window) if len(self.df) >= ema_short_window else pd.Series([np.nan]*len(self.df), index=self.df.index)
-		self.df["EMA_long"] = ta.trend.ema_indicator(close, window=ema_long_window) if len(self.df) >= ema_long_window else pd.Series([np.nan]*len(self.df), index=self.df.index)
 		# RSI уже рассчитан выше, не дублируем
-		if len(self.df) >= max(macd_slow, macd_fast, macd_signal):
-			macd = ta.trend.MACD(close, window_slow=macd_slow, window_fast=macd_fast, window_sign=macd_signal)
-			self.df["MACD"] = macd.macd()
-			self.df["MACD_signal"] = macd.macd_signal()
-			self.df["MACD_hist"] = macd.macd_diff()
-		else:
-			self.df["MACD"] = pd.Series([np.nan]*len(self.df), index=self.df.index)
-			self.df["MACD_signal"] = pd.Series([np.nan]*len(self.df), index=self.df.index)
-			self.df["MACD_hist"] = pd.Series([np.nan]*len(self.df), index=self.df.index)
-
-		self.df.ffill(inplace=True)
-		self.df.bfill(inplace=True)
-		return self.df
+		for name, series in self._adaptive_columns(close, windows).items():
+			self.df[name] = series
 	
-	def get_indicators_data(self) -> Dict[str, Any]:
+	def get_indicators_data(self, index: Optional[int] = None) -> Dict[str, Any]:
 		"""
 		📊 ПОЛУЧЕНИЕ ДАННЫХ ИНДИКАТОРОВ
 		
 		Возвращает словарь с текущими значениями всех индикаторов.
+		index - номер свечи (после compute_indicators_batch), по умолчанию последняя.
 		"""
 		if self.df.empty:
 			raise ValueError("DataFrame is empty")
 		
-		# Проверяем минимальное количество данных (уменьшено для бэктестов)
-		min_required = max(50, EMA_LONG_WINDOW, RSI_WINDOW, MACD_SLOW, ADX_WINDOW)
-		if len(self.df) < min_required:
-			raise ValueError(f"Недостаточно данных для расчёта индикаторов: {len(self.df)} < {min_required}")
+		# Проверяем минимальное количество данных
+		available = len(self.df) if index is None else index + 1
+		if available < MIN_INDICATOR_CANDLES:
+			raise ValueError(f"Недостаточно данных для расчёта индикаторов: {available} < {MIN_INDICATOR_CANDLES}")
 		
-		last = self.df.iloc[-1]
+		if index is None:
+			last = self.df.iloc[-1]
+		else:
+			last = {name: values[index] for name, values in self._columns.items()}
 		price = float(last["close"])
 		
 		# Проверяем наличие обязательных индикаторов
 		required_indicators = ["EMA_short", "EMA_long", "RSI", "MACD", "MACD_signal", "MACD_hist"]
 		missing_indicators = []
 		for indicator in required_indicators:
-			if indicator not in last.index or pd.isna(last[indicator]):
+			if indicator not in last or pd.isna(last[indicator]):
 				missing_indicators.append(indicator)
 		
 		if missing_indicators:
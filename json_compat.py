@@ -0,0 +1,27 @@
+"""
+Быстрая (де)сериализация JSON.
+Использует orjson, если установлен; иначе — стандартный json с тем же результатом.
+"""
+import json
+from typing import Any
+from logger import logger
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+	logger.warning("orjson не установлен — используется стандартный json. Установите: pip install orjson")
+
+
+def dumps_pretty(obj: Any) -> bytes:
+	"""JSON с отступом 2 (UTF-8, без экранирования не-ASCII); неизвестные типы -> str"""
+	if orjson is not None:
+		return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY, default=str)
+	return json.dumps(obj, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+	"""Разбирает JSON из bytes/str"""
+	if orjson is not None:
+		return orjson.loads(data)
+	return json.loads(data)
@@ -30,7 +30,7 @@ class MarketRegimeDetector:
 			raise ValueError("DataFrame must contain 'close' column")
 		self.df.sort_index(inplace=True)
 	
-	def detect_market_regime(self, indicators_data: Dict[str, Any]) -> Dict[str, Any]:
+	def detect_market_regime(self, indicators_data: Dict[str, Any], closes: Optional[np.ndarray] = None) -> Dict[str, Any]:
 		"""
 		🎯 ОПРЕДЕЛЕНИЕ РЕЖИМА РЫНКА
 		
@@ -38,6 +38,7 @@ class MarketRegimeDetector:
 		
 		Параметры:
 		- indicators_data: словарь с данными индикаторов
+		- closes: цены закрытия до текущей свечи включительно (по умолчанию из self.df)
 		
 		Возвращает:
 		- dict: режим рынка и детализация анализа
@@ -62,9 +63,12 @@ class MarketRegimeDetector:
 		trend_strength = 0  # R² от 0 до 1
 		trend_direction = 0  # -1 (down), 0 (neutral), +1 (up)
 		
-		if len(self.df) >= 20:
+		if closes is None:
+			closes = self.df['close'].values
+		
+		if len(closes) >= 20:
 			# Последние 20 цен закрытия
-			prices = self.df['close'].iloc[-20:].values
+			prices = closes[-20:]
 			x = np.arange(len(prices))
 			
 			# Линейная регрессия: y = slope * x + intercept
@@ -1,6 +1,6 @@
 import asyncio
 import pandas as pd
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from logger import logger
 from config import (
 	USE_MULTI_TIMEFRAME, MTF_TIMEFRAMES, MTF_WEIGHTS, MTF_MIN_AGREEMENT, MTF_FULL_ALIGNMENT_BONUS,
@@ -54,7 +54,6 @@ class MultiTimeframeAnalyzer:
 			else:
 				return sg.generate_signal()
 		
-		reasons = []
 		timeframe_signals = {}
 		
 		# ====================================================================
@@ -100,38 +99,14 @@ class MultiTimeframeAnalyzer:
 			logger.debug(f"MTF: обработка {tf} (index={i})")
 			if isinstance(tf_data[i], Exception):
 				logger.warning(f"MTF: ошибка данных для {tf}: {tf_data[i]}")
-				timeframe_signals[tf] = {
-					"signal": "HOLD",
-					"price": 0,
-					"RSI": 0,
-					"ADX": 0,
-					"MACD_hist": 0,
-					"market_regime": "NEUTRAL",
-					"bullish_votes": 0,
-					"bearish_votes": 0,
-					"weight": MTF_WEIGHTS.get(tf, 0),
-					"confidence": 0,
-					"error": str(tf_data[i])
-				}
+				timeframe_signals[tf] = self._timeframe_error(tf, str(tf_data[i]))
 				continue
 			
 			df = tf_data[i]
 			logger.debug(f"MTF: DataFrame для {tf}: {len(df) if not df.empty else 0} строк")
 			if df.empty:
 				logger.warning(f"MTF: пустой DataFrame для {tf}")
-				timeframe_signals[tf] = {
-					"signal": "HOLD",
-					"price": 0,
-					"RSI": 0,
-					"ADX": 0,
-					"MACD_hist": 0,
-					"market_regime": "NEUTRAL",
-					"bullish_votes": 0,
-					"bearish_votes": 0,
-					"weight": MTF_WEIGHTS.get(tf, 0),
-					"confidence": 0,
-					"error": "Empty dataframe"
-				}
+				timeframe_signals[tf] = self._timeframe_error(tf, "Empty dataframe")
 				continue
 			
 			# Создаём отдельный генератор для этого таймфрейма
@@ -148,46 +123,104 @@ class MultiTimeframeAnalyzer:
 					signal_result = sg.generate_signal()
 				
 				# Сохраняем результат
-				signal = signal_result.get("signal", "HOLD")
-				price = signal_result.get("price", 0)
-				rsi = signal_result.get("RSI", 0)
-				adx = signal_result.get("ADX", 0)
-				
-				logger.info(f"MTF: {tf} → {signal} (цена={price:.2f}, RSI={rsi:.1f}, ADX={adx:.1f})")
-				
-				timeframe_signals[tf] = {
-					"signal": signal,
-					"price": price,
-					"RSI": rsi,
-					"ADX": adx,
-					"MACD_hist": signal_result.get("MACD_hist", 0),
-					"market_regime": signal_result.get("market_regime", "NEUTRAL"),
-					"bullish_votes": signal_result.get("bullish_votes", 0),
-					"bearish_votes": signal_result.get("bearish_votes", 0),
-					"weight": MTF_WEIGHTS.get(tf, 0),
-					"confidence": signal_result.get("confidence", 0)
-				}
+				sig_data = self._timeframe_signal(tf, signal_result)
+				logger.info(f"MTF: {tf} → {sig_data['signal']} (цена={sig_data['price']:.2f}, RSI={sig_data['RSI']:.1f}, ADX={sig_data['ADX']:.1f})")
+				timeframe_signals[tf] = sig_data
 				
 			except Exception as e:
 				logger.error(f"Ошибка генерации сигнала для {tf}: {e}", exc_info=True)
-				timeframe_signals[tf] = {
-					"signal": "HOLD",
-					"price": 0,
-					"RSI": 0,
-					"ADX": 0,
-					"MACD_hist": 0,
-					"market_regime": "NEUTRAL",
-					"bullish_votes": 0,
-					"bearish_votes": 0,
-					"weight": MTF_WEIGHTS.get(tf, 0),
-					"confidence": 0,
-					"error": str(e)
-				}
+				timeframe_signals[tf] = self._timeframe_error(tf, str(e))
+		
+		return self._combine_timeframe_signals(timeframe_signals, strategy)
+	
+	def generate_signal_multi_timeframe_offline(
+		self,
+		mtf_batches: Dict[str, Tuple[Any, pd.DatetimeIndex]],
+		current_time: pd.Timestamp,
+		strategy: str = "TREND_FOLLOWING"
+	) -> Dict[str, Any]:
+		"""
+		MULTI-TIMEFRAME ANALYSIS по заранее загруженным свечам (для бэктестов)
 		
+		Параметры:
+		- mtf_batches: {таймфрейм: (SignalGenerator с пакетными индикаторами,
+		  время закрытия его свечей)}
+		- current_time: момент анализа — учитываются только свечи, закрытые к нему
+		- strategy: "TREND_FOLLOWING", "MEAN_REVERSION", или "HYBRID"
+		
+		Возвращает тот же результат, что generate_signal_multi_timeframe().
+		"""
+		timeframe_signals = {}
+		
+		for tf in MTF_TIMEFRAMES:
+			if tf not in mtf_batches:
+				timeframe_signals[tf] = self._timeframe_error(tf, "No data")
+				continue
+			
+			sg, close_times = mtf_batches[tf]
+			# Последняя свеча таймфрейма, закрытая к current_time
+			j = int(close_times.searchsorted(current_time, side="right")) - 1
+			if j < 0:
+				timeframe_signals[tf] = self._timeframe_error(tf, "No closed candles")
+				continue
+			
+			try:
+				if strategy == "MEAN_REVERSION":
+					signal_result = sg.generate_signal_mean_reversion_at(j)
+				elif strategy == "HYBRID":
+					signal_result = sg.generate_signal_hybrid_at(j)
+				else:
+					signal_result = sg.generate_signal_at(j, strict=False)
+				timeframe_signals[tf] = self._timeframe_signal(tf, signal_result)
+			except Exception as e:
+				logger.warning(f"Ошибка генерации сигнала для {tf} на {current_time}: {e}")
+				timeframe_signals[tf] = self._timeframe_error(tf, str(e))
+		
+		return self._combine_timeframe_signals(timeframe_signals, strategy)
+	
+	@staticmethod
+	def _timeframe_signal(tf: str, signal_result: Dict[str, Any]) -> Dict[str, Any]:
+		"""Данные сигнала таймфрейма для weighted voting"""
+		return {
+			"signal": signal_result.get("signal", "HOLD"),
+			"price": signal_result.get("price", 0),
+			"RSI": signal_result.get("RSI", 0),
+			"ADX": signal_result.get("ADX", 0),
+			"MACD_hist": signal_result.get("MACD_hist", 0),
+			"market_regime": signal_result.get("market_regime", "NEUTRAL"),
+			"bullish_votes": signal_result.get("bullish_votes", 0),
+			"bearish_votes": signal_result.get("bearish_votes", 0),
+			"weight": MTF_WEIGHTS.get(tf, 0),
+			"confidence": signal_result.get("confidence", 0)
+		}
+	
+	@staticmethod
+	def _timeframe_error(tf: str, error: str) -> Dict[str, Any]:
+		"""HOLD таймфрейма, для которого нет данных или сигнала"""
+		return {
+			"signal": "HOLD",
+			"price": 0,
+			"RSI": 0,
+			"ADX": 0,
+			"MACD_hist": 0,
+			"market_regime": "NEUTRAL",
+			"bullish_votes": 0,
+			"bearish_votes": 0,
+			"weight": MTF_WEIGHTS.get(tf, 0),
+			"confidence": 0,
+			"error": error
+		}
+	
+	def _combine_timeframe_signals(self, timeframe_signals: Dict[str, Dict[str, Any]], strategy: str) -> Dict[str, Any]:
+		"""
+		Объединяет сигналы таймфреймов через weighted voting
+		и проверку согласованности (alignment).
+		"""
 		# ====================================================================
 		# 3. WEIGHTED VOTING
 		# ====================================================================
 		
+		reasons = []
 		buy_score = 0.0
 		sell_score = 0.0
 		hold_score = 0.0
@@ -0,0 +1,20 @@
+"""
+Совместимость с Numba.
+Если numba не установлена, @njit возвращает функцию без изменений
+и код бэктестов работает как обычный Python (медленнее, но с тем же результатом).
+"""
+from logger import logger
+
+try:
+	from numba import njit, prange
+	NUMBA_AVAILABLE = True
+except ImportError:
+	NUMBA_AVAILABLE = False
+	prange = range
+	logger.warning("numba не установлена — бэктест работает без JIT. Установите: pip install numba")
+
+	def njit(*args, **kwargs):
+		"""Заглушка @njit: поддерживает и @njit, и @njit(...)"""
+		if len(args) == 1 and callable(args[0]) and not kwargs:
+			return args[0]
+		return lambda func: func
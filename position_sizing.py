@@ -59,6 +59,10 @@ def get_position_size_percent(
 	return final_size
 
 
+# Типы сделок, закрывающих позицию (учитываются в Kelly)
+_KELLY_CLOSE_TYPES = ("SELL", "STOP-LOSS", "TRAILING-STOP", "TIME-EXIT")
+
+
 def calculate_kelly_fraction(trades_history: List[Dict[str, Any]], atr_percent: float, balance: float = None) -> float:
 	"""
 	Рассчитывает Kelly fraction для оптимального размера позиции.
@@ -73,12 +77,17 @@ def calculate_kelly_fraction(trades_history: List[Dict[str, Any]], atr_percent:
 	if balance is not None and balance < SMALL_BALANCE_THRESHOLD:
 		return 1.0  # Нейтральный множитель для малых балансов
 	
-	# Берём только закрытые сделки (BUY и соответствующие closes)
-	closed_trades = [
-		t for t in trades_history 
-		if t.get("type") in ["SELL", "STOP-LOSS", "TRAILING-STOP", "TIME-EXIT"]
-		and t.get("profit") is not None
-	]
+	# Берём только закрытые сделки (BUY и соответствующие closes).
+	# История просматривается с конца и только до заполнения окна:
+	# стоимость расчёта не растёт с числом сделок
+	needed = max(KELLY_LOOKBACK_WINDOW, MIN_TRADES_FOR_KELLY) if KELLY_LOOKBACK_WINDOW > 0 else None
+	closed_trades = []
+	for t in reversed(trades_history):
+		if t.get("type") in _KELLY_CLOSE_TYPES and t.get("profit") is not None:
+			closed_trades.append(t)
+			if needed is not None and len(closed_trades) >= needed:
+				break
+	closed_trades.reverse()
 	
 	# Недостаточно данных для расчёта Kelly
 	if len(closed_trades) < MIN_TRADES_FOR_KELLY:
@@ -0,0 +1,29 @@
+"""
+Предварительная компиляция Numba-ядер бэктестов.
+
+Ядра объявлены с явными сигнатурами и cache=True: импорт модуля компилирует
+их и сохраняет машинный код в __pycache__. Достаточно запустить скрипт один раз
+(например, при сборке Docker-образа) — дальше бэктесты только читают кэш.
+
+Использование:
+	python precompile.py
+"""
+import time
+from numba_compat import NUMBA_AVAILABLE
+
+
+def main():
+	if not NUMBA_AVAILABLE:
+		print("numba не установлена — компилировать нечего")
+		return
+	
+	start = time.perf_counter()
+	import backtest_core  # noqa: F401
+	import backtest_hybrid_core  # noqa: F401
+	import backtest_mean_reversion_core  # noqa: F401
+	import backtest_multitf_core  # noqa: F401
+	print(f"Numba-ядра скомпилированы и закэшированы за {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+	main()
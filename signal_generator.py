@@ -11,11 +11,15 @@ from config import (
 	BAYESIAN_MIN_PROBABILITY, BAYESIAN_MIN_SAMPLES,
 	ZSCORE_WINDOW, ZSCORE_BUY_THRESHOLD, ZSCORE_SELL_THRESHOLD,
 	MARKOV_WINDOW, MARKOV_VOL_HIGH, MARKOV_VOL_LOW, MARKOV_TREND_THRESHOLD,
-	ENSEMBLE_BAYESIAN_WEIGHT, ENSEMBLE_ZSCORE_WEIGHT, ENSEMBLE_REGIME_WEIGHT
+	ENSEMBLE_BAYESIAN_WEIGHT, ENSEMBLE_ZSCORE_WEIGHT, ENSEMBLE_REGIME_WEIGHT,
+	# Веса голосования
+	TRENDING_TREND_WEIGHT, TRENDING_OSCILLATOR_WEIGHT,
+	RANGING_TREND_WEIGHT, RANGING_OSCILLATOR_WEIGHT,
+	TRANSITIONING_TREND_WEIGHT, TRANSITIONING_OSCILLATOR_WEIGHT
 )
 
 # Импортируем модули
-from indicators import IndicatorsCalculator
+from indicators import IndicatorsCalculator, MIN_INDICATOR_CANDLES
 from market_regime import MarketRegimeDetector
 from strategies import MeanReversionStrategy, HybridStrategy
 from multi_timeframe import MultiTimeframeAnalyzer
@@ -32,6 +36,22 @@ except ImportError:
 	STATISTICAL_MODELS_AVAILABLE = False
 	logger.warning("Статистические модели не доступны")
 
+# Коды сигналов для бэктестов (сравнение int8 вместо строк в горячем цикле)
+SIGNAL_HOLD = 0
+SIGNAL_BUY = 1
+SIGNAL_SELL = -1
+SIGNAL_CODES = {"HOLD": SIGNAL_HOLD, "BUY": SIGNAL_BUY, "SELL": SIGNAL_SELL}
+# Обратное отображение: SIGNAL_NAMES[code + 1]
+SIGNAL_NAMES = np.array(["SELL", "HOLD", "BUY"], dtype=object)
+
+# Голоса — суммы весов: при целых весах хватает int16, иначе float64
+_VOTE_WEIGHTS = (
+	TRENDING_TREND_WEIGHT, TRENDING_OSCILLATOR_WEIGHT,
+	RANGING_TREND_WEIGHT, RANGING_OSCILLATOR_WEIGHT,
+	TRANSITIONING_TREND_WEIGHT, TRANSITIONING_OSCILLATOR_WEIGHT,
+)
+VOTE_DTYPE = np.int16 if all(float(w).is_integer() for w in _VOTE_WEIGHTS) else np.float64
+
 class SignalGenerator:
 	def __init__(self, df: pd.DataFrame, use_statistical_models: bool = False):
 		self.df = df.copy()
@@ -45,6 +65,13 @@ class SignalGenerator:
 		self.mean_reversion_strategy = MeanReversionStrategy(self.df)
 		self.hybrid_strategy = HybridStrategy(self.df, self, self.mean_reversion_strategy)
 		
+		# Цены закрытия после пакетного расчёта индикаторов (для generate_signal_at)
+		self._batch_closes: Optional[np.ndarray] = None
+		
+		# Генераторы старших таймфреймов для generate_signal_multi_timeframe_offline
+		self._mtf_frames: Optional[Dict[str, pd.DataFrame]] = None
+		self._mtf_batches: Dict[str, Any] = {}
+		
 		# Статистические модели (опционально)
 		self.use_statistical_models = use_statistical_models and STATISTICAL_MODELS_AVAILABLE
 		if self.use_statistical_models:
@@ -127,6 +154,7 @@ class SignalGenerator:
 			ema_short_window, ema_long_window, rsi_window,
 			macd_fast, macd_slow, macd_signal
 		)
+		self._batch_closes = None
 		
 		# Обновляем все модули с новым DataFrame
 		self.market_regime_detector.df = self.df.copy()
@@ -150,26 +178,118 @@ class SignalGenerator:
 		except ValueError as e:
 			# Недостаточно данных для расчета индикаторов
 			logger.warning(f"Недостаточно данных для расчёта индикаторов: {e}")
-			return {
-				"signal": "HOLD",
-				"reasons": [f"⚠️ Недостаточно данных для расчёта индикаторов"],
-				"price": float(self.df["close"].iloc[-1]),
-				"market_regime": "NONE",
-				"bullish_votes": 0,
-				"bearish_votes": 0,
-				"vote_delta": 0,
-				"filters_passed": 0,
-				"short_enabled": False,
-				"short_conditions": [],
-				"indicators": {
-					"RSI": "н/д",
-					"ADX": "н/д",
-					"MACD": "н/д"
-				}
+			return self._insufficient_data_signal(float(self.df["close"].iloc[-1]))
+		
+		return self._decide_signal(indicators_data)
+	
+	@staticmethod
+	def _insufficient_data_signal(price: float) -> Dict[str, Any]:
+		"""HOLD, когда для расчёта индикаторов не хватает данных"""
+		return {
+			"signal": "HOLD",
+			"reasons": [f"⚠️ Недостаточно данных для расчёта индикаторов"],
+			"price": price,
+			"market_regime": "NONE",
+			"bullish_votes": 0,
+			"bearish_votes": 0,
+			"vote_delta": 0,
+			"filters_passed": 0,
+			"short_enabled": False,
+			"short_conditions": [],
+			"indicators": {
+				"RSI": "н/д",
+				"ADX": "н/д",
+				"MACD": "н/д"
 			}
+		}
+	
+	def generate_signals_vectorized(self, start_index: int = 0) -> pd.DataFrame:
+		"""
+		⚡ ПАКЕТНАЯ ГЕНЕРАЦИЯ СИГНАЛОВ ДЛЯ БЭКТЕСТА
+		
+		Эквивалент generate_signal() на каждом срезе df[:i+1], но индикаторы
+		считаются один раз по всей истории: O(N) вместо O(N²).
+		
+		Возвращает DataFrame (индекс как у self.df) с колонками:
+		signal, signal_code, price, ATR, bullish_votes, bearish_votes.
+		Свечи до start_index и до прогрева индикаторов (MIN_INDICATOR_CANDLES)
+		не вычисляются и остаются HOLD с ATR = 0.
+		"""
+		self.compute_indicators_batch()
+		n = len(self.df)
+		closes = self._batch_closes
 		
+		# Колонки результата (struct-of-arrays): заполняются на месте, без списков словарей
+		signal_codes = np.full(n, SIGNAL_HOLD, dtype=np.int8)
+		atrs = np.zeros(n, dtype=np.float64)
+		bullish_votes = np.zeros(n, dtype=VOTE_DTYPE)
+		bearish_votes = np.zeros(n, dtype=VOTE_DTYPE)
+		
+		for i in range(max(start_index, MIN_INDICATOR_CANDLES - 1), n):
+			try:
+				result = self.generate_signal_at(i)
+			except ValueError:
+				# Недостаточно данных на этой свече — HOLD (как в generate_signal)
+				continue
+			
+			signal_codes[i] = SIGNAL_CODES[result["signal"]]
+			atrs[i] = result["ATR"]
+			bullish_votes[i] = result["bullish_votes"]
+			bearish_votes[i] = result["bearish_votes"]
+		
+		return pd.DataFrame({
+			"signal": SIGNAL_NAMES[signal_codes + 1],
+			"signal_code": signal_codes,
+			"price": closes,
+			"ATR": atrs,
+			"bullish_votes": bullish_votes,
+			"bearish_votes": bearish_votes,
+		}, index=self.df.index)
+	
+	def compute_indicators_batch(self) -> pd.DataFrame:
+		"""
+		Пакетный расчёт индикаторов по всей истории (без заглядывания вперёд)
+		для последующих вызовов generate_signal_at(i).
+		"""
+		self.df = self.indicators_calculator.compute_indicators_batch()
+		self._batch_closes = self.df["close"].to_numpy(dtype=float)
+		
+		# Стратегиям гибридного режима — та же история с индикаторами
+		self.mean_reversion_strategy.df = self.df.copy()
+		self.mean_reversion_strategy.compute_batch()
+		self.hybrid_strategy.df = self.df.copy()
+		self.hybrid_strategy.compute_batch()
+		return self.df
+	
+	def generate_signal_at(self, i: int, strict: bool = True) -> Dict[str, Any]:
+		"""
+		Сигнал на свече i по заранее посчитанным индикаторам —
+		то же, что generate_signal() на срезе df[:i+1].
+		Если на свече i недостаточно данных: при strict бросает ValueError,
+		иначе возвращает HOLD, как generate_signal().
+		"""
+		if self._batch_closes is None:
+			self.compute_indicators_batch()
+		
+		try:
+			indicators_data = self.indicators_calculator.get_indicators_data(i)
+		except ValueError as e:
+			if strict:
+				raise
+			logger.warning(f"Недостаточно данных для расчёта индикаторов: {e}")
+			return self._insufficient_data_signal(float(self._batch_closes[i]))
+		# closes[:i+1] — view без копирования; срез DataFrame строится только для ансамбля
+		return self._decide_signal(indicators_data, self._batch_closes[:i+1])
+	
+	def _decide_signal(
+		self, indicators_data: Dict[str, Any], closes: Optional[np.ndarray] = None
+	) -> Dict[str, Any]:
+		"""
+		Принятие решения по данным индикаторов текущей свечи.
+		closes - цены закрытия до текущей свечи включительно (по умолчанию весь self.df).
+		"""
 		# Определяем режим рынка
-		regime_data = self.market_regime_detector.detect_market_regime(indicators_data)
+		regime_data = self.market_regime_detector.detect_market_regime(indicators_data, closes)
 		
 		# Анализируем систему голосования
 		voting_data = self.market_regime_detector.analyze_voting_system(indicators_data, regime_data)
@@ -240,8 +360,10 @@ class SignalGenerator:
 		
 		if self.use_statistical_models and signal != "HOLD":
 			try:
+				# Срез истории нужен только здесь (сигнал не HOLD)
+				history = self.df if closes is None else self.df.iloc[:len(closes)]
 				ensemble_decision = self.ensemble.make_decision(
-					self.df,
+					history,
 					base_result,
 					min_probability=BAYESIAN_MIN_PROBABILITY,
 					min_samples=BAYESIAN_MIN_SAMPLES
@@ -341,6 +463,15 @@ class SignalGenerator:
 		"""
 		return self.mean_reversion_strategy.generate_signal()
 	
+	def generate_signal_mean_reversion_at(self, i: int) -> Dict[str, Any]:
+		"""
+		Mean reversion сигнал на свече i по заранее посчитанным индикаторам —
+		то же, что generate_signal_mean_reversion() на срезе df[:i+1].
+		"""
+		if self._batch_closes is None:
+			self.compute_indicators_batch()
+		return self.mean_reversion_strategy.generate_signal_at(i)
+	
 	def generate_signal_hybrid(self, last_mode: str = None, last_mode_time: float = 0) -> Dict[str, Any]:
 		"""
 		🔀 ГИБРИДНАЯ СТРАТЕГИЯ
@@ -349,6 +480,15 @@ class SignalGenerator:
 		"""
 		return self.hybrid_strategy.generate_signal(last_mode, last_mode_time)
 	
+	def generate_signal_hybrid_at(self, i: int, last_mode: str = None, last_mode_time: float = 0) -> Dict[str, Any]:
+		"""
+		Гибридный сигнал на свече i по заранее посчитанным индикаторам —
+		то же, что generate_signal_hybrid() на срезе df[:i+1].
+		"""
+		if self._batch_closes is None:
+			self.compute_indicators_batch()
+		return self.hybrid_strategy.generate_signal(last_mode, last_mode_time, i)
+	
 	async def generate_signal_multi_timeframe(
 		self,
 		data_provider,
@@ -362,3 +502,28 @@ class SignalGenerator:
 		"""
 		mtf_analyzer = MultiTimeframeAnalyzer(lambda df=None: SignalGenerator(df if df is not None else self.df, self.use_statistical_models))
 		return await mtf_analyzer.generate_signal_multi_timeframe(data_provider, symbol, strategy)
+	
+	def generate_signal_multi_timeframe_offline(
+		self,
+		mtf_frames: Dict[str, pd.DataFrame],
+		current_time: pd.Timestamp,
+		strategy: str = "TREND_FOLLOWING"
+	) -> Dict[str, Any]:
+		"""
+		🔀 MULTI-TIMEFRAME ANALYSIS ДЛЯ БЭКТЕСТА
+		
+		То же, что generate_signal_multi_timeframe(), но по заранее загруженным
+		свечам mtf_frames ({таймфрейм: DataFrame с индексом open_time}) без запросов к API.
+		На момент current_time видны только свечи, закрытые к нему.
+		Индикаторы каждого таймфрейма считаются один раз — при первом вызове с этими mtf_frames.
+		"""
+		if self._mtf_frames is not mtf_frames:
+			self._mtf_batches = {}
+			for tf, frame in mtf_frames.items():
+				sg = SignalGenerator(frame, self.use_statistical_models)
+				sg.compute_indicators_batch()
+				self._mtf_batches[tf] = (sg, sg.df.index + pd.Timedelta(tf))
+			self._mtf_frames = mtf_frames
+		
+		mtf_analyzer = MultiTimeframeAnalyzer(lambda df=None: SignalGenerator(df if df is not None else self.df, self.use_statistical_models))
+		return mtf_analyzer.generate_signal_multi_timeframe_offline(self._mtf_batches, current_time, strategy)
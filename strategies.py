@@ -29,6 +29,12 @@ from config import (
 	VOTE_THRESHOLD_TRANSITIONING, VOTE_THRESHOLD_TRENDING, VOTE_THRESHOLD_RANGING
 )
 
+# Колонки, которые читает MeanReversionStrategy
+_MR_COLUMNS = (
+	"open", "low", "close", "volume", "EMA_12", "EMA_26", "EMA_200", "RSI",
+	f"ADX_{ADX_WINDOW}", f"ATR_{ATR_WINDOW}", "Stoch_K",
+)
+
 class MeanReversionStrategy:
 	"""
 	🔄 MEAN REVERSION STRATEGY
@@ -42,6 +48,7 @@ class MeanReversionStrategy:
 		if "close" not in self.df.columns:
 			raise ValueError("DataFrame must contain 'close' column")
 		self.df.sort_index(inplace=True)
+		self._batch = None  # Колонки и Z-score по всей истории (compute_batch)
 	
 	def generate_signal(self) -> Dict[str, Any]:
 		"""
@@ -53,27 +60,64 @@ class MeanReversionStrategy:
 		if self.df.empty:
 			raise ValueError("DataFrame is empty")
 		
-		last = self.df.iloc[-1]
-		price = float(last["close"])
+		return self._signal_at(self._signal_arrays(), len(self.df) - 1)
+	
+	def compute_batch(self) -> None:
+		"""
+		Подготовка к generate_signal_at(i): колонки self.df и скользящий Z-score
+		считаются один раз на всю историю, а не на каждом срезе df[:i+1].
+		"""
+		self._batch = self._signal_arrays()
+	
+	def generate_signal_at(self, i: int) -> Dict[str, Any]:
+		"""
+		Сигнал на свече i — то же, что generate_signal() на срезе df[:i+1]
+		(индикаторы self.df должны быть посчитаны без заглядывания вперёд,
+		см. IndicatorsCalculator.compute_indicators_batch).
+		"""
+		if self._batch is None:
+			self.compute_batch()
+		return self._signal_at(self._batch, i)
+	
+	def _signal_arrays(self) -> Dict[str, np.ndarray]:
+		"""Нужные стратегии колонки self.df как NumPy-массивы + Z-score цены"""
+		arrays = {
+			name: self.df[name].to_numpy(dtype=float)
+			for name in _MR_COLUMNS if name in self.df.columns
+		}
+		if len(self.df) >= MR_ZSCORE_WINDOW:
+			close_prices = self.df["close"].astype(float)
+			sma = close_prices.rolling(window=MR_ZSCORE_WINDOW).mean()
+			std = close_prices.rolling(window=MR_ZSCORE_WINDOW).std()
+			arrays["zscore"] = ((close_prices - sma) / std).to_numpy()
+		return arrays
+	
+	@staticmethod
+	def _value_at(arrays: Dict[str, np.ndarray], name: str, i: int, default: float) -> float:
+		"""Значение колонки на свече i (default, если колонки нет)"""
+		column = arrays.get(name)
+		return float(column[i] if column is not None else default)
+	
+	def _signal_at(self, arrays: Dict[str, np.ndarray], i: int) -> Dict[str, Any]:
+		"""Сигнал по истории до свечи i включительно"""
+		n = i + 1  # Длина истории
+		price = float(arrays["close"][i])
 		
 		# Индикаторы
-		ema_12 = float(last.get("EMA_12", 0))
-		ema_26 = float(last.get("EMA_26", 0))
-		rsi = float(last.get("RSI", 50))
-		adx = float(last.get(f"ADX_{ADX_WINDOW}", 0))
-		atr = float(last.get(f"ATR_{ATR_WINDOW}", 0))
-		stoch_k = float(last.get("Stoch_K", 0))
+		ema_12 = self._value_at(arrays, "EMA_12", i, 0)
+		ema_26 = self._value_at(arrays, "EMA_26", i, 0)
+		rsi = self._value_at(arrays, "RSI", i, 50)
+		adx = self._value_at(arrays, f"ADX_{ADX_WINDOW}", i, 0)
+		atr = self._value_at(arrays, f"ATR_{ATR_WINDOW}", i, 0)
+		stoch_k = self._value_at(arrays, "Stoch_K", i, 0)
 		
 		# ====================================================================
 		# РАСЧЁТ Z-SCORE (ИСПРАВЛЕНО)
 		# ====================================================================
 		
-		if len(self.df) >= MR_ZSCORE_WINDOW:
-			close_prices = self.df["close"].astype(float)
-			sma = close_prices.rolling(window=MR_ZSCORE_WINDOW).mean()
-			std = close_prices.rolling(window=MR_ZSCORE_WINDOW).std()
-			zscore_series = (close_prices - sma) / std
-			zscore = zscore_series.iloc[-1] if not pd.isna(zscore_series.iloc[-1]) else 0
+		zscores = arrays.get("zscore")
+		if n >= MR_ZSCORE_WINDOW and zscores is not None:
+			zscore = zscores[i] if not pd.isna(zscores[i]) else 0
 		else:
 			zscore = 0
 		
@@ -99,8 +143,8 @@ class MeanReversionStrategy:
 		falling_knife_detected = False
 		
 		# 1. Проверка: цена ниже минимума последних 24 часов на X%
-		if len(self.df) >= 24:
-			low_24h = self.df["low"].iloc[-24:].min()
+		if n >= 24:
+			low_24h = arrays["low"][n-24:n].min()
 			price_vs_24h_low = (price - low_24h) / low_24h if low_24h > 0 else 0
 			
 			if price_vs_24h_low < -NO_BUY_IF_PRICE_BELOW_N_DAY_LOW_PERCENT:
@@ -108,11 +152,11 @@ class MeanReversionStrategy:
 				reasons.append(f"🚫 ПАДАЮЩИЙ НОЖ: цена ${price:.2f} ниже min(24h)=${low_24h:.2f} на {abs(price_vs_24h_low)*100:.1f}% (>{NO_BUY_IF_PRICE_BELOW_N_DAY_LOW_PERCENT*100}%)")
 		
 		# 2. Проверка: отрицательный наклон EMA200
-		if NO_BUY_IF_EMA200_SLOPE_NEG and len(self.df) >= 200 + 24:
-			ema_200 = float(last.get("EMA_200", 0))
+		if NO_BUY_IF_EMA200_SLOPE_NEG and n >= 200 + 24:
+			ema_200 = self._value_at(arrays, "EMA_200", i, 0)
 			if ema_200 > 0:
 				# Берём EMA200 24 свечи назад
-				ema_200_24h_ago = float(self.df["EMA_200"].iloc[-24])
+				ema_200_24h_ago = float(arrays["EMA_200"][n-24])
 				if ema_200_24h_ago > 0:
 					ema200_slope = (ema_200 - ema_200_24h_ago) / ema_200_24h_ago
 					
@@ -121,16 +165,17 @@ class MeanReversionStrategy:
 						reasons.append(f"🚫 EMA200 ПАДАЕТ: slope={ema200_slope*100:.2f}% за 24h (< {EMA200_NEG_SLOPE_THRESHOLD*100:.1f}%)")
 		
 		# 3. Проверка: последовательность красных свечей (v5: ВКЛЮЧЕН ОБРАТНО)
-		if USE_RED_CANDLES_FILTER and len(self.df) >= 5:
+		if USE_RED_CANDLES_FILTER and n >= 5:
+			opens = arrays["open"]
+			closes = arrays["close"]
+			
 			# Берём последние 5 свечей
-			recent_candles = self.df.tail(5)
 			red_candles = 0
 			total_drop = 0.0
 			
-			for idx in range(len(recent_candles)):
-				candle = recent_candles.iloc[idx]
-				open_price = float(candle["open"])
-				close_price = float(candle["close"])
+			for idx in range(n - 5, n):
+				open_price = float(opens[idx])
+				close_price = float(closes[idx])
 				candle_change = (close_price - open_price) / open_price if open_price > 0 else 0
 				
 				if candle_change < 0:  # Красная свеча
@@ -143,13 +188,11 @@ class MeanReversionStrategy:
 				reasons.append(f"🚫 СЕРИЯ КРАСНЫХ СВЕЧЕЙ: {red_candles}/5 свечей, падение {total_drop*100:.1f}% (>3%)")
 			
 			# Или если последние 3 свечи все красные и падение > 2%
-			last_3_candles = self.df.tail(3)
 			last_3_red = 0
 			last_3_drop = 0.0
-			for idx in range(len(last_3_candles)):
-				candle = last_3_candles.iloc[idx]
-				open_price = float(candle["open"])
-				close_price = float(candle["close"])
+			for idx in range(n - 3, n):
+				open_price = float(opens[idx])
+				close_price = float(closes[idx])
 				candle_change = (close_price - open_price) / open_price if open_price > 0 else 0
 				if candle_change < 0:
 					last_3_red += 1
@@ -160,9 +203,9 @@ class MeanReversionStrategy:
 				reasons.append(f"🚫 3 КРАСНЫЕ СВЕЧИ ПОДРЯД: падение {last_3_drop*100:.1f}% (>2%)")
 		
 		# 4. v5: Проверка всплеска объёма (НОВОЕ)
-		if USE_VOLUME_FILTER and "volume" in self.df.columns and len(self.df) >= 24:
-			current_volume = float(self.df["volume"].iloc[-1])
-			avg_volume_24h = float(self.df["volume"].iloc[-24:].mean())
+		if USE_VOLUME_FILTER and "volume" in arrays and n >= 24:
+			current_volume = float(arrays["volume"][i])
+			avg_volume_24h = float(arrays["volume"][n-24:n].mean())
 			
 			if avg_volume_24h > 0:
 				volume_ratio = current_volume / avg_volume_24h
@@ -347,8 +390,19 @@ class HybridStrategy:
 		if "close" not in self.df.columns:
 			raise ValueError("DataFrame must contain 'close' column")
 		self.df.sort_index(inplace=True)
+		self._batch = None
 	
-	def generate_signal(self, last_mode: str = None, last_mode_time: float = 0) -> Dict[str, Any]:
+	def compute_batch(self) -> None:
+		"""
+		Подготовка к generate_signal(..., i): цена и ADX берутся из NumPy-массивов,
+		без сборки строки self.df.iloc[i] на каждой свече.
+		"""
+		adx_column = f"ADX_{ADX_WINDOW}"
+		closes = self.df["close"].to_numpy(dtype=float)
+		adxs = self.df[adx_column].to_numpy(dtype=float) if adx_column in self.df.columns else None
+		self._batch = (closes, adxs)
+	
+	def generate_signal(self, last_mode: str = None, last_mode_time: float = 0, i: Optional[int] = None) -> Dict[str, Any]:
 		"""
 		🔀 ГИБРИДНАЯ СТРАТЕГИЯ (MR + TF с переключением по ADX)
 		
@@ -360,6 +414,8 @@ class HybridStrategy:
 		Параметры:
 		- last_mode: последний активный режим ("MR" или "TF")
 		- last_mode_time: время в последнем режиме (часы)
+		- i: номер свечи для бэктеста (по умолчанию последняя); индикаторы self.df
+		  тогда должны быть посчитаны без заглядывания вперёд (compute_indicators_batch)
 		
 		Возвращает сигнал с указанием активного режима.
 		"""
@@ -380,13 +436,21 @@ class HybridStrategy:
 		
 		reasons = []
 		
-		# Получаем ADX и цену из последней строки DataFrame
-		last = self.df.iloc[-1]
-		price = float(last["close"])
-		adx = float(last.get(f"ADX_{ADX_WINDOW}", 0))
+		# Получаем ADX и цену из последней строки DataFrame (или из свечи i)
+		if i is None:
+			last = self.df.iloc[-1]
+			price = float(last["close"])
+			adx = float(last.get(f"ADX_{ADX_WINDOW}", 0))
+		else:
+			if self._batch is None:
+				self.compute_batch()
+			closes, adxs = self._batch
+			price = float(closes[i])
+			adx = float(adxs[i]) if adxs is not None else 0.0
 		
 		# Логирование для отладки данных
-		logger.info(f"📊 HYBRID DATA: len(df)={len(self.df)}, price={price:.2f}, adx={adx:.2f}, ADX_WINDOW={ADX_WINDOW}")
+		history_len = len(self.df) if i is None else i + 1
+		logger.info(f"📊 HYBRID DATA: len(df)={history_len}, price={price:.2f}, adx={adx:.2f}, ADX_WINDOW={ADX_WINDOW}")
 		
 		if np.isnan(adx) or adx == 0 or price == 0:
 			return {
@@ -452,7 +516,10 @@ class HybridStrategy:
 		
 		# Генерируем сигнал в зависимости от режима
 		if current_mode == "MR":
-			signal_result = self.mean_reversion_strategy.generate_signal()
+			if i is None:
+				signal_result = self.mean_reversion_strategy.generate_signal()
+			else:
+				signal_result = self.mean_reversion_strategy.generate_signal_at(i)
 			
 			# Проверяем порог голосования для MR режима
 			bullish_votes = signal_result.get("bullish_votes", 0)
@@ -521,7 +588,7 @@ class HybridStrategy:
 			
 		
 		elif current_mode == "TF":
-			signal_result = self.trend_following_strategy.generate_signal()
+			signal_result = self._trend_following_signal(i)
 			
 			# Проверяем порог голосования для TF режима
 			bullish_votes = signal_result.get("bullish_votes", 0)
@@ -592,7 +659,7 @@ class HybridStrategy:
 		else:  # HOLD или TRANSITION
 			# Если переходная зона, генерируем сигнал и проверяем силу
 			logger.info(f"🔍 TRANSITION MODE: ADX={adx:.1f} в переходной зоне, генерируем TF сигнал")
-			signal_result = self.trend_following_strategy.generate_signal()
+			signal_result = self._trend_following_signal(i)
 			
 			# В TRANSITION режиме разрешаем BUY только при очень сильных сигналах
 			original_signal = signal_result.get("signal", "HOLD")
@@ -630,3 +697,9 @@ class HybridStrategy:
 			signal_result["reasons"] = reasons + signal_result.get("reasons", [])
 		
 		return signal_result
+	
+	def _trend_following_signal(self, i: Optional[int]) -> Dict[str, Any]:
+		"""Сигнал трендовой стратегии на последней свече или на свече i"""
+		if i is None:
+			return self.trend_following_strategy.generate_signal()
+		return self.trend_following_strategy.generate_signal_at(i, strict=False)